@@ -0,0 +1,204 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Disk cache of the ``/image_proxy`` responses.
+
+The cache is disabled by default, it is enabled by the ``image_cache.path``
+setting (see :ref:`image_proxy`).
+
+- The key of an image is the HMAC of its URL (the ``h`` argument of
+  ``/image_proxy``): the file names don't reveal the URLs.
+- The cache respects the ``Cache-Control`` header of the upstream server: the
+  responses with ``no-store``, ``no-cache`` or ``private`` are not cached, a
+  response is cached for ``max-age`` seconds (at most ``image_cache.ttl``
+  seconds).
+- The cached files are sent with :py:obj:`flask.send_file` (``sendfile`` when
+  the WSGI server supports it), with an ``ETag`` which is the SHA-1 of the
+  content: the conditional requests are answered with ``304 Not Modified``.
+- When the size of the cache is above ``image_cache.maxsize`` bytes, the least
+  recently used images are removed.  The workers share the cache directory; the
+  size is computed again by each eviction.
+
+A cached image is a file ``<path>/<key[:2]>/<key>`` and its metadata
+``<path>/<key[:2]>/<key>.json``.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional
+
+from searx import get_setting, logger
+
+logger = logger.getChild('image_cache')
+
+KEY_RE = re.compile(r'^[0-9a-f]{16,128}$')
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+NOT_CACHEABLE = ('no-store', 'no-cache', 'private')
+EVICTION_RATIO = 0.9
+"""The eviction removes images until the size of the cache is below this ratio
+of ``maxsize``."""
+
+IMAGE_CACHE: Optional['ImageCache'] = None
+
+
+class CachedImage(NamedTuple):
+    """An image of the cache."""
+
+    path: str
+    content_type: str
+    content_encoding: Optional[str]
+    etag: str
+    expire_time: float
+
+
+class ImageCache:
+    """Disk cache of the images."""
+
+    __slots__ = 'path', 'maxsize', 'ttl', '_size', '_lock'
+
+    def __init__(self, path: str, maxsize: int, ttl: int):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(stat.st_size for _, stat in self._iter_images())
+
+    def _iter_images(self) -> Iterator[tuple]:
+        # yield (path, stat) of the cached images (not the metadata), the
+        # size of the metadata is not counted
+        for directory, _, file_names in os.walk(self.path):
+            for file_name in file_names:
+                if file_name.endswith('.json'):
+                    continue
+                file_path = os.path.join(directory, file_name)
+                try:
+                    yield file_path, os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        """Returns the image ``key`` or ``None`` if it is not cached or
+        expired."""
+        if not KEY_RE.match(key):
+            return None
+        path = self._get_path(key)
+        try:
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            # least recently used: the modification time is the last use
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if metadata['expire_time'] <= time.time():
+            return None
+        return CachedImage(
+            path, metadata['content_type'], metadata.get('content_encoding'), metadata['etag'], metadata['expire_time']
+        )
+
+    def get_ttl(self, headers: Dict[str, str]) -> int:
+        """Returns the number of seconds to cache a response with the
+        ``headers``, ``0`` if the response must not be cached."""
+        cache_control = headers.get('Cache-Control', '').lower()
+        if any(directive in cache_control for directive in NOT_CACHEABLE):
+            return 0
+        match = MAX_AGE_RE.search(cache_control)
+        if match:
+            return min(int(match.group(1)), self.ttl)
+        return self.ttl
+
+    def store(
+        self, key: str, chunks: Iterable[bytes], headers: Dict[str, str], ttl: int, maximum_size: int
+    ) -> Iterator[bytes]:
+        """Yield the ``chunks`` and store them in the cache once they are all
+        read (the image is not stored if the stream is not complete or if its
+        size is above ``maximum_size``)."""
+        if not KEY_RE.match(key):
+            yield from chunks
+            return
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        digest = hashlib.sha1()
+        size = 0
+        complete = False
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size <= maximum_size:
+                        f.write(chunk)
+                        digest.update(chunk)
+                    yield chunk
+            complete = size <= maximum_size
+        finally:
+            if complete:
+                metadata = {
+                    'content_type': headers.get('Content-Type'),
+                    'content_encoding': headers.get('Content-Encoding'),
+                    'etag': digest.hexdigest(),
+                    'expire_time': time.time() + ttl,
+                }
+                self._commit(path, tmp_path, metadata, size)
+            else:
+                os.unlink(tmp_path)
+
+    def _commit(self, path: str, tmp_path: str, metadata: Dict, size: int):
+        try:
+            os.replace(tmp_path, path)
+            file_descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+            with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+            os.replace(tmp_path, path + '.json')
+        except OSError as e:
+            logger.warning('can\'t store %s: %s', path, e)
+            return
+        with self._lock:
+            self._size += size
+            evict = self._size > self.maxsize
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used images until the size of the cache is
+        below ``EVICTION_RATIO`` × ``maxsize``."""
+        with self._lock:
+            images = [(stat.st_mtime, file_path, stat.st_size) for file_path, stat in self._iter_images()]
+            size = sum(image_size for _, _, image_size in images)
+            images.sort()
+            for _, image_path, image_size in images:
+                if size <= self.maxsize * EVICTION_RATIO:
+                    break
+                if os.path.basename(image_path).startswith('.tmp'):
+                    # the image is being written
+                    continue
+                try:
+                    os.unlink(image_path)
+                    size -= image_size
+                except FileNotFoundError:
+                    pass
+                try:
+                    os.unlink(image_path + '.json')
+                except FileNotFoundError:
+                    pass
+            self._size = size
+
+
+def initialize():
+    """Create the :py:obj:`IMAGE_CACHE` from the ``image_cache`` settings."""
+    global IMAGE_CACHE  # pylint: disable=global-statement
+    IMAGE_CACHE = None
+    path = get_setting('server.image_cache.path')
+    if not path:
+        return
+    try:
+        IMAGE_CACHE = ImageCache(path, get_setting('server.image_cache.maxsize'), get_setting('server.image_cache.ttl'))
+    except OSError as e:
+        logger.error('image cache disabled, %s: %s', path, e)
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Thumbnails of the ``/image_proxy`` images.
+
+The result templates show the images in boxes of 200×200 pixels, the upstream
+images are often much larger.  When ``image_thumbnail.enable`` is set (see
+:ref:`image_proxy`), the URLs of the result images have a ``size`` argument:
+``/image_proxy`` downscales the image to fit in a box of ``size``×``size``
+pixels and encodes it in ``image_thumbnail.format`` (``webp`` or ``jpeg``)
+with the ``image_thumbnail.quality``.
+
+- Only the sizes of ``image_thumbnail.sizes`` are accepted: the number of
+  variants of an image is bounded.
+- The thumbnails are stored in the :py:obj:`searx.image_cache` (if enabled):
+  the key of a thumbnail is derived from the key of the image, the size, the
+  format and the quality.
+- The original image is sent if it can't be decoded, if it is encoded (the
+  ``Content-Encoding`` of the upstream response), or if the thumbnail is not
+  smaller.
+
+The thumbnails require Pillow_, without Pillow the feature is disabled.
+
+.. _Pillow: https://python-pillow.org/
+"""
+
+import hashlib
+import io
+from typing import Optional, Tuple
+
+from searx import get_setting, logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logger.getChild('image_thumbnail')
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+_ENABLED = False
+
+
+def initialize():
+    """Enable the thumbnails if the ``image_thumbnail.enable`` setting is set
+    and Pillow is installed."""
+    global _ENABLED  # pylint: disable=global-statement
+    _ENABLED = bool(get_setting('server.image_thumbnail.enable'))
+    if _ENABLED and Image is None:
+        logger.error('image_thumbnail.enable is set but Pillow is not installed: no thumbnails')
+        _ENABLED = False
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+def get_size(size: Optional[str]) -> Optional[int]:
+    """Returns the size of the requested thumbnail (the ``size`` argument of
+    ``/image_proxy``) or ``None`` if the original image is requested or if the
+    size is not allowed."""
+    if not _ENABLED or not size:
+        return None
+    try:
+        size = int(size)
+    except ValueError:
+        return None
+    if size not in get_setting('server.image_thumbnail.sizes'):
+        return None
+    return size
+
+
+def get_key(key: str, size: int) -> str:
+    """Returns the key of the thumbnail of the image ``key`` in the
+    :py:obj:`searx.image_cache`."""
+    variant = '{}:{}:{}:{}'.format(
+        key, size, get_setting('server.image_thumbnail.format'), get_setting('server.image_thumbnail.quality')
+    )
+    return hashlib.sha256(variant.encode()).hexdigest()
+
+
+def make_thumbnail(
+    data: bytes, size: int, image_format: str = 'webp', quality: int = 75
+) -> Optional[Tuple[bytes, str]]:
+    """Returns the thumbnail of the image ``data`` and its content type, or
+    ``None`` if the image can't be decoded or if the thumbnail is not smaller
+    than ``data``."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG: decode the image at a lower resolution (faster)
+            image.draft('RGB', (size, size))
+            image.thumbnail((size, size))
+            if image_format == 'jpeg':
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            output = io.BytesIO()
+            image.save(output, format=image_format.upper(), quality=quality)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        logger.debug('thumbnail: %s', e)
+        return None
+    thumbnail = output.getvalue()
+    if len(thumbnail) >= len(data):
+        return None
+    return thumbnail, CONTENT_TYPES[image_format]
@@ -5,12 +5,19 @@
 import typing
 import math
 import contextlib
+import concurrent.futures
 from timeit import default_timer
 from operator import itemgetter
 
+from searx import get_setting, logger
 from searx.engines import engines
-from .models import HistogramStorage, CounterStorage, VoidHistogram, VoidCounterStorage
-from .error_recorder import count_error, count_exception, errors_per_engines
+from searx.network import get_network_health, get_network_stats
+from .models import WINDOWS, HistogramStorage, CounterStorage, LogBuckets, VoidHistogram, VoidCounterStorage
+from .error_recorder import count_error, count_exception, errors_per_engines, get_errors
+from .openmetrics import to_openmetrics
+from .shared import SharedCounterStorage, SharedHistogramStorage, get_shared_values
+
+logger = logger.getChild('metrics')
 
 __all__ = [
     "initialize",
@@ -24,6 +31,9 @@ __all__ = [
     "counter_add",
     "count_error",
     "count_exception",
+    "get_network_health",
+    "get_openmetrics",
+    "WINDOWS",
 ]
 
 
@@ -65,8 +75,8 @@ def counter_add(value, *args):
     counter_storage.add(value, *args)
 
 
-def counter(*args):
-    return counter_storage.get(*args)
+def counter(*args, window=None):
+    return counter_storage.get(*args, window=window)
 
 
 def initialize(engine_names=None, enabled=True):
@@ -75,9 +85,19 @@ def initialize(engine_names=None, enabled=True):
     """
     global counter_storage, histogram_storage  # pylint: disable=global-statement
 
+    # metrics shared by the workers (see searx.metrics.shared)
+    shared_values = None
     if enabled:
-        counter_storage = CounterStorage()
-        histogram_storage = HistogramStorage()
+        shared_values = get_shared_values(
+            get_setting('general.metrics_backend'), get_setting('general.metrics_mmap_path')
+        )
+    # the sliding windows are recorded alongside the values since the start
+    if shared_values:
+        counter_storage = SharedCounterStorage(shared_values, windows=WINDOWS)
+        histogram_storage = SharedHistogramStorage(shared_values, windows=WINDOWS)
+    elif enabled:
+        counter_storage = CounterStorage(windows=WINDOWS)
+        histogram_storage = HistogramStorage(windows=WINDOWS)
     else:
         counter_storage = VoidCounterStorage()
         histogram_storage = HistogramStorage(histogram_class=VoidHistogram)
@@ -88,9 +108,24 @@ def initialize(engine_names=None, enabled=True):
         if engine_name in engines:
             max_timeout = max(max_timeout, engines[engine_name].timeout)
 
-    # histogram configuration
-    histogram_width = 0.1
-    histogram_size = int(1.5 * max_timeout / histogram_width)
+    # buckets of the time histograms: from 1ms to 1.5 * max_timeout, relative error of 2%
+    time_buckets = LogBuckets(highest=1.5 * max_timeout)
+
+    # worker pool of the search requests (searx.search.executor)
+    counter_storage.configure('search', 'pool', 'saturated')
+    # searches answered by an identical search (searx.search.singleflight)
+    counter_storage.configure('search', 'single_flight', 'shared')
+    # prefetch of the next page (searx.search.prefetch)
+    counter_storage.configure('search', 'prefetch', 'sent')
+    counter_storage.configure('search', 'prefetch', 'successful')
+    counter_storage.configure('search', 'prefetch', 'error')
+    counter_storage.configure('search', 'prefetch', 'hit')
+    histogram_storage.configure(1, 100, 'search', 'pool', 'queue')
+
+    # endpoints (see searx.webapp.post_request)
+    for endpoint in ENDPOINTS:
+        histogram_storage.configure_buckets(time_buckets, 'endpoint', endpoint, 'time', 'total')
+        histogram_storage.configure_buckets(time_buckets, 'endpoint', endpoint, 'time', 'render')
 
     # engines
     for engine_name in engine_names or engines:
@@ -99,18 +134,43 @@ def initialize(engine_names=None, enabled=True):
         counter_storage.configure('engine', engine_name, 'search', 'count', 'successful')
         # global counter of errors
         counter_storage.configure('engine', engine_name, 'search', 'count', 'error')
+        # responses received after the search has returned (quorum)
+        counter_storage.configure('engine', engine_name, 'search', 'count', 'dropped')
         # score of the engine
         counter_storage.configure('engine', engine_name, 'score')
         # result count per requests
         histogram_storage.configure(1, 100, 'engine', engine_name, 'result', 'count')
         # time doing HTTP requests
-        histogram_storage.configure(histogram_width, histogram_size, 'engine', engine_name, 'time', 'http')
+        histogram_storage.configure_buckets(time_buckets, 'engine', engine_name, 'time', 'http')
         # total time
         # .time.request and ...response times may overlap .time.http time.
-        histogram_storage.configure(histogram_width, histogram_size, 'engine', engine_name, 'time', 'total')
+        histogram_storage.configure_buckets(time_buckets, 'engine', engine_name, 'time', 'total')
+
+    # the layout of the shared values is known
+    if shared_values:
+        shared_values.open()
 
 
-def get_engine_errors(engline_name_list):
+def get_openmetrics() -> str:
+    """Returns the counters, the histograms and the statistics of the networks
+    in the OpenMetrics text format (see :py:obj:`searx.metrics.openmetrics`).
+
+    If the network loop doesn't answer in time, the statistics of the networks
+    are missing: the counters and the histograms are still exported."""
+    assert counter_storage is not None
+    assert histogram_storage is not None
+    try:
+        network_stats = get_network_stats()
+        network_health = get_network_health()
+    except concurrent.futures.TimeoutError:
+        logger.warning('timeout of the network statistics, the networks are not exported')
+        network_stats = network_health = None
+    return to_openmetrics(counter_storage, histogram_storage, network_stats, network_health)
+
+
+def get_engine_errors(engline_name_list, window=None):
+    """Returns the errors of the engines, with ``window`` (a name of
+    :py:obj:`WINDOWS`) the errors of this sliding window."""
     result = {}
     engine_names = list(errors_per_engines.keys())
     engine_names.sort()
@@ -118,8 +178,13 @@ def get_engine_errors(engline_name_list):
         if engine_name not in engline_name_list:
             continue
 
-        error_stats = errors_per_engines[engine_name]
-        sent_search_count = max(counter('engine', engine_name, 'search', 'count', 'sent'), 1)
+        error_stats = get_errors(engine_name, window)
+        # the errors are recorded by each worker
+        if window is None:
+            sent_search_count = counter_storage.get_local('engine', engine_name, 'search', 'count', 'sent')
+        else:
+            sent_search_count = counter_storage.get('engine', engine_name, 'search', 'count', 'sent', window=window)
+        sent_search_count = max(sent_search_count, 1)
         sorted_context_count_list = sorted(error_stats.items(), key=lambda context_count: context_count[1])
         r = []
         for context, count in sorted_context_count_list:
@@ -141,16 +206,16 @@ def get_engine_errors(engline_name_list):
     return result
 
 
-def get_reliabilities(engline_name_list, checker_results):
+def get_reliabilities(engline_name_list, checker_results, window=None):
     reliabilities = {}
 
-    engine_errors = get_engine_errors(engline_name_list)
+    engine_errors = get_engine_errors(engline_name_list, window)
 
     for engine_name in engline_name_list:
         checker_result = checker_results.get(engine_name, {})
         checker_success = checker_result.get('success', True)
         errors = engine_errors.get(engine_name) or []
-        if counter('engine', engine_name, 'search', 'count', 'sent') == 0:
+        if counter('engine', engine_name, 'search', 'count', 'sent', window=window) == 0:
             # no request
             reliablity = None
         elif checker_success and not errors:
@@ -171,7 +236,9 @@ def get_reliabilities(engline_name_list, checker_results):
     return reliabilities
 
 
-def get_engines_stats(engine_name_list):
+def get_engines_stats(engine_name_list, window=None):  # pylint: disable=too-many-locals
+    """Returns the statistics of the engines, with ``window`` (a name of
+    :py:obj:`WINDOWS`) the statistics of this sliding window."""
     assert counter_storage is not None
     assert histogram_storage is not None
 
@@ -180,15 +247,20 @@ def get_engines_stats(engine_name_list):
 
     for engine_name in engine_name_list:
 
-        sent_count = counter('engine', engine_name, 'search', 'count', 'sent')
+        sent_count = counter('engine', engine_name, 'search', 'count', 'sent', window=window)
         if sent_count == 0:
             continue
 
-        result_count = histogram('engine', engine_name, 'result', 'count').percentage(50)
-        result_count_sum = histogram('engine', engine_name, 'result', 'count').sum
-        successful_count = counter('engine', engine_name, 'search', 'count', 'successful')
+        # one snapshot per histogram: the percentiles don't read the buckets again
+        result_count_snapshot = histogram('engine', engine_name, 'result', 'count').snapshot(window)
+        time_total_snapshot = histogram('engine', engine_name, 'time', 'total').snapshot(window)
+        time_http_snapshot = histogram('engine', engine_name, 'time', 'http').snapshot(window)
+
+        result_count = result_count_snapshot.percentage(50)
+        result_count_sum = result_count_snapshot.sum
+        successful_count = counter('engine', engine_name, 'search', 'count', 'successful', window=window)
 
-        time_total = histogram('engine', engine_name, 'time', 'total').percentage(50)
+        time_total = time_total_snapshot.percentage(50)
         max_time_total = max(time_total or 0, max_time_total or 0)
         max_result_count = max(result_count or 0, max_result_count or 0)
 
@@ -209,18 +281,18 @@ def get_engines_stats(engine_name_list):
         }
 
         if successful_count and result_count_sum:
-            score = counter('engine', engine_name, 'score')
+            score = counter('engine', engine_name, 'score', window=window)
 
             stats['score'] = score
             stats['score_per_result'] = score / float(result_count_sum)
 
-        time_http = histogram('engine', engine_name, 'time', 'http').percentage(50)
+        time_http = time_http_snapshot.percentage(50)
         time_http_p80 = time_http_p95 = 0
 
         if time_http is not None:
 
-            time_http_p80 = histogram('engine', engine_name, 'time', 'http').percentage(80)
-            time_http_p95 = histogram('engine', engine_name, 'time', 'http').percentage(95)
+            time_http_p80 = time_http_snapshot.percentage(80)
+            time_http_p95 = time_http_snapshot.percentage(95)
 
             stats['http'] = round(time_http, 1)
             stats['http_p80'] = round(time_http_p80, 1)
@@ -228,8 +300,8 @@ def get_engines_stats(engine_name_list):
 
         if time_total is not None:
 
-            time_total_p80 = histogram('engine', engine_name, 'time', 'total').percentage(80)
-            time_total_p95 = histogram('engine', engine_name, 'time', 'total').percentage(95)
+            time_total_p80 = time_total_snapshot.percentage(80)
+            time_total_p95 = time_total_snapshot.percentage(95)
 
             stats['total'] = round(time_total, 1)
             stats['total_p80'] = round(time_total_p80, 1)
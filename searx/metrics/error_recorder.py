@@ -11,9 +11,12 @@ from searx.exceptions import (
 )
 from searx import searx_parent_dir, settings
 from searx.engines import engines
+from .models import WINDOWS, get_windows
 
 
 errors_per_engines = {}
+# sliding windows of errors_per_engines: engine name -> error context -> window name -> SlidingWindow
+error_windows_per_engines = {}
 
 
 class ErrorContext:
@@ -82,9 +85,28 @@ class ErrorContext:
 def add_error_context(engine_name: str, error_context: ErrorContext) -> None:
     errors_for_engine = errors_per_engines.setdefault(engine_name, {})
     errors_for_engine[error_context] = errors_for_engine.get(error_context, 0) + 1
+    windows_for_engine = error_windows_per_engines.setdefault(engine_name, {})
+    windows = windows_for_engine.get(error_context)
+    if windows is None:
+        windows = windows_for_engine[error_context] = get_windows(WINDOWS, int)
+    for window in windows.values():
+        window.values[window.get_slot()] += 1
     engines[engine_name].logger.warning('%s', str(error_context))
 
 
+def get_errors(engine_name: str, window: typing.Optional[str] = None) -> typing.Dict[ErrorContext, int]:
+    """Returns the count of each error of the engine, with ``window`` the errors
+    of this sliding window (see :py:obj:`searx.metrics.models.WINDOWS`)."""
+    if window is None:
+        return dict(errors_per_engines.get(engine_name, {}))
+    result = {}
+    for error_context, windows in list(error_windows_per_engines.get(engine_name, {}).items()):
+        count = sum(windows[window].get_values())
+        if count:
+            result[error_context] = count
+    return result
+
+
 def get_trace(traces):
     for trace in reversed(traces):
         split_filename = trace.filename.split('/')
@@ -1,40 +1,255 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
+import bisect
 import decimal
+import itertools
+import math
 import threading
+from timeit import default_timer
 
 from searx import logger
 
 
-__all__ = ["Histogram", "HistogramStorage", "CounterStorage"]
+__all__ = [
+    "Histogram",
+    "HistogramSnapshot",
+    "HistogramStorage",
+    "CounterStorage",
+    "LinearBuckets",
+    "LogBuckets",
+    "SlidingWindow",
+    "WINDOWS",
+]
 
 logger = logger.getChild('searx.metrics')
 
+WINDOWS = {'1m': 60, '15m': 900, '1h': 3600}
+"""Durations in seconds of the sliding windows, recorded alongside the metrics
+since the start."""
+
+WINDOW_SLOTS = 6
+"""Number of slots of a sliding window: the window slides by a sixth of its
+duration."""
+
+
+class SlidingWindow:
+    """Ring buffer of the values recorded during the last ``duration`` seconds.
+    The window is divided in ``slots``: a slot is reset (``factory()``) when it
+    is reused, the values of the slots older than ``duration`` are ignored.
+    The caller holds the lock of the metric."""
+
+    __slots__ = 'duration', 'slot_duration', 'values', '_numbers', '_factory'
+
+    def __init__(self, duration, factory, slots=WINDOW_SLOTS):
+        self.duration = duration
+        self.slot_duration = duration / slots
+        self.values = [factory() for _ in range(slots)]
+        self._numbers = [-slots] * slots
+        self._factory = factory
+
+    def get_slot(self, now=None):
+        """Returns the index of the current slot in :py:obj:`values`."""
+        number = int((default_timer() if now is None else now) / self.slot_duration)
+        index = number % len(self.values)
+        if self._numbers[index] != number:
+            self._numbers[index] = number
+            self.values[index] = self._factory()
+        return index
+
+    def get_values(self, now=None):
+        """Returns the values of the slots of the window."""
+        number = int((default_timer() if now is None else now) / self.slot_duration)
+        oldest = number - len(self.values)
+        return [value for value, slot_number in zip(self.values, self._numbers) if oldest < slot_number <= number]
+
+
+def get_windows(windows, factory):
+    return {name: SlidingWindow(duration, factory) for name, duration in (windows or {}).items()}
+
+
+def new_histogram_slot():
+    # counts by bucket index, sum
+    return [{}, 0]
+
+
+class LinearBuckets:
+    """Buckets of the same ``width``: the bucket ``i`` counts the values from
+    ``i * width`` to ``(i + 1) * width``."""
+
+    __slots__ = 'width', 'size'
+
+    def __init__(self, width, size):
+        self.width = width
+        self.size = size
+
+    def get_index(self, value):
+        q = int(value / self.width)
+        if q < 0:
+            # Value below zero is ignored
+            q = 0
+        if q >= self.size:
+            # Value above the maximum is replaced by the maximum
+            q = self.size - 1
+        return q
+
+    def get_value(self, index):
+        """Lower bound of the bucket ``index``."""
+        # use Decimal to avoid rounding errors
+        return decimal.Decimal(self.width) * index
+
+    @property
+    def bounds(self):
+        """Upper bounds of the buckets."""
+        return [(i + 1) * self.width for i in range(self.size - 1)] + [math.inf]
+
+    def __eq__(self, other):
+        return isinstance(other, LinearBuckets) and (self.width, self.size) == (other.width, other.size)
+
+    def __repr__(self):
+        return "LinearBuckets<width: " + str(self.width) + ", size: " + str(self.size) + ">"
+
+
+class LogBuckets:
+    """Buckets growing exponentially (HDR histogram): the relative error of the
+    value of a bucket is at most ``relative_error``.  The first bucket counts the
+    values below ``lowest``, the last bucket the values above ``highest``.
+
+    The bucket ``i`` counts the values from ``lowest * growth ** (i - 1)`` to
+    ``lowest * growth ** i`` where ``growth = (1 + relative_error) / (1 -
+    relative_error)``: with the default values, 1ms to 60s is covered by 270
+    buckets."""
+
+    __slots__ = 'lowest', 'highest', 'relative_error', 'size', '_log_growth'
+
+    def __init__(self, lowest=0.001, highest=60, relative_error=0.02):
+        self.lowest = lowest
+        self.highest = highest
+        self.relative_error = relative_error
+        self._log_growth = math.log((1 + relative_error) / (1 - relative_error))
+        self.size = math.ceil(math.log(highest / lowest) / self._log_growth) + 2
+
+    def get_index(self, value):
+        if value < self.lowest:
+            return 0
+        return min(int(math.log(value / self.lowest) / self._log_growth) + 1, self.size - 1)
+
+    def get_lower_bound(self, index):
+        if index == 0:
+            return 0.0
+        return self.lowest * math.exp((index - 1) * self._log_growth)
+
+    def get_value(self, index):
+        """Value of the bucket ``index``: the relative error with the values of
+        the bucket is at most ``relative_error``."""
+        if index == 0:
+            return self.lowest
+        return self.get_lower_bound(index) / (1 - self.relative_error)
+
+    @property
+    def bounds(self):
+        """Upper bounds of the buckets."""
+        return [self.get_lower_bound(i + 1) for i in range(self.size - 1)] + [math.inf]
+
+    def __eq__(self, other):
+        return isinstance(other, LogBuckets) and (self.lowest, self.highest, self.relative_error) == (
+            other.lowest,
+            other.highest,
+            other.relative_error,
+        )
+
+    def __repr__(self):
+        return "LogBuckets<lowest: {}, highest: {}, relative_error: {}, size: {}>".format(
+            self.lowest, self.highest, self.relative_error, self.size
+        )
+
+
+class HistogramSnapshot:
+    """Counts of a :py:obj:`Histogram` at a point in time, with the cumulative
+    counts: a percentile is a binary search.  The snapshots of histograms with
+    the same buckets can be merged with ``+``."""
+
+    __slots__ = 'buckets', 'counts', 'sum', '_cumulative'
+
+    def __init__(self, buckets, counts, total):
+        self.buckets = buckets
+        self.counts = counts
+        self.sum = total
+        self._cumulative = list(itertools.accumulate(counts))
+
+    @property
+    def count(self):
+        return self._cumulative[-1] if self._cumulative else 0
+
+    def __add__(self, other):
+        if self.buckets != other.buckets:
+            raise ValueError("can't merge the histograms " + repr(self.buckets) + " and " + repr(other.buckets))
+        return HistogramSnapshot(self.buckets, [a + b for a, b in zip(self.counts, other.counts)], self.sum + other.sum)
+
+    def percentage(self, percentage):
+        """Returns the value of the bucket reached by ``percentage`` % of the
+        values, ``None`` if there is no value."""
+        count = self.count
+        if count == 0:
+            return None
+        index = bisect.bisect_left(self._cumulative, count * percentage / 100)
+        return self.buckets.get_value(min(index, len(self._cumulative) - 1))
+
+    def __repr__(self):
+        return "HistogramSnapshot<count: " + str(self.count) + ", sum: " + str(self.sum) + ">"
+
 
 class Histogram:
 
-    _slots__ = '_lock', '_size', '_sum', '_quartiles', '_count', '_width'
+    _slots__ = '_lock', '_buckets', '_sum', '_quartiles', '_count', '_snapshot', '_windows'
 
-    def __init__(self, width=10, size=200):
+    def __init__(self, width=10, size=200, buckets=None, windows=None):
         self._lock = threading.Lock()
-        self._width = width
-        self._size = size
-        self._quartiles = [0] * size
+        self._buckets = buckets or LinearBuckets(width, size)
+        self._quartiles = [0] * self._buckets.size
         self._count = 0
         self._sum = 0
+        self._snapshot = None
+        self._windows = get_windows(windows, new_histogram_slot)
 
     def observe(self, value):
-        q = int(value / self._width)
-        if q < 0:
-            """Value below zero is ignored"""
-            q = 0
-        if q >= self._size:
-            """Value above the maximum is replaced by the maximum"""
-            q = self._size - 1
+        q = self._buckets.get_index(value)
         with self._lock:
             self._quartiles[q] += 1
             self._count += 1
             self._sum += value
+            self._snapshot = None
+            self._observe_windows(q, value)
+
+    def _observe_windows(self, q, value):
+        for window in self._windows.values():
+            counts, _ = slot = window.values[window.get_slot()]
+            counts[q] = counts.get(q, 0) + 1
+            slot[1] += value
+
+    def snapshot(self, window=None):
+        """Returns a :py:obj:`HistogramSnapshot`, cached until the next
+        observed value.  With ``window`` (a name of :py:obj:`WINDOWS`), the
+        snapshot of the values observed during this window."""
+        if window is not None:
+            return self._get_window_snapshot(window)
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = HistogramSnapshot(self._buckets, list(self._quartiles), self._sum)
+            return self._snapshot
+
+    def _get_window_snapshot(self, window):
+        counts = [0] * self._buckets.size
+        total = 0
+        with self._lock:
+            for slot_counts, slot_sum in self._windows[window].get_values():
+                for q, count in slot_counts.items():
+                    counts[q] += count
+                total += slot_sum
+        return HistogramSnapshot(self._buckets, counts, total)
+
+    @property
+    def buckets(self):
+        return self._buckets
 
     @property
     def quartiles(self):
@@ -51,8 +266,9 @@ class Histogram:
     @property
     def average(self):
         with self._lock:
-            if self._count != 0:
-                return self._sum / self._count
+            count = self._count
+            if count != 0:
+                return self._sum / count
             else:
                 return 0
 
@@ -60,41 +276,26 @@ class Histogram:
     def quartile_percentage(self):
         '''Quartile in percentage'''
         with self._lock:
-            if self._count > 0:
-                return [int(q * 100 / self._count) for q in self._quartiles]
+            count = self._count
+            if count > 0:
+                return [int(q * 100 / count) for q in self._quartiles]
             else:
                 return self._quartiles
 
     @property
     def quartile_percentage_map(self):
         result = {}
-        # use Decimal to avoid rounding errors
-        x = decimal.Decimal(0)
-        width = decimal.Decimal(self._width)
-        width_exponent = -width.as_tuple().exponent
         with self._lock:
-            if self._count > 0:
-                for y in self._quartiles:
-                    yp = int(y * 100 / self._count)
+            count = self._count
+            if count > 0:
+                for i, y in enumerate(self._quartiles):
+                    yp = int(y * 100 / count)
                     if yp != 0:
-                        result[round(float(x), width_exponent)] = yp
-                    x += width
+                        result[round(float(self._buckets.get_value(i)), 6)] = yp
         return result
 
     def percentage(self, percentage):
-        # use Decimal to avoid rounding errors
-        x = decimal.Decimal(0)
-        width = decimal.Decimal(self._width)
-        stop_at_value = decimal.Decimal(self._count) / 100 * percentage
-        sum_value = 0
-        with self._lock:
-            if self._count > 0:
-                for y in self._quartiles:
-                    sum_value += y
-                    if sum_value >= stop_at_value:
-                        return x
-                    x += width
-        return None
+        return self.snapshot().percentage(percentage)
 
     def __repr__(self):
         return "Histogram<avg: " + str(self.average) + ", count: " + str(self._count) + ">"
@@ -102,17 +303,21 @@ class Histogram:
 
 class HistogramStorage:
 
-    __slots__ = 'measures', 'histogram_class'
+    __slots__ = 'measures', 'histogram_class', 'windows'
 
-    def __init__(self, histogram_class=Histogram):
+    def __init__(self, histogram_class=Histogram, windows=None):
         self.clear()
         self.histogram_class = histogram_class
+        self.windows = windows
 
     def clear(self):
         self.measures = {}
 
     def configure(self, width, size, *args):
-        measure = self.histogram_class(width, size)
+        return self.configure_buckets(LinearBuckets(width, size), *args)
+
+    def configure_buckets(self, buckets, *args):
+        measure = self.histogram_class(buckets=buckets, windows=self.windows)
         self.measures[args] = measure
         return measure
 
@@ -128,26 +333,47 @@ class HistogramStorage:
 
 class CounterStorage:
 
-    __slots__ = 'counters', 'lock'
+    __slots__ = 'counters', 'lock', 'windows', 'counter_windows'
 
-    def __init__(self):
+    def __init__(self, windows=None):
         self.lock = threading.Lock()
+        self.windows = windows
         self.clear()
 
     def clear(self):
         with self.lock:
             self.counters = {}
+            self.counter_windows = {}
 
     def configure(self, *args):
         with self.lock:
             self.counters[args] = 0
+            self.counter_windows[args] = get_windows(self.windows, int)
 
-    def get(self, *args):
+    def get(self, *args, window=None):
+        """Returns the value of the counter, with ``window`` (a name of
+        :py:obj:`WINDOWS`) the sum of the values added during this window."""
+        if window is not None:
+            return self.get_window(window, *args)
+        return self.counters[args]
+
+    def get_window(self, window, *args):
+        with self.lock:
+            return sum(self.counter_windows[args][window].get_values())
+
+    def _add_to_windows(self, value, args):
+        for window in self.counter_windows[args].values():
+            window.values[window.get_slot()] += value
+
+    def get_local(self, *args):
+        """Returns the value of the counter for this worker (see
+        :py:obj:`searx.metrics.shared`)."""
         return self.counters[args]
 
     def add(self, value, *args):
         with self.lock:
             self.counters[args] += value
+            self._add_to_windows(value, args)
 
     def dump(self):
         with self.lock:
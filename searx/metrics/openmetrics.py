@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Export of the metrics in the OpenMetrics_ text format (``/metrics``).
+
+The endpoint is disabled by default, it is enabled by the
+``general.metrics_token`` setting: the requests have to send the header
+``Authorization: Bearer <metrics_token>``.
+
+Each configured counter and histogram of :py:obj:`searx.metrics` is a metric
+family, the name is the key of the metric prefixed by ``searxng_``:
+
+- the name of the engine (``('engine', <name>, ...)``) or of the endpoint
+  (``('endpoint', <name>, ...)``) is a label, for example
+  ``searxng_engine_search_count_sent_total{engine="wikipedia"}``.
+- the time histograms are in seconds (suffix ``_seconds``).
+- the buckets of a histogram are the buckets of
+  :py:obj:`searx.metrics.models.Histogram` (linear or logarithmic), the last
+  bucket is ``+Inf`` (the values above the maximum are counted in the last
+  bucket).
+
+The statistics of the networks (:py:obj:`searx.network.get_network_stats`) and
+the health of their source addresses and proxies
+(:py:obj:`searx.network.get_network_health`) are exported too.
+
+.. _OpenMetrics: https://github.com/OpenObservability/OpenMetrics/blob/main/specification/OpenMetrics.md
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .models import CounterStorage, Histogram, HistogramStorage
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PREFIX = 'searxng_'
+LABEL_KEYS = ('engine', 'endpoint')
+"""The second element of the keys starting with these names is a label."""
+NETWORK_COUNTERS = ('created_clients', 'evicted_clients')
+"""The statistics of :py:obj:`searx.network.get_network_stats` which are
+counters (the others are gauges)."""
+
+NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+Labels = Dict[str, str]
+
+
+class MetricFamily:
+    """The samples of a metric family."""
+
+    __slots__ = 'name', 'metric_type', 'samples'
+
+    def __init__(self, name: str, metric_type: str):
+        self.name = name
+        self.metric_type = metric_type
+        self.samples: List[Tuple[str, Labels, float]] = []
+
+    def add(self, suffix: str, labels: Labels, value: float):
+        self.samples.append((self.name + suffix, labels, value))
+
+    def __iter__(self) -> Iterator[str]:
+        yield '# TYPE {} {}'.format(self.name, self.metric_type)
+        for name, labels, value in self.samples:
+            yield '{}{} {}'.format(name, format_labels(labels), format_value(value))
+
+
+class MetricFamilies(OrderedDict):
+    """The metric families by name."""
+
+    def get_family(self, name: str, metric_type: str) -> MetricFamily:
+        family = self.get(name)
+        if family is None:
+            family = self[name] = MetricFamily(name, metric_type)
+        return family
+
+    def __str__(self):
+        lines = [line for family in self.values() for line in family]
+        lines.append('# EOF\n')
+        return '\n'.join(lines)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, escape_label_value(str(v))) for k, v in labels.items()) + '}'
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def get_name_and_labels(key: Tuple[str, ...]) -> Tuple[str, Labels]:
+    """Returns the name of the metric family and the labels of the metric
+    ``key`` of :py:obj:`searx.metrics`."""
+    labels = {}
+    if key[0] in LABEL_KEYS and len(key) > 2:
+        labels[key[0]] = key[1]
+        key = (key[0],) + key[2:]
+    name = NAME_RE.sub('_', PREFIX + '_'.join(key))
+    if 'time' in key:
+        name += '_seconds'
+    return name, labels
+
+
+def add_counters(families: MetricFamilies, counter_storage: CounterStorage):
+    for key in sorted(counter_storage.counters):
+        name, labels = get_name_and_labels(key)
+        families.get_family(name, 'counter').add('_total', labels, counter_storage.get(*key))
+
+
+def add_histogram(family: MetricFamily, labels: Labels, histogram: Histogram):
+    # the count is the sum of the buckets of the snapshot
+    snapshot = histogram.snapshot()
+    cumulative = 0
+    for bound, bucket in zip(snapshot.buckets.bounds[:-1], snapshot.counts):
+        cumulative += bucket
+        family.add('_bucket', {**labels, 'le': repr(round(bound, 6))}, cumulative)
+    cumulative = snapshot.count
+    family.add('_bucket', {**labels, 'le': '+Inf'}, cumulative)
+    family.add('_count', labels, cumulative)
+    family.add('_sum', labels, snapshot.sum)
+
+
+def add_histograms(families: MetricFamilies, histogram_storage: HistogramStorage):
+    for key, histogram in sorted(histogram_storage.measures.items()):
+        name, labels = get_name_and_labels(key)
+        add_histogram(families.get_family(name, 'histogram'), labels, histogram)
+
+
+def hide_credentials(member: str) -> str:
+    """Remove the user name and the password of a proxy URL."""
+    url = urlsplit(member)
+    if url.username is None and url.password is None:
+        return member
+    return url._replace(netloc=url.netloc.rsplit('@', 1)[1]).geturl()
+
+
+def add_networks(families: MetricFamilies, network_stats: Dict, network_health: Dict):
+    for network_name, stats in network_stats.items():
+        for stat_name, value in stats.items():
+            name = PREFIX + 'network_' + stat_name
+            if stat_name in NETWORK_COUNTERS:
+                families.get_family(name, 'counter').add('_total', {'network': network_name}, value)
+            else:
+                families.get_family(name, 'gauge').add('', {'network': network_name}, value)
+
+    def add_members(network_name: str, kind: str, members: Dict, pattern: Optional[str] = None):
+        for member, health in members.items():
+            labels = {'network': network_name, 'kind': kind, 'member': hide_credentials(member)}
+            if pattern:
+                labels['pattern'] = pattern
+            for stat_name in ('weight', 'success_rate', 'latency', 'quarantined'):
+                if health[stat_name] is not None:
+                    family = families.get_family(PREFIX + 'network_member_' + stat_name, 'gauge')
+                    family.add('', labels, health[stat_name])
+            for stat_name in ('requests', 'errors', 'blocked'):
+                family = families.get_family(PREFIX + 'network_member_' + stat_name, 'counter')
+                family.add('_total', labels, health[stat_name])
+
+    for network_name, health in network_health.items():
+        add_members(network_name, 'source_ip', health['source_ips'])
+        for pattern, members in health['proxies'].items():
+            add_members(network_name, 'proxy', members, pattern)
+
+
+def to_openmetrics(
+    counter_storage: CounterStorage,
+    histogram_storage: HistogramStorage,
+    network_stats: Optional[Dict] = None,
+    network_health: Optional[Dict] = None,
+) -> str:
+    """Returns the metrics in the OpenMetrics text format."""
+    families = MetricFamilies()
+    add_counters(families, counter_storage)
+    add_histograms(families, histogram_storage)
+    add_networks(families, network_stats or {}, network_health or {})
+    return str(families)
@@ -0,0 +1,450 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Metrics shared by the worker processes.
+
+With several workers (uWSGI ``workers``), each worker records the metrics of
+the requests it serves: by default (``metrics_backend: memory``) ``/stats``
+shows the metrics of the worker answering the request.  The
+``general.metrics_backend`` setting stores the counters and the buckets of the
+histograms where all the workers can read them:
+
+``mmap``
+  A memory-mapped file (``general.metrics_mmap_path``) with one row of values
+  per worker (see :py:obj:`MmapValues`).  A worker only writes its own row: the
+  workers don't lock each other, the readers sum the rows.  The file is reset
+  when a worker starts and no other worker is alive (restart of the instance,
+  new configuration).  The path has to be different for each instance.
+
+``redis``
+  A hash in the :ref:`settings redis` database (see :py:obj:`RedisValues`),
+  each worker buffers its increments and adds them to the hash every
+  :py:obj:`FLUSH_INTERVAL` seconds with ``HINCRBYFLOAT`` (atomic).  The values
+  are kept across the restarts.  The name of the hash is
+  ``SearXNG_metrics|<digest>``, the digest of the layout of the values (the
+  counters, the histograms and their buckets): a new configuration doesn't mix
+  its values with the values of the previous one.  The hashes ``SearXNG_metrics|*``
+  can be deleted to reset the metrics.
+
+The sliding windows (:py:obj:`searx.metrics.models.WINDOWS`) are recorded by
+each worker: they show the recent metrics of the worker answering the request.
+The errors of :py:obj:`searx.metrics.error_recorder` are still recorded by each
+worker: :py:obj:`searx.metrics.get_engine_errors` compares them to the requests
+sent by the same worker (:py:obj:`SharedCounterStorage.get_local`).
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from timeit import default_timer
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from searx import logger, redisdb
+from .models import CounterStorage, Histogram, HistogramSnapshot, HistogramStorage, get_windows, new_histogram_slot
+
+logger = logger.getChild('metrics.shared')
+
+MAGIC = b'SXNGMTR1'
+HEADER = struct.Struct('8s32sqq')
+"""Header of the file: magic, digest of the layout, number of rows and number of
+values per row."""
+MAX_WORKERS = 64
+"""Number of rows of the file: the workers above this number record their
+metrics locally."""
+REDIS_KEY = 'SearXNG_metrics'
+FLUSH_INTERVAL = 1.0
+"""Number of seconds between two writes of the increments of a worker to the
+redis DB."""
+SNAPSHOT_TTL = 1.0
+"""Number of seconds a worker reuses the snapshot of a shared histogram (see
+:py:obj:`SharedHistogram.snapshot`)."""
+
+
+class SharedValues:
+    """Values shared by the workers, allocated by the storages before
+    :py:obj:`SharedValues.open`.  Until the values are opened (or if they can't
+    be), the values are local to the worker."""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.layouts: List[str] = []
+        self._lock = threading.Lock()
+        self._local: Optional[array] = None
+
+    def allocate(self, name: str, size: int, layout: str = '') -> int:
+        """Allocate ``size`` values, returns the index of the first one.
+        ``layout`` describes what the values are (the buckets of a histogram)."""
+        index = len(self.names)
+        self.names.extend('{}|{}'.format(name, i) for i in range(size))
+        if layout:
+            self.layouts.append('{}|{}'.format(name, layout))
+        return index
+
+    @property
+    def digest(self) -> bytes:
+        """Digest of the names and of the layouts of the values."""
+        return hashlib.sha256('\n'.join(self.names + self.layouts).encode()).digest()
+
+    def _get_local(self) -> array:
+        if self._local is None or len(self._local) != len(self.names):
+            self._local = array('d', bytes(8 * len(self.names)))
+        return self._local
+
+    def open(self) -> bool:
+        """Share the values, returns ``False`` if they can't be shared."""
+        raise NotImplementedError()
+
+    def add(self, *items: Tuple[int, float]):
+        """Add the ``(index, value)`` items."""
+        with self._lock:
+            local = self._get_local()
+            for index, value in items:
+                local[index] += value
+
+    def get_range(self, start: int, size: int) -> List[float]:
+        """Returns the sums (all the workers) of the ``size`` values from
+        ``start``."""
+        return self.get_local_range(start, size)
+
+    def get_local_range(self, start: int, size: int) -> List[float]:
+        """Returns the ``size`` values from ``start`` recorded by this
+        worker."""
+        return self._get_local()[start : start + size].tolist()
+
+
+class MmapValues(SharedValues):
+    """Values in a memory-mapped file: a header, the PID of the worker of each
+    row, then the rows."""
+
+    def __init__(self, path: str, max_workers: int = MAX_WORKERS):
+        super().__init__()
+        self.path = path
+        self.max_workers = max_workers
+        self._file_descriptor: Optional[int] = None
+        self._pids: Optional[memoryview] = None
+        self._rows: Optional[memoryview] = None
+        # row of this worker: None if not claimed yet (or no free row)
+        self._pid: Optional[int] = None
+        self._row: Optional[int] = None
+
+    def open(self) -> bool:
+        size = len(self.names)
+        header = HEADER.pack(MAGIC, self.digest, self.max_workers, size)
+        pids_size = 8 * self.max_workers
+        file_size = HEADER.size + pids_size + 8 * self.max_workers * size
+        try:
+            file_descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            logger.error('metrics are not shared, can\'t open %s: %s', self.path, e)
+            return False
+        try:
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            try:
+                file_header = os.pread(file_descriptor, HEADER.size, 0)
+                alive = any(is_alive(pid) for pid in read_pids(file_descriptor, file_header))
+                if alive and (file_header != header or os.fstat(file_descriptor).st_size != file_size):
+                    # the workers of another configuration are alive: resizing
+                    # the file would crash them
+                    raise OSError('the file is used by workers with another configuration')
+                if not alive:
+                    # restart of the instance: the file is reset in place
+                    os.ftruncate(file_descriptor, 0)
+                    os.ftruncate(file_descriptor, file_size)
+                    os.pwrite(file_descriptor, header, 0)
+                memory = mmap.mmap(file_descriptor, file_size)
+            finally:
+                fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+        except OSError as e:
+            logger.error('metrics are not shared, can\'t map %s: %s', self.path, e)
+            os.close(file_descriptor)
+            return False
+        view = memoryview(memory)
+        self._file_descriptor = file_descriptor
+        self._pids = view[HEADER.size : HEADER.size + pids_size].cast('q')
+        self._rows = view[HEADER.size + pids_size :].cast('d')
+        # the worker is alive: the other workers don't reset the file
+        with self._lock:
+            self._claim_row()
+        return True
+
+    def _claim_row(self) -> Optional[int]:
+        # called by open and by the first write of a worker forked after open
+        pid = os.getpid()
+        self._pid, self._row = pid, None
+        fcntl.flock(self._file_descriptor, fcntl.LOCK_EX)
+        try:
+            for row, row_pid in enumerate(self._pids):
+                if row_pid in (0, pid) or not is_alive(row_pid):
+                    # the values of a dead worker are kept
+                    self._pids[row] = pid
+                    self._row = row
+                    break
+            else:
+                logger.warning(
+                    'more than %i workers, the metrics of the worker %i are not shared', len(self._pids), pid
+                )
+        finally:
+            fcntl.flock(self._file_descriptor, fcntl.LOCK_UN)
+        return self._row
+
+    def add(self, *items: Tuple[int, float]):
+        if self._rows is None:
+            super().add(*items)
+            return
+        with self._lock:
+            row = self._row if self._pid == os.getpid() else self._claim_row()
+            if row is None:
+                local = self._get_local()
+                for index, value in items:
+                    local[index] += value
+                return
+            offset = row * len(self.names)
+            for index, value in items:
+                self._rows[offset + index] += value
+
+    def _iter_rows(self):
+        size = len(self.names)
+        for row, pid in enumerate(self._pids):
+            if pid:
+                yield row * size
+
+    def get_range(self, start: int, size: int) -> List[float]:
+        if self._rows is None:
+            return super().get_range(start, size)
+        result = [0.0] * size
+        for offset in self._iter_rows():
+            for i, value in enumerate(self._rows[offset + start : offset + start + size]):
+                result[i] += value
+        if self._pid == os.getpid() and self._row is None:
+            # the values of this worker are local
+            for i, value in enumerate(super().get_local_range(start, size)):
+                result[i] += value
+        return result
+
+    def get_local_range(self, start: int, size: int) -> List[float]:
+        if self._rows is None or self._pid != os.getpid() or self._row is None:
+            return super().get_local_range(start, size)
+        offset = self._row * len(self.names) + start
+        return self._rows[offset : offset + size].tolist()
+
+
+class RedisValues(SharedValues):
+    """Values in a hash of the redis DB (:py:obj:`REDIS_KEY` and the digest of
+    the layout), a field per value.  The increments are buffered by the worker
+    and written every ``flush_interval`` seconds by a thread of the worker.
+
+    The values are also recorded locally: they are read when the redis DB can't
+    be reached, and by :py:obj:`SharedCounterStorage.get_local`."""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.key = REDIS_KEY
+        self._client: Optional[redis.Redis] = None
+        # increments not written yet, and the PID of the worker which has
+        # recorded them (a forked worker doesn't write the increments of its parent)
+        self._pending: Dict[int, float] = {}
+        self._pid: Optional[int] = None
+
+    def open(self) -> bool:
+        self._client = redisdb.client()
+        if self._client is None:
+            logger.error('metrics are not shared, the redis DB is not configured')
+            return False
+        self.key = '{}|{}'.format(REDIS_KEY, self.digest.hex()[:16])
+        return True
+
+    def add(self, *items: Tuple[int, float]):
+        with self._lock:
+            local = self._get_local()
+            for index, value in items:
+                local[index] += value
+            if self._client is None:
+                return
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pending = {}
+                threading.Thread(target=self._flush_loop, args=(self._pid,), name='metrics_flush', daemon=True).start()
+            pending = self._pending
+            for index, value in items:
+                pending[index] = pending.get(index, 0.0) + value
+
+    def _flush_loop(self, pid: int):
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write the buffered increments of this worker to the redis DB."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, {}
+        if not pending or self._client is None:
+            return
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for index, value in pending.items():
+                pipeline.hincrbyfloat(self.key, self.names[index], value)
+            pipeline.execute()
+        except redis.exceptions.RedisError as e:
+            logger.debug('can\'t record the metrics: %s', e)
+
+    def get_range(self, start: int, size: int) -> List[float]:
+        if self._client is None:
+            return super().get_range(start, size)
+        # the values read include the increments of this worker
+        self.flush()
+        try:
+            values = self._client.hmget(self.key, self.names[start : start + size])
+        except redis.exceptions.RedisError as e:
+            logger.warning('can\'t read the metrics: %s', e)
+            return super().get_range(start, size)
+        return [float(value) if value else 0.0 for value in values]
+
+
+def read_pids(file_descriptor: int, file_header: bytes) -> List[int]:
+    """Returns the PIDs of the rows of the file ``file_descriptor``."""
+    if len(file_header) != HEADER.size:
+        return []
+    magic, _, max_workers, _ = HEADER.unpack(file_header)
+    if magic != MAGIC or max_workers <= 0:
+        return []
+    data = os.pread(file_descriptor, 8 * max_workers, HEADER.size)
+    return list(array('q', data[: len(data) - len(data) % 8]))
+
+
+def is_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def to_number(value: float):
+    return int(value) if value.is_integer() else value
+
+
+class SharedCounterStorage(CounterStorage):
+    """:py:obj:`CounterStorage` of :py:obj:`SharedValues`."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values: SharedValues, windows=None):
+        self.values = values
+        super().__init__(windows)
+
+    def configure(self, *args):
+        with self.lock:
+            self.counters[args] = self.values.allocate('|'.join(('counter',) + args), 1)
+            self.counter_windows[args] = get_windows(self.windows, int)
+
+    def get(self, *args, window=None):
+        if window is not None:
+            return self.get_window(window, *args)
+        return to_number(self.values.get_range(self.counters[args], 1)[0])
+
+    def get_local(self, *args):
+        """Returns the value of the counter for this worker."""
+        return to_number(self.values.get_local_range(self.counters[args], 1)[0])
+
+    def add(self, value, *args):
+        self.values.add((self.counters[args], value))
+        with self.lock:
+            self._add_to_windows(value, args)
+
+    def dump(self):
+        logger.debug("Counters:")
+        for k in sorted(self.counters.keys(), key='/'.join):
+            logger.debug("- %-60s %s", '|'.join(k), self.get(*k))
+
+
+class SharedHistogram(Histogram):
+    """:py:obj:`Histogram` of :py:obj:`SharedValues`: the buckets, the count and
+    the sum.
+
+    Each search reads the snapshot of the engines (adaptive timeouts), reading
+    the buckets of all the workers each time would cost more than the search
+    itself: the snapshot is reused for :py:obj:`SNAPSHOT_TTL` seconds.  The
+    trade-off is that the snapshot misses the values observed during the last
+    second, by this worker too.
+    """
+
+    def __init__(self, buckets, values: SharedValues, name: str, windows=None):  # pylint: disable=super-init-not-called
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self._size = buckets.size
+        self._values = values
+        self._offset = values.allocate(name, self._size + 2, repr(buckets))
+        self._windows = get_windows(windows, new_histogram_slot)
+        self._snapshot: Optional[HistogramSnapshot] = None
+        self._snapshot_time = 0.0
+
+    def observe(self, value):
+        q = self._buckets.get_index(value)
+        self._values.add((self._offset + q, 1), (self._offset + self._size, 1), (self._offset + self._size + 1, value))
+        with self._lock:
+            self._observe_windows(q, value)
+
+    def snapshot(self, window=None):
+        if window is not None:
+            return self._get_window_snapshot(window)
+        now = default_timer()
+        with self._lock:
+            if self._snapshot is not None and now - self._snapshot_time < SNAPSHOT_TTL:
+                return self._snapshot
+        values = self._values.get_range(self._offset, self._size + 2)
+        snapshot = HistogramSnapshot(self._buckets, [int(value) for value in values[: self._size]], values[-1])
+        with self._lock:
+            self._snapshot, self._snapshot_time = snapshot, now
+        return snapshot
+
+    @property
+    def _quartiles(self):
+        return [int(value) for value in self._values.get_range(self._offset, self._size)]
+
+    @property
+    def _count(self):
+        return int(self._values.get_range(self._offset + self._size, 1)[0])
+
+    @property
+    def _sum(self):
+        return self._values.get_range(self._offset + self._size + 1, 1)[0]
+
+
+class SharedHistogramStorage(HistogramStorage):
+    """:py:obj:`HistogramStorage` of :py:obj:`SharedHistogram`."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values: SharedValues, windows=None):
+        self.values = values
+        super().__init__(histogram_class=SharedHistogram, windows=windows)
+
+    def configure_buckets(self, buckets, *args):
+        measure = SharedHistogram(buckets, self.values, '|'.join(('histogram',) + args), self.windows)
+        self.measures[args] = measure
+        return measure
+
+
+def get_shared_values(backend: str, mmap_path: Optional[str] = None) -> Optional[SharedValues]:
+    """Returns the values of the ``backend``, ``None`` for the ``memory``
+    backend."""
+    if backend == 'mmap':
+        path = mmap_path or os.path.join(tempfile.gettempdir(), 'searxng-metrics-{}'.format(os.getuid()))
+        return MmapValues(path)
+    if backend == 'redis':
+        return RedisValues()
+    return None
@@ -5,16 +5,24 @@
 import asyncio
 import threading
 import concurrent.futures
+from contextvars import ContextVar
 from queue import SimpleQueue
 from types import MethodType
 from timeit import default_timer
-from typing import Iterable, NamedTuple, Tuple, List, Dict, Union
+from typing import Any, Coroutine, Iterable, Iterator, NamedTuple, Optional, Tuple, List, Dict, Union
 from contextlib import contextmanager
 
 import httpx
 import anyio
 
-from .network import get_network, initialize, check_network_configuration  # pylint:disable=cyclic-import
+from searx import settings, tracing
+from .network import (  # pylint:disable=cyclic-import
+    get_network,
+    get_network_stats,
+    get_network_health,
+    initialize,
+    check_network_configuration,
+)
 from .client import get_loop
 from .raise_for_httperror import raise_for_httperror
 
@@ -37,6 +45,11 @@ def set_timeout_for_thread(timeout, start_time=None):
     THREADLOCAL.start_time = start_time
 
 
+def clear_context_for_thread():
+    """Remove the timeout, the total time and the network of the thread."""
+    THREADLOCAL.__dict__.clear()
+
+
 def set_context_network_name(network_name):
     THREADLOCAL.network = get_network(network_name)
 
@@ -49,6 +62,13 @@ def get_context_network():
     return THREADLOCAL.__dict__.get('network') or get_network()
 
 
+def _add_time_for_thread(duration: float):
+    # update total_time.
+    # See get_time_for_thread() and reset_time_for_thread()
+    if hasattr(THREADLOCAL, 'total_time'):
+        THREADLOCAL.total_time += duration
+
+
 @contextmanager
 def _record_http_time():
     # pylint: disable=too-many-branches
@@ -57,21 +77,17 @@ def _record_http_time():
     try:
         yield start_time
     finally:
-        # update total_time.
-        # See get_time_for_thread() and reset_time_for_thread()
-        if hasattr(THREADLOCAL, 'total_time'):
-            time_after_request = default_timer()
-            THREADLOCAL.total_time += time_after_request - time_before_request
+        _add_time_for_thread(default_timer() - time_before_request)
 
 
-def _get_timeout(start_time, kwargs):
+def _get_timeout(start_time, kwargs, context_timeout=None):
     # pylint: disable=too-many-branches
 
     # timeout (httpx)
     if 'timeout' in kwargs:
         timeout = kwargs['timeout']
     else:
-        timeout = getattr(THREADLOCAL, 'timeout', None)
+        timeout = context_timeout
         if timeout is not None:
             kwargs['timeout'] = timeout
 
@@ -86,42 +102,209 @@ def _get_timeout(start_time, kwargs):
     return timeout
 
 
+async def _record_start(coroutine: Coroutine, started: List[float]):
+    started.append(default_timer())
+    return await coroutine
+
+
 def request(method, url, **kwargs):
     """same as requests/requests/api.py request(...)"""
-    with _record_http_time() as start_time:
+    with _record_http_time() as start_time, tracing.span('network.request', method=method) as span:
         network = get_context_network()
-        timeout = _get_timeout(start_time, kwargs)
-        future = asyncio.run_coroutine_threadsafe(network.request(method, url, **kwargs), get_loop())
+        timeout = _get_timeout(start_time, kwargs, getattr(THREADLOCAL, 'timeout', None))
+        coroutine = network.request(method, url, **kwargs)
+        started: List[float] = []
+        if tracing.is_active():
+            # the time before the loop runs the coroutine is the span network.loop_wait
+            span.set_attribute('host', httpx.URL(url).host)
+            coroutine = _record_start(coroutine, started)
+        submitted = default_timer()
+        future = asyncio.run_coroutine_threadsafe(coroutine, get_loop())
         try:
             return future.result(timeout)
         except concurrent.futures.TimeoutError as e:
             raise httpx.TimeoutException('Timeout', request=None) from e
-
-
-def multi_requests(request_list: List["Request"]) -> List[Union[httpx.Response, Exception]]:
-    """send multiple HTTP requests in parallel. Wait for all requests to finish."""
+        finally:
+            if started:
+                tracing.add_span('network.loop_wait', submitted, started[0])
+
+
+def multi_requests_as_completed(
+    request_list: List["Request"],
+) -> Iterator[Tuple[int, Union[httpx.Response, Exception]]]:
+    """Send multiple HTTP requests in parallel, yield ``(index, response)`` as
+    the responses arrive, ``index`` is the position of the request in
+    ``request_list`` and ``response`` is an exception if the request has
+    failed.
+
+    The requests share one deadline, the largest timeout of the requests: when
+    it has passed, the pending requests are cancelled and a
+    :py:obj:`httpx.TimeoutException` is yielded for each of them.  The pending
+    requests are cancelled too if the caller stops the iteration (``break``)::
+
+        for index, response in multi_requests_as_completed(request_list):
+            if isinstance(response, Exception):
+                continue
+            if parse(response):
+                break
+    """
+    # the time of the thread is the time spent to send the requests and to wait
+    # for the responses, not the time of the caller between two responses.
     with _record_http_time() as start_time:
         # send the requests
         network = get_context_network()
         loop = get_loop()
-        future_list = []
-        for request_desc in request_list:
-            timeout = _get_timeout(start_time, request_desc.kwargs)
+        future_index = {}
+        deadline = 0
+        for index, request_desc in enumerate(request_list):
+            timeout = _get_timeout(start_time, request_desc.kwargs, getattr(THREADLOCAL, 'timeout', None))
+            deadline = max(deadline, timeout)
             future = asyncio.run_coroutine_threadsafe(
                 network.request(request_desc.method, request_desc.url, **request_desc.kwargs), loop
             )
-            future_list.append((future, timeout))
+            future_index[future] = index
+        deadline += default_timer()
 
-        # read the responses
-        responses = []
-        for future, timeout in future_list:
+    # read the responses
+    pending = set(future_index)
+    try:
+        completed = concurrent.futures.as_completed(future_index, max(deadline - default_timer(), 0))
+        while True:
+            with _record_http_time():
+                future = next(completed, None)
+            if future is None:
+                break
+            pending.discard(future)
             try:
-                responses.append(future.result(timeout))
-            except concurrent.futures.TimeoutError:
-                responses.append(httpx.TimeoutException('Timeout', request=None))
+                response = future.result()
             except Exception as e:  # pylint: disable=broad-except
-                responses.append(e)
-        return responses
+                response = e
+            yield future_index[future], response
+    except concurrent.futures.TimeoutError:
+        for future in sorted(pending, key=future_index.get):
+            future.cancel()
+            pending.discard(future)
+            yield future_index[future], httpx.TimeoutException('Timeout', request=None)
+    finally:
+        # the caller has stopped the iteration: cancel the coroutines on the loop
+        for future in pending:
+            future.cancel()
+
+
+def multi_requests(request_list: List["Request"]) -> List[Union[httpx.Response, Exception]]:
+    """send multiple HTTP requests in parallel. Wait for all requests to finish
+    (see :py:obj:`multi_requests_as_completed`)."""
+    responses: List[Union[httpx.Response, Exception]] = [None] * len(request_list)  # type: ignore
+    for index, response in multi_requests_as_completed(request_list):
+        responses[index] = response
+    return responses
+
+
+class AsyncContext:
+    """The network, the timeout, the default arguments of the HTTP requests
+    and the HTTP time of a coroutine run by :py:obj:`run_coroutine`: the
+    coroutine runs on the loop of :py:obj:`searx.network.client.get_loop`, not
+    in the thread which has set the thread-local values."""
+
+    __slots__ = 'network', 'timeout', 'start_time', 'request_args', 'total_time', '_active', '_active_since'
+
+    def __init__(
+        self, network, timeout: Optional[float], start_time: Optional[float], request_args: Optional[Dict] = None
+    ):
+        self.network = network
+        self.timeout = timeout
+        self.start_time = start_time
+        self.request_args = request_args or {}
+        # time with at least one HTTP request on the way: the requests sent in
+        # parallel are not counted twice.
+        self.total_time = 0
+        self._active = 0
+        self._active_since = 0
+
+    def request_started(self):
+        if self._active == 0:
+            self._active_since = default_timer()
+        self._active += 1
+
+    def request_finished(self):
+        self._active -= 1
+        if self._active == 0:
+            self.total_time += default_timer() - self._active_since
+
+
+ASYNC_CONTEXT = ContextVar('searx_network_async_context', default=None)
+"""The :py:obj:`AsyncContext` of the running coroutine (see
+:py:obj:`run_coroutine`)."""
+
+
+async def _run_in_context(context: AsyncContext, coroutine: Coroutine):
+    # the task has its own copy of the context: ASYNC_CONTEXT is set for this
+    # coroutine and the tasks it creates.
+    ASYNC_CONTEXT.set(context)
+    return await coroutine
+
+
+def run_coroutine(coroutine: Coroutine, request_args: Optional[Dict] = None) -> Any:
+    """Run the ``coroutine`` on the loop of :py:obj:`searx.network.client.get_loop`
+    and wait for the result: the calling thread is blocked until the coroutine
+    returns (or until the timeout).
+
+    The coroutine sends its HTTP requests with :py:obj:`arequest` (:py:obj:`aget`,
+    :py:obj:`apost`): the network and the timeout are the ones of the calling
+    thread (see :py:obj:`set_context_network_name` and
+    :py:obj:`set_timeout_for_thread`), the time spent in the HTTP requests is
+    added to the total time of the thread (see :py:obj:`get_time_for_thread`).
+    ``request_args`` are the default arguments of the requests (the ``headers``
+    are merged with the headers of a request).
+
+    The coroutine is cancelled when the timeout is reached,
+    :py:obj:`httpx.TimeoutException` is raised.
+    """
+    start_time = getattr(THREADLOCAL, 'start_time', None) or default_timer()
+    context = AsyncContext(get_context_network(), getattr(THREADLOCAL, 'timeout', None), start_time, request_args)
+    timeout = _get_timeout(start_time, {}, context.timeout)
+    future = asyncio.run_coroutine_threadsafe(_run_in_context(context, coroutine), get_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError as e:
+        future.cancel()
+        raise httpx.TimeoutException('Timeout', request=None) from e
+    finally:
+        _add_time_for_thread(context.total_time)
+
+
+async def arequest(method, url, **kwargs) -> httpx.Response:
+    """Same as :py:obj:`request` for the coroutines run by :py:obj:`run_coroutine`,
+    with the default arguments of :py:obj:`run_coroutine`.
+
+    Outside of :py:obj:`run_coroutine`, the default network is used without a
+    timeout.
+    """
+    context = ASYNC_CONTEXT.get()
+    if context is None:
+        context = AsyncContext(get_network(), None, None)
+    for key, value in context.request_args.items():
+        if key == 'headers':
+            kwargs['headers'] = {**value, **(kwargs.get('headers') or {})}
+        else:
+            kwargs.setdefault(key, value)
+    timeout = _get_timeout(context.start_time, kwargs, context.timeout)
+    context.request_started()
+    try:
+        return await asyncio.wait_for(context.network.request(method, url, **kwargs), timeout)
+    except asyncio.TimeoutError as e:
+        raise httpx.TimeoutException('Timeout', request=None) from e
+    finally:
+        context.request_finished()
+
+
+async def aget(url, **kwargs) -> httpx.Response:
+    kwargs.setdefault('allow_redirects', True)
+    return await arequest('get', url, **kwargs)
+
+
+async def apost(url, data=None, **kwargs) -> httpx.Response:
+    return await arequest('post', url, data=data, **kwargs)
 
 
 class Request(NamedTuple):
@@ -191,15 +374,56 @@ def delete(url, **kwargs):
     return request('delete', url, **kwargs)
 
 
-async def stream_chunk_to_queue(network, queue, method, url, **kwargs):
+class StreamQueue:
+    """Bounded queue of the chunks of a streamed response, from the loop of
+    :py:obj:`searx.network.client.get_loop` to the thread which reads the
+    response.
+
+    When ``maxsize`` chunks are waiting, :py:obj:`StreamQueue.put` waits for the
+    reader: the upstream response is read at the pace of the reader, the memory
+    of a stream is about ``maxsize`` × the chunk size whatever the size of the
+    response is.  The response, the exceptions and the end of the stream (``None``)
+    are not counted.
+    """
+
+    __slots__ = 'loop', 'maxsize', '_queue', '_semaphore'
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.maxsize = maxsize
+        self._queue = SimpleQueue()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def put(self, chunk: bytes):
+        """Put a chunk, wait while the queue is full (called from the loop)."""
+        if self._semaphore is None:
+            # created on the loop (Python < 3.10 binds the semaphore to a loop)
+            self._semaphore = asyncio.Semaphore(self.maxsize)
+        await self._semaphore.acquire()
+        self._queue.put(chunk)
+
+    def put_nowait(self, obj: Any):
+        """Put the response, an exception or ``None`` (called from the loop)."""
+        self._queue.put(obj)
+
+    def get(self) -> Any:
+        """Wait for the next object (called from the reader thread)."""
+        obj = self._queue.get()
+        if isinstance(obj, bytes):
+            self.loop.call_soon_threadsafe(self._semaphore.release)
+        return obj
+
+
+async def stream_chunk_to_queue(network, queue: StreamQueue, chunk_size: Optional[int], method, url, **kwargs):
     try:
         async with await network.stream(method, url, **kwargs) as response:
-            queue.put(response)
+            queue.put_nowait(response)
             # aiter_raw: access the raw bytes on the response without applying any HTTP content decoding
             # https://www.python-httpx.org/quickstart/#streaming-responses
-            async for chunk in response.aiter_raw(65536):
+            # without chunk_size, the chunks are the bytes read from the socket (no copy)
+            async for chunk in response.aiter_raw(chunk_size):
                 if len(chunk) > 0:
-                    queue.put(chunk)
+                    await queue.put(chunk)
     except (httpx.StreamClosed, anyio.ClosedResourceError):
         # the response was queued before the exception.
         # the exception was raised on aiter_raw.
@@ -212,24 +436,36 @@ async def stream_chunk_to_queue(network, queue, method, url, **kwargs):
         # -> the exception is not catch here
         # -> queue None (in finally)
         # -> the function below steam(method, url, **kwargs) has nothing to return
-        queue.put(e)
+        queue.put_nowait(e)
     finally:
-        queue.put(None)
+        queue.put_nowait(None)
 
 
 def _stream_generator(method, url, **kwargs):
-    queue = SimpleQueue()
+    loop = get_loop()
+    queue = StreamQueue(loop, settings['outgoing']['stream_buffer_size'])
+    chunk_size = settings['outgoing']['stream_chunk_size'] or None
     network = get_context_network()
-    future = asyncio.run_coroutine_threadsafe(stream_chunk_to_queue(network, queue, method, url, **kwargs), get_loop())
+    future = asyncio.run_coroutine_threadsafe(
+        stream_chunk_to_queue(network, queue, chunk_size, method, url, **kwargs), loop
+    )
 
     # yield chunks
-    obj_or_exception = queue.get()
-    while obj_or_exception is not None:
-        if isinstance(obj_or_exception, Exception):
-            raise obj_or_exception
-        yield obj_or_exception
+    done = False
+    try:
         obj_or_exception = queue.get()
-    future.result()
+        while obj_or_exception is not None:
+            if isinstance(obj_or_exception, Exception):
+                raise obj_or_exception
+            yield obj_or_exception
+            obj_or_exception = queue.get()
+        done = True
+        future.result()
+    finally:
+        if not done:
+            # the generator is closed before the end of the stream: the
+            # coroutine may wait for a free place in the queue, cancel it.
+            future.cancel()
 
 
 def _close_response_method(self):
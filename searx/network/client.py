@@ -5,15 +5,17 @@
 import asyncio
 import logging
 import random
-from ssl import SSLContext
+from collections import OrderedDict
+from ssl import SSLContext, SSLObject, SSLSession
 import threading
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 import httpx
 from httpx_socks import AsyncProxyTransport
 from python_socks import parse_proxy_url, ProxyConnectionError, ProxyTimeoutError, ProxyError
 
 from searx import logger
+from .dns import DNSCacheBackend
 
 # Optional uvloop (support Python 3.6)
 try:
@@ -26,7 +28,12 @@ else:
 
 logger = logger.getChild('searx.network.client')
 LOOP = None
-SSLCONTEXTS: Dict[Any, SSLContext] = {}
+SSLCONTEXTS: Dict[Any, List[SSLContext]] = {}
+SSLCONTEXT_POOL_SIZE = 8
+"""Number of SSL contexts created for each combination of parameters, each
+context has its own order of the ciphers (see :py:obj:`shuffle_ciphers`)."""
+TLS_SESSIONS_MAXSIZE = 256
+"""Maximum number of TLS sessions cached by a SSL context (one per host)."""
 
 
 def shuffle_ciphers(ssl_context):
@@ -52,12 +59,83 @@ def shuffle_ciphers(ssl_context):
     ssl_context.set_ciphers(":".join(sc_list + c_list))
 
 
-def get_sslcontexts(proxy_url=None, cert=None, verify=True, trust_env=True, http2=False):
-    key = (proxy_url, cert, verify, trust_env, http2)
-    if key not in SSLCONTEXTS:
-        SSLCONTEXTS[key] = httpx.create_ssl_context(cert, verify, trust_env, http2)
-    shuffle_ciphers(SSLCONTEXTS[key])
-    return SSLCONTEXTS[key]
+class TLSSessionSSLObject(SSLObject):
+    """SSL object which resumes the TLS session of the previous connection to
+    the same host: the handshake of the new connections is shorter (one round
+    trip less, no certificate to verify).
+
+    The sessions are stored in the ``tls_sessions`` attribute of the SSL
+    context (see :py:obj:`new_sslcontext`): a session can only be resumed with
+    the context which has created it.  The methods are called from the loop of
+    :py:obj:`get_loop`.
+    """
+
+    _session_loaded = False
+    _session_checked = False
+
+    def _load_session(self):
+        # the session must be set before the first step of the handshake
+        self._session_loaded = True
+        if self.server_hostname and not self.server_side and self.session is None:
+            session = self.context.tls_sessions.get(self.server_hostname)
+            if session is not None:
+                self.session = session
+
+    def _save_session(self):
+        # with TLS 1.3, the session ticket is received after the handshake
+        session: SSLSession = self.session
+        if session is not None and session.has_ticket and self.server_hostname:
+            tls_sessions: OrderedDict = self.context.tls_sessions
+            tls_sessions[self.server_hostname] = session
+            tls_sessions.move_to_end(self.server_hostname)
+            if len(tls_sessions) > TLS_SESSIONS_MAXSIZE:
+                tls_sessions.popitem(last=False)
+
+    def do_handshake(self):
+        if not self._session_loaded:
+            self._load_session()
+        super().do_handshake()
+        self._save_session()
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        if not self._session_checked:
+            # the ticket is received before the first data of the server: the
+            # next reads don't look for it
+            self._session_checked = True
+            self._save_session()
+        return data
+
+
+def new_sslcontext(cert=None, verify=True, trust_env=True, http2=False) -> SSLContext:
+    """Returns a new SSL context with shuffled ciphers, which resumes the TLS
+    sessions (see :py:obj:`TLSSessionSSLObject`)."""
+    ssl_context = httpx.create_ssl_context(cert, verify, trust_env, http2)
+    shuffle_ciphers(ssl_context)
+    ssl_context.sslobject_class = TLSSessionSSLObject
+    ssl_context.tls_sessions = OrderedDict()
+    return ssl_context
+
+
+def get_sslcontexts(proxy_url=None, cert=None, verify=True, trust_env=True, http2=False, local_address=None):
+    # pylint: disable=too-many-arguments
+    """Returns one of the :py:obj:`SSLCONTEXT_POOL_SIZE` SSL contexts of the
+    parameters.
+
+    The pool is filled by the first calls (creating a context loads the CA
+    certificates), then a context is picked randomly.  The ciphers of a context
+    used by a client are never changed, and the TLS sessions are resumed by the
+    connections of the clients using the same context.  There is a pool for
+    each ``local_address`` and ``proxy_url``: a TLS session is never resumed
+    from another source IP or through another proxy, the session ticket would
+    link them.
+    """
+    key = (proxy_url, cert, verify, trust_env, http2, local_address)
+    pool = SSLCONTEXTS.setdefault(key, [])
+    if len(pool) < SSLCONTEXT_POOL_SIZE:
+        pool.append(new_sslcontext(cert, verify, trust_env, http2))
+        return pool[-1]
+    return random.choice(pool)
 
 
 class AsyncHTTPTransportNoHttp(httpx.AsyncHTTPTransport):
@@ -96,7 +174,7 @@ def get_transport_for_socks_proxy(verify, http2, local_address, proxy_url, limit
         rdns = True
 
     proxy_type, proxy_host, proxy_port, proxy_username, proxy_password = parse_proxy_url(proxy_url)
-    verify = get_sslcontexts(proxy_url, None, verify, True, http2) if verify is True else verify
+    verify = get_sslcontexts(proxy_url, None, verify, True, http2, local_address) if verify is True else verify
     return AsyncProxyTransportFixed(
         proxy_type=proxy_type,
         proxy_host=proxy_host,
@@ -113,9 +191,10 @@ def get_transport_for_socks_proxy(verify, http2, local_address, proxy_url, limit
     )
 
 
-def get_transport(verify, http2, local_address, proxy_url, limit, retries):
-    verify = get_sslcontexts(None, None, verify, True, http2) if verify is True else verify
-    return httpx.AsyncHTTPTransport(
+def get_transport(verify, http2, local_address, proxy_url, limit, retries, dns_cache=None):
+    # pylint: disable=too-many-arguments
+    verify = get_sslcontexts(proxy_url, None, verify, True, http2, local_address) if verify is True else verify
+    transport = httpx.AsyncHTTPTransport(
         # pylint: disable=protected-access
         verify=verify,
         http2=http2,
@@ -124,6 +203,11 @@ def get_transport(verify, http2, local_address, proxy_url, limit, retries):
         local_address=local_address,
         retries=retries,
     )
+    if dns_cache is not None:
+        # the connection pool (or the HTTP proxy) resolves the host names with
+        # the DNS cache of the network
+        transport._pool._network_backend = DNSCacheBackend(dns_cache)  # pylint: disable=protected-access
+    return transport
 
 
 def new_client(
@@ -139,6 +223,7 @@ def new_client(
     retries,
     max_redirects,
     hook_log_response,
+    dns_cache=None,
 ):
     limit = httpx.Limits(
         max_connections=max_connections,
@@ -155,12 +240,14 @@ def new_client(
                 verify, enable_http2, local_address, proxy_url, limit, retries
             )
         else:
-            mounts[pattern] = get_transport(verify, enable_http2, local_address, proxy_url, limit, retries)
+            mounts[pattern] = get_transport(
+                verify, enable_http2, local_address, proxy_url, limit, retries, dns_cache=dns_cache
+            )
 
     if not enable_http:
         mounts['http://'] = AsyncHTTPTransportNoHttp()
 
-    transport = get_transport(verify, enable_http2, local_address, None, limit, retries)
+    transport = get_transport(verify, enable_http2, local_address, None, limit, retries, dns_cache=dns_cache)
 
     event_hooks = None
     if hook_log_response:
@@ -174,6 +261,18 @@ def new_client(
     )
 
 
+def get_client_connections(client: httpx.AsyncClient) -> List[Any]:
+    """Returns the connections (``httpcore`` connections) of the pools of
+    ``client``."""
+    connections = []
+    # pylint: disable=protected-access
+    for transport in (client._transport, *client._mounts.values()):
+        pool = getattr(transport, '_pool', None)
+        if pool is not None:
+            connections.extend(pool.connections)
+    return connections
+
+
 def get_loop():
     return LOOP
 
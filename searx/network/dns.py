@@ -0,0 +1,177 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""DNS cache of the HTTP clients.
+
+Without cache, each new connection resolves the host name with the system
+resolver.  When ``dns_cache_ttl`` is set (see :ref:`settings outgoing`), the
+addresses are cached by the :py:obj:`Network <searx.network.network.Network>`:
+
+- an address is cached for ``dns_cache_ttl`` seconds.  The system resolver
+  (``getaddrinfo``) doesn't give the TTL of the DNS records, the TTL is the
+  configured value.
+- a failed resolution is cached for ``dns_cache_negative_ttl`` seconds.
+- a cached address used after 80% of its TTL is refreshed in the background:
+  the connections don't wait for the resolver.  If the refresh fails, the
+  cached addresses are kept for 20% of the TTL more.
+- the concurrent resolutions of the same host share the same request to the
+  resolver.
+
+The cache runs on the loop of :py:obj:`searx.network.client.get_loop`, it is
+plugged in the connection pools of httpx (see :py:obj:`DNSCacheBackend`).
+"""
+
+import asyncio
+import ipaddress
+import socket
+from collections import OrderedDict
+from timeit import default_timer
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import httpcore
+from httpcore.backends.auto import AutoBackend
+from httpcore.backends.base import AsyncNetworkBackend, AsyncNetworkStream
+
+from searx import logger
+
+logger = logger.getChild('network.dns')
+
+REFRESH_RATIO = 0.8
+"""A cached address is refreshed when it is used after this ratio of its TTL."""
+
+
+class DNSCacheEntry:  # pylint: disable=too-few-public-methods
+    """The addresses of a host, or the error of its resolution."""
+
+    __slots__ = 'addresses', 'error', 'expire_time', 'refresh_time', 'refreshing'
+
+    def __init__(self, addresses: List[str], error: Optional[str], ttl: float):
+        now = default_timer()
+        self.addresses = addresses
+        self.error = error
+        self.expire_time = now + ttl
+        self.refresh_time = now + ttl * REFRESH_RATIO
+        self.refreshing = False
+
+
+class DNSCache:
+    """Cache of the resolved addresses, the methods have to be called from the
+    loop of :py:obj:`searx.network.client.get_loop`."""
+
+    __slots__ = 'ttl', 'negative_ttl', 'maxsize', '_entries', '_lookups'
+
+    def __init__(self, ttl: float, negative_ttl: float = 0, maxsize: int = 1000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Tuple, DNSCacheEntry]' = OrderedDict()
+        self._lookups: Dict[Tuple, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def resolve(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[str]:
+        """Returns the addresses of ``host``, raise :py:obj:`httpcore.ConnectError`
+        if the host can't be resolved."""
+        key = (host, port, family)
+        entry = self._entries.get(key)
+        if entry is None or entry.expire_time <= default_timer():
+            entry = await self._lookup(key)
+        else:
+            self._entries.move_to_end(key)
+            if not entry.error and not entry.refreshing and entry.refresh_time <= default_timer():
+                entry.refreshing = True
+                asyncio.ensure_future(self._refresh(key))
+        if entry.error:
+            raise httpcore.ConnectError(entry.error)
+        return entry.addresses
+
+    async def _refresh(self, key: Tuple):
+        try:
+            await self._lookup(key)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug('refresh %s: %s', key[0], e)
+
+    async def _lookup(self, key: Tuple) -> DNSCacheEntry:
+        # one request to the resolver for the concurrent resolutions
+        future = self._lookups.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._getaddrinfo(key))
+            self._lookups[key] = future
+            future.add_done_callback(lambda _: self._lookups.pop(key, None))
+        # shield: the cancellation of one connection doesn't cancel the
+        # resolution of the others
+        return await asyncio.shield(future)
+
+    async def _getaddrinfo(self, key: Tuple) -> DNSCacheEntry:
+        host, port, family = key
+        try:
+            addrinfo = await asyncio.get_running_loop().getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError) as e:
+            previous = self._entries.get(key)
+            if previous is not None and previous.error is None and previous.expire_time > default_timer():
+                # failed refresh: the cached addresses are kept, the next
+                # refresh is at the end of the new lifetime
+                logger.debug('refresh %s: %s', host, e)
+                entry = DNSCacheEntry(previous.addresses, None, self.ttl * (1 - REFRESH_RATIO))
+            else:
+                entry = DNSCacheEntry([], '{}: {}'.format(host, e), self.negative_ttl)
+        else:
+            # remove the duplicates, keep the order of the resolver
+            addresses = list(dict.fromkeys(sockaddr[0] for _, _, _, _, sockaddr in addrinfo))
+            entry = DNSCacheEntry(addresses, None, self.ttl)
+        if entry.error is None or self.negative_ttl > 0:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCacheBackend(AsyncNetworkBackend):
+    """Network backend of httpcore which resolves the host names with a
+    :py:obj:`DNSCache`."""
+
+    def __init__(self, dns_cache: DNSCache):
+        self.dns_cache = dns_cache
+        self._backend = AutoBackend()
+
+    async def connect_tcp(
+        self, host: str, port: int, timeout: float = None, local_address: str = None
+    ) -> AsyncNetworkStream:
+        if is_ip_address(host):
+            return await self._backend.connect_tcp(host, port, timeout=timeout, local_address=local_address)
+
+        # the address family of the local address
+        family = socket.AF_UNSPEC
+        if local_address:
+            family = socket.AF_INET6 if ':' in local_address else socket.AF_INET
+
+        try:
+            with anyio.fail_after(timeout):
+                addresses = await self.dns_cache.resolve(host, port, family)
+        except TimeoutError as e:
+            raise httpcore.ConnectTimeout('DNS resolution of {} timed out'.format(host)) from e
+
+        # try the addresses one by one
+        error = httpcore.ConnectError('no address for {}'.format(host))
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout=timeout, local_address=local_address)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path: str, timeout: float = None) -> AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout=timeout)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
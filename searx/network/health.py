@@ -0,0 +1,162 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Health of the proxies and source addresses of a network.
+
+A :py:obj:`Network <searx.network.network.Network>` rotates its proxies and its
+source addresses (``proxies`` and ``source_ips`` in :ref:`settings outgoing`).
+The rotation is a round-robin weighted by the health of each member:
+
+- the success rate and the latency of the requests are tracked (exponentially
+  weighted moving averages).  The weight of a member is its success rate,
+  reduced when its latency is above the average latency of the members.
+- a member is skipped until the credit of its weight reaches one: a healthy
+  member is used at each turn, a member with a weight of 0.25 once every four
+  turns.  The order of the rotation doesn't change while all the members are
+  healthy.
+- a member is quarantined for ``quarantine_time`` seconds after a CAPTCHA, an
+  HTTP 429 or an access denied (see
+  :py:obj:`searx.exceptions.SearxEngineAccessDeniedException`), or after
+  ``quarantine_failures`` consecutive failures.  When all the members are
+  quarantined, the healthiest one is used.
+
+The members are iterated lazily (an IPv6 network can have more addresses than
+the memory can hold): only the members with an outcome are tracked, at most
+:py:obj:`MAX_TRACKED_MEMBERS`.  The state is exported by
+:py:obj:`searx.metrics.get_network_health`.
+"""
+
+from collections import OrderedDict
+from timeit import default_timer
+from typing import Any, Dict, Iterator, Optional
+
+ALPHA = 0.2
+"""Weight of the last outcome in the moving averages."""
+
+MIN_WEIGHT = 0.05
+"""Minimum weight of a member which is not quarantined: it is still used from
+time to time, and its health can be measured again."""
+
+MAX_TRACKED_MEMBERS = 1024
+
+
+class MemberHealth:  # pylint: disable=too-few-public-methods
+    """Health of a proxy or a source address."""
+
+    __slots__ = 'success_rate', 'latency', 'failures', 'quarantine_until', 'credit', 'requests', 'errors', 'blocked'
+
+    def __init__(self):
+        self.success_rate = 1.0
+        self.latency: Optional[float] = None
+        # consecutive failures
+        self.failures = 0
+        self.quarantine_until = 0.0
+        self.credit = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.blocked = 0
+
+    def get_weight(self, now: float, average_latency: Optional[float]) -> float:
+        if self.quarantine_until > now:
+            return 0.0
+        weight = self.success_rate
+        if self.latency and average_latency and self.latency > average_latency:
+            weight *= average_latency / self.latency
+        return max(weight, MIN_WEIGHT)
+
+
+class HealthSelector:
+    """Iterator over the members of ``candidates`` (an infinite iterator, for
+    example a :py:obj:`itertools.cycle`) weighted by their health.  The methods
+    have to be called from the loop of :py:obj:`searx.network.client.get_loop`.
+    """
+
+    __slots__ = 'quarantine_time', 'quarantine_failures', '_candidates', '_health', '_average_latency'
+
+    def __init__(self, candidates: Iterator[Any], quarantine_time: float = 60, quarantine_failures: int = 3):
+        self.quarantine_time = quarantine_time
+        self.quarantine_failures = quarantine_failures
+        self._candidates = candidates
+        self._health: 'OrderedDict[Any, MemberHealth]' = OrderedDict()
+        self._average_latency: Optional[float] = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._health:
+            # nothing is known: plain round-robin
+            return next(self._candidates)
+        now = default_timer()
+        best_member, best_weight = None, -1.0
+        # the untracked members are healthy: after len(self._health) skipped
+        # members, either a member is selected or all the members are tracked
+        for _ in range(len(self._health) + 1):
+            member = next(self._candidates)
+            health = self._health.get(member)
+            if health is None:
+                return member
+            weight = health.get_weight(now, self._average_latency)
+            health.credit = min(health.credit + weight, 1.0)
+            if health.credit >= 1.0:
+                health.credit -= 1.0
+                return member
+            if weight > best_weight:
+                best_member, best_weight = member, weight
+        return best_member
+
+    def _get_health(self, member) -> MemberHealth:
+        health = self._health.get(member)
+        if health is None:
+            health = self._health[member] = MemberHealth()
+            if len(self._health) > MAX_TRACKED_MEMBERS:
+                self._health.popitem(last=False)
+        else:
+            self._health.move_to_end(member)
+        return health
+
+    def record_success(self, member, latency: float):
+        """Record a successful request sent through ``member`` in ``latency``
+        seconds."""
+        health = self._get_health(member)
+        health.requests += 1
+        health.failures = 0
+        health.success_rate += ALPHA * (1.0 - health.success_rate)
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency += ALPHA * (latency - health.latency)
+        if self._average_latency is None:
+            self._average_latency = latency
+        else:
+            self._average_latency += ALPHA * (latency - self._average_latency)
+
+    def record_failure(self, member, blocked: bool = False):
+        """Record a failed request sent through ``member``, ``blocked`` is true
+        if the website has returned a CAPTCHA, an HTTP 429 or has denied the
+        access."""
+        health = self._get_health(member)
+        health.requests += 1
+        health.errors += 1
+        health.failures += 1
+        health.success_rate -= ALPHA * health.success_rate
+        if blocked:
+            health.blocked += 1
+        if blocked or health.failures >= self.quarantine_failures:
+            health.quarantine_until = default_timer() + self.quarantine_time
+            health.failures = 0
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the state of the tracked members."""
+        now = default_timer()
+        return {
+            str(member): {
+                'weight': health.get_weight(now, self._average_latency),
+                'success_rate': health.success_rate,
+                'latency': health.latency,
+                'quarantined': health.quarantine_until > now,
+                'requests': health.requests,
+                'errors': health.errors,
+                'blocked': health.blocked,
+            }
+            for member, health in self._health.items()
+        }
@@ -5,14 +5,21 @@
 
 import atexit
 import asyncio
+import concurrent.futures
 import ipaddress
+from collections import OrderedDict
 from itertools import cycle
-from typing import Dict
+from timeit import default_timer
+from typing import Any, Dict, List, Optional
 
 import httpx
 
 from searx import logger, searx_debug
-from .client import new_client, get_loop, AsyncHTTPTransportNoHttp
+from searx.exceptions import SearxEngineAccessDeniedException
+from .client import new_client, get_loop, get_client_connections, AsyncHTTPTransportNoHttp
+from .dns import DNSCache
+from .health import HealthSelector
+from . import warmup
 from .raise_for_httperror import raise_for_httperror
 
 
@@ -35,8 +42,53 @@ PROXY_PATTERN_MAPPING = {
 
 ADDRESS_MAPPING = {'ipv4': '0.0.0.0', 'ipv6': '::'}
 
+# maximum number of seconds to wait for the end of the requests of an evicted client
+EVICTED_CLIENT_GRACE = 60
 
-class Network:
+# maximum number of seconds to wait for the statistics of the networks (the loop can be busy)
+STATS_TIMEOUT = 3
+
+
+class ProxyPattern:
+    """A key of the proxies (``all://``, ``https://``, ``all://*.example.com``,
+    ``https://example.com:8080`` ..), same matching rules as the mounts of
+    httpx (see `httpx routing`_).
+
+    .. _httpx routing: https://www.python-httpx.org/advanced/#routing
+    """
+
+    __slots__ = 'pattern', 'scheme', 'host', 'port'
+
+    def __init__(self, pattern: str):
+        url = httpx.URL(pattern)
+        self.pattern = pattern
+        self.scheme = '' if url.scheme == 'all' else url.scheme
+        self.host = '' if url.host == '*' else url.host
+        self.port = url.port
+
+    def matches(self, url: httpx.URL) -> bool:
+        if self.scheme and self.scheme != url.scheme:
+            return False
+        if self.host.startswith('*.'):
+            # *.example.com matches www.example.com, not example.com
+            if not url.host.endswith(self.host[1:]):
+                return False
+        elif self.host.startswith('*'):
+            # *example.com matches www.example.com and example.com
+            if url.host != self.host[1:] and not url.host.endswith('.' + self.host[1:]):
+                return False
+        elif self.host and self.host != url.host:
+            return False
+        return self.port is None or self.port == url.port
+
+    @property
+    def priority(self) -> tuple:
+        """The most specific pattern first: with a port, then the longest host,
+        then the longest scheme."""
+        return (self.port is None, -len(self.host), -len(self.scheme))
+
+
+class Network:  # pylint: disable=too-many-instance-attributes, too-many-public-methods
 
     __slots__ = (
         'enable_http',
@@ -51,9 +103,21 @@ class Network:
         'max_redirects',
         'retries',
         'retry_on_http_error',
+        'dns_cache_ttl',
+        'dns_cache_negative_ttl',
+        'max_clients',
+        'client_idle_timeout',
+        'quarantine_time',
+        'quarantine_failures',
+        'created_clients',
+        'evicted_clients',
+        '_dns_cache',
         '_local_addresses_cycle',
+        '_proxies_selectors',
         '_proxies_cycle',
         '_clients',
+        '_clients_last_use',
+        '_closing_clients',
         '_logger',
     )
 
@@ -74,6 +138,12 @@ class Network:
         retries=0,
         retry_on_http_error=None,
         max_redirects=30,
+        dns_cache_ttl=0,
+        dns_cache_negative_ttl=0,
+        max_clients=100,
+        client_idle_timeout=0,
+        quarantine_time=60,
+        quarantine_failures=3,
         logger_name=None,
     ):
 
@@ -89,9 +159,25 @@ class Network:
         self.retries = retries
         self.retry_on_http_error = retry_on_http_error
         self.max_redirects = max_redirects
-        self._local_addresses_cycle = self.get_ipaddress_cycle()
+        self.dns_cache_ttl = dns_cache_ttl
+        self.dns_cache_negative_ttl = dns_cache_negative_ttl
+        # shared by the clients of the network
+        self._dns_cache = DNSCache(dns_cache_ttl, dns_cache_negative_ttl) if dns_cache_ttl else None
+        self.max_clients = max_clients
+        self.client_idle_timeout = client_idle_timeout
+        self.quarantine_time = quarantine_time
+        self.quarantine_failures = quarantine_failures
+        self.created_clients = 0
+        self.evicted_clients = 0
+        self._local_addresses_cycle = HealthSelector(self.get_ipaddress_cycle(), quarantine_time, quarantine_failures)
+        # URL pattern -> selector of the proxies of the pattern
+        self._proxies_selectors: Dict[str, HealthSelector] = {}
         self._proxies_cycle = self.get_proxy_cycles()
-        self._clients = {}
+        # least recently used first
+        self._clients: 'OrderedDict[tuple, httpx.AsyncClient]' = OrderedDict()
+        self._clients_last_use: Dict[tuple, float] = {}
+        # task closing an evicted client -> evicted client
+        self._closing_clients: Dict[asyncio.Future, httpx.AsyncClient] = {}
         self._logger = logger.getChild(logger_name) if logger_name else logger
         self.check_parameters()
 
@@ -143,12 +229,44 @@ class Network:
                 yield pattern, proxy_url
 
     def get_proxy_cycles(self):
-        proxy_settings = {}
         for pattern, proxy_urls in self.iter_proxies():
-            proxy_settings[pattern] = cycle(proxy_urls)
+            self._proxies_selectors[pattern] = HealthSelector(
+                cycle(proxy_urls), self.quarantine_time, self.quarantine_failures
+            )
         while True:
             # pylint: disable=stop-iteration-return
-            yield tuple((pattern, next(proxy_url_cycle)) for pattern, proxy_url_cycle in proxy_settings.items())
+            yield tuple((pattern, next(selector)) for pattern, selector in self._proxies_selectors.items())
+
+    def record_request(self, key: tuple, url: str, latency: Optional[float] = None, blocked: bool = False):
+        """Record the outcome of a request to ``url`` sent by the client
+        ``key``: a success in ``latency`` seconds, or a failure if ``latency``
+        is ``None`` (see :py:obj:`searx.network.health`)."""
+        _, _, local_address, proxies = key
+        selectors = []
+        if local_address is not None:
+            selectors.append((self._local_addresses_cycle, local_address))
+        if proxies:
+            # the proxy used by httpx: the most specific pattern matching the URL
+            url = httpx.URL(url)
+            proxy_patterns = sorted((ProxyPattern(pattern) for pattern, _ in proxies), key=lambda p: p.priority)
+            for proxy_pattern in proxy_patterns:
+                if proxy_pattern.matches(url):
+                    proxy_url = dict(proxies)[proxy_pattern.pattern]
+                    selectors.append((self._proxies_selectors[proxy_pattern.pattern], proxy_url))
+                    break
+        for selector, member in selectors:
+            if latency is None:
+                selector.record_failure(member, blocked)
+            else:
+                selector.record_success(member, latency)
+
+    def get_health(self) -> Dict[str, Any]:
+        """Returns the health of the source addresses and of the proxies of the
+        network (see :py:obj:`searx.network.health.HealthSelector.get_stats`)."""
+        return {
+            'source_ips': self._local_addresses_cycle.get_stats(),
+            'proxies': {pattern: selector.get_stats() for pattern, selector in self._proxies_selectors.items()},
+        }
 
     async def log_response(self, response: httpx.Response):
         request = response.request
@@ -180,11 +298,33 @@ class Network:
         return result
 
     async def get_client(self, verify=None, max_redirects=None):
+        client, _ = await self.get_client_and_key(verify, max_redirects)
+        return client
+
+    async def get_client_and_key(self, verify=None, max_redirects=None):
+        """Returns the client for the next source address and proxies, and the
+        key of the client (see :py:obj:`Network.record_request`)."""
         verify = self.verify if verify is None else verify
         max_redirects = self.max_redirects if max_redirects is None else max_redirects
         local_address = next(self._local_addresses_cycle)
         proxies = next(self._proxies_cycle)  # is a tuple so it can be part of the key
         key = (verify, max_redirects, local_address, proxies)
+        return await self._get_client_of_key(key), key
+
+    async def get_clients(self) -> List[httpx.AsyncClient]:
+        """Returns the open clients of the network, or the client of the first
+        source address and proxies if no client is open.  The rotation of the
+        source addresses and proxies is not changed (see
+        :py:obj:`searx.network.warmup`)."""
+        clients = [client for client in self._clients.values() if not client.is_closed]
+        if clients:
+            return clients
+        local_address = next(self.get_ipaddress_cycle())
+        proxies = tuple((pattern, proxy_urls[0]) for pattern, proxy_urls in self.iter_proxies())
+        return [await self._get_client_of_key((self.verify, self.max_redirects, local_address, proxies))]
+
+    async def _get_client_of_key(self, key: tuple) -> httpx.AsyncClient:
+        verify, max_redirects, local_address, proxies = key
         hook_log_response = self.log_response if searx_debug else None
         if key not in self._clients or self._clients[key].is_closed:
             client = new_client(
@@ -199,12 +339,67 @@ class Network:
                 0,
                 max_redirects,
                 hook_log_response,
+                dns_cache=self._dns_cache,
             )
             if self.using_tor_proxy and not await self.check_tor_proxy(client, proxies):
                 await client.aclose()
                 raise httpx.ProxyError('Network configuration problem: not using Tor')
             self._clients[key] = client
-        return self._clients[key]
+            self.created_clients += 1
+        client = self._clients[key]
+        now = default_timer()
+        self._clients.move_to_end(key)
+        self._clients_last_use[key] = now
+        self.evict_clients(now)
+        return client
+
+    def evict_clients(self, now: float):
+        """Evict the least recently used clients above ``max_clients`` and the
+        clients unused for ``client_idle_timeout`` seconds."""
+        while self._clients and self.max_clients and len(self._clients) > self.max_clients:
+            self._evict_client(next(iter(self._clients)))
+        if self.client_idle_timeout:
+            while self._clients:
+                key = next(iter(self._clients))
+                if now - self._clients_last_use[key] < self.client_idle_timeout:
+                    break
+                self._evict_client(key)
+
+    def _evict_client(self, key: tuple):
+        client = self._clients.pop(key)
+        del self._clients_last_use[key]
+        self.evicted_clients += 1
+        task = asyncio.ensure_future(self.close_evicted_client(client))
+        self._closing_clients[task] = client
+        task.add_done_callback(lambda task: self._closing_clients.pop(task, None))
+
+    @staticmethod
+    async def close_evicted_client(client: httpx.AsyncClient):
+        """Close ``client`` once its requests are finished (a response may
+        still be streamed)."""
+        start_time = default_timer()
+        while default_timer() - start_time < EVICTED_CLIENT_GRACE:
+            connections = get_client_connections(client)
+            if all(connection.is_idle() or connection.is_closed() for connection in connections):
+                break
+            await asyncio.sleep(1)
+        try:
+            await client.aclose()
+        except httpx.HTTPError:
+            pass
+
+    def get_stats(self) -> Dict[str, int]:
+        """Returns the number of clients and connections of the network, has to
+        be called from the loop of :py:obj:`searx.network.client.get_loop`."""
+        connections = [connection for client in self._clients.values() for connection in get_client_connections(client)]
+        return {
+            'clients': len(self._clients),
+            'created_clients': self.created_clients,
+            'evicted_clients': self.evicted_clients,
+            'closing_clients': len(self._closing_clients),
+            'connections': len(connections),
+            'idle_connections': sum(1 for connection in connections if connection.is_idle()),
+        }
 
     async def aclose(self):
         async def close_client(client):
@@ -213,7 +408,11 @@ class Network:
             except httpx.HTTPError:
                 pass
 
-        await asyncio.gather(*[close_client(client) for client in self._clients.values()], return_exceptions=False)
+        clients = list(self._clients.values())
+        for task, client in list(self._closing_clients.items()):
+            task.cancel()
+            clients.append(client)
+        await asyncio.gather(*[close_client(client) for client in clients], return_exceptions=False)
 
     @staticmethod
     def extract_kwargs_clients(kwargs):
@@ -258,25 +457,36 @@ class Network:
             return False
         return True
 
-    async def call_client(self, stream, method, url, **kwargs):
+    async def call_client(self, stream, method, url, **kwargs):  # pylint: disable=too-many-branches
         retries = self.retries
         was_disconnected = False
         do_raise_for_httperror = Network.extract_do_raise_for_httperror(kwargs)
         kwargs_clients = Network.extract_kwargs_clients(kwargs)
         while retries >= 0:  # pragma: no cover
-            client = await self.get_client(**kwargs_clients)
+            client, key = await self.get_client_and_key(**kwargs_clients)
+            # outcome of the request for the health of the source address and proxy,
+            # a failure if the latency is None (the streamed responses are not recorded)
+            record, latency, blocked = not stream, None, False
+            start_time = default_timer()
             try:
                 if stream:
                     response = client.stream(method, url, **kwargs)
                 else:
                     response = await client.request(method, url, **kwargs)
+                    latency = default_timer() - start_time
+                    blocked = response.status_code == 429
                 if self.is_valid_response(response) or retries <= 0:
                     return Network.patch_response(response, do_raise_for_httperror)
+            except SearxEngineAccessDeniedException:
+                # CAPTCHA or access denied detected by raise_for_httperror
+                blocked = True
+                raise
             except httpx.RemoteProtocolError as e:
                 if not was_disconnected:
                     # the server has closed the connection:
                     # try again without decreasing the retries variable & with a new HTTP client
                     was_disconnected = True
+                    record = False
                     await client.aclose()
                     self._logger.warning('httpx.RemoteProtocolError: the server has disconnected, retrying')
                     continue
@@ -285,6 +495,9 @@ class Network:
             except (httpx.RequestError, httpx.HTTPStatusError) as e:
                 if retries <= 0:
                     raise e
+            finally:
+                if record:
+                    self.record_request(key, url, None if blocked else latency, blocked)
             retries -= 1
 
     async def request(self, method, url, **kwargs):
@@ -302,6 +515,52 @@ def get_network(name=None):
     return NETWORKS.get(name or DEFAULT_NAME)
 
 
+def _get_result(future: concurrent.futures.Future, timeout: float):
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def get_network_stats(timeout: float = STATS_TIMEOUT) -> Dict[str, Dict[str, int]]:
+    """Returns the statistics of each network (see :py:obj:`Network.get_stats`),
+    the networks shared by several engines are returned once.  Raise
+    :py:obj:`concurrent.futures.TimeoutError` if the loop doesn't answer within
+    ``timeout`` seconds."""
+
+    async def get_stats():
+        result = {}
+        networks = set()
+        for name, network in NETWORKS.items():
+            if network not in networks:
+                networks.add(network)
+                result[name] = network.get_stats()
+        return result
+
+    future = asyncio.run_coroutine_threadsafe(get_stats(), get_loop())
+    return _get_result(future, timeout)
+
+
+def get_network_health(timeout: float = STATS_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+    """Returns the health of the source addresses and proxies of each network
+    (see :py:obj:`Network.get_health`), the networks without source addresses
+    nor proxies are not returned.  Raise :py:obj:`concurrent.futures.TimeoutError`
+    if the loop doesn't answer within ``timeout`` seconds."""
+
+    async def get_health():
+        result = {}
+        networks = set()
+        for name, network in NETWORKS.items():
+            if network not in networks and (network.local_addresses or network.proxies):
+                networks.add(network)
+                result[name] = network.get_health()
+        return result
+
+    future = asyncio.run_coroutine_threadsafe(get_health(), get_loop())
+    return _get_result(future, timeout)
+
+
 def check_network_configuration():
     async def check():
         exception_count = 0
@@ -345,6 +604,12 @@ def initialize(settings_engines=None, settings_outgoing=None):
         'max_redirects': settings_outgoing['max_redirects'],
         'retries': settings_outgoing['retries'],
         'retry_on_http_error': None,
+        'dns_cache_ttl': settings_outgoing['dns_cache_ttl'],
+        'dns_cache_negative_ttl': settings_outgoing['dns_cache_negative_ttl'],
+        'max_clients': settings_outgoing['max_clients'],
+        'client_idle_timeout': settings_outgoing['client_idle_timeout'],
+        'quarantine_time': settings_outgoing['quarantine_time'],
+        'quarantine_failures': settings_outgoing['quarantine_failures'],
     }
 
     def new_network(params, logger_name=None):
@@ -403,6 +668,10 @@ def initialize(settings_engines=None, settings_outgoing=None):
         image_proxy_params['enable_http2'] = False
         NETWORKS['image_proxy'] = new_network(image_proxy_params, logger_name='image_proxy')
 
+    # open the connections to the engines in the background
+    engine_names = [engine_name for engine_name, _, _ in iter_networks()]
+    warmup.start(warmup.get_origins(NETWORKS, engines, engine_names), settings_outgoing)
+
 
 @atexit.register
 def done():
@@ -415,6 +684,7 @@ def done():
     So Network.aclose is called here using atexit.register
     """
     try:
+        warmup.stop()
         loop = get_loop()
         if loop:
             future = asyncio.run_coroutine_threadsafe(Network.aclose_all(), loop)
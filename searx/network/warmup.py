@@ -0,0 +1,183 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Warm-up of the connection pools.
+
+After a restart, the first searches open the TCP connections and do the TLS
+handshakes with all the engines.  When ``warmup`` is enabled (see
+:ref:`settings outgoing`), :py:obj:`searx.network.initialize` opens the
+connections before the first search:
+
+- the *origin* of an enabled online engine is the scheme and the host of its
+  ``search_url``, ``base_url`` or ``url`` (see :py:obj:`get_engine_origin`).
+- ``HEAD`` requests are sent to each origin with the clients of the
+  :py:obj:`Network <searx.network.network.Network>` of the engine (see
+  :py:obj:`Network.get_clients <searx.network.network.Network.get_clients>`:
+  the rotation of the source addresses and proxies is not changed) and the
+  ``User-Agent`` of the engines.  The response doesn't matter: the connection
+  stays in the pool.
+- the requests only open the missing connections: a client with ``connections``
+  open connections (idle or in use) to an origin doesn't send a request to it.
+- every ``interval`` seconds, the missing connections are opened again: the
+  connections closed by the server or after ``keepalive_expiry`` are replaced.
+- at most ``concurrency`` requests are sent at the same time.
+
+The warm-up runs in the background on the loop of
+:py:obj:`searx.network.client.get_loop`: it doesn't delay the start of the
+worker.
+"""
+
+import asyncio
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Set
+from urllib.parse import urlparse
+
+import httpx
+import httpcore
+
+from searx import logger
+from searx.utils import gen_useragent
+from .client import get_client_connections, get_loop
+
+if TYPE_CHECKING:
+    from .network import Network
+
+logger = logger.getChild('network.warmup')
+
+ORIGIN_ATTRIBUTES = ('search_url', 'base_url', 'url')
+"""The attributes of an engine which may contain the URL of its origin."""
+
+WARMUP_TASK: Optional[asyncio.Future] = None
+
+
+def get_engine_origin(engine) -> Optional[str]:
+    """Returns the origin (``scheme://host``) of ``engine`` or ``None`` if the
+    URLs of the engine are unknown or depend on the request."""
+    for attribute_name in ORIGIN_ATTRIBUTES:
+        url = getattr(engine, attribute_name, None)
+        if not isinstance(url, str):
+            continue
+        try:
+            parsed_url = urlparse(url)
+        except ValueError:
+            continue
+        if parsed_url.scheme in ('http', 'https') and parsed_url.netloc and '{' not in parsed_url.netloc:
+            return '{}://{}'.format(parsed_url.scheme, parsed_url.netloc)
+    return None
+
+
+class WarmUp:
+    """Open and keep alive ``connections`` connections to each origin."""
+
+    __slots__ = 'origins', 'connections', 'interval', 'timeout', '_semaphore'
+
+    def __init__(
+        self, origins: Dict['Network', Set[str]], connections: int, interval: float, concurrency: int, timeout: float
+    ):
+        self.origins = origins
+        self.connections = connections
+        self.interval = interval
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _ping(self, client: httpx.AsyncClient, origin: str):
+        async with self._semaphore:
+            try:
+                await client.head(origin, headers={'User-Agent': gen_useragent()}, timeout=self.timeout)
+            except httpx.HTTPError as e:
+                logger.debug('%s: %s', origin, e)
+
+    def _get_connections(self, network) -> int:
+        # no more than the keep-alive connections: the others are closed at the
+        # end of the request
+        max_keepalive_connections = network.max_keepalive_connections
+        if max_keepalive_connections is None:
+            return self.connections
+        return min(self.connections, max_keepalive_connections)
+
+    @staticmethod
+    def _get_open_connections(client: httpx.AsyncClient, origin: str) -> int:
+        url = httpx.URL(origin)
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        httpcore_origin = httpcore.Origin(url.raw_scheme, url.raw_host, port)
+        return sum(
+            1
+            for connection in get_client_connections(client)
+            if connection.can_handle_request(httpcore_origin)
+            and not connection.is_closed()
+            and not connection.has_expired()
+        )
+
+    async def _warm_up_network(self, network, origins: Iterable[str]):
+        try:
+            clients = await network.get_clients()
+        except httpx.HTTPError as e:
+            logger.debug('%s', e)
+            return
+        connections = self._get_connections(network)
+        await asyncio.gather(
+            *[
+                self._ping(client, origin)
+                for client in clients
+                for origin in origins
+                for _ in range(connections - self._get_open_connections(client, origin))
+            ]
+        )
+
+    async def warm_up(self):
+        """Send the requests to all the origins."""
+        await asyncio.gather(*[self._warm_up_network(network, origins) for network, origins in self.origins.items()])
+
+    async def run(self):
+        """Warm up the connections pools, then keep them warm every
+        ``interval`` seconds (if ``interval`` is not ``0``)."""
+        await self.warm_up()
+        while self.interval > 0:
+            await asyncio.sleep(self.interval)
+            await self.warm_up()
+
+
+def get_origins(networks: Dict[str, 'Network'], engines: Dict, engine_names: Iterable[str]):
+    """Returns the origins of the enabled online engines grouped by network."""
+    origins: Dict['Network', Set[str]] = {}
+    for engine_name in engine_names:
+        engine = engines.get(engine_name)
+        network = networks.get(engine_name)
+        if engine is None or network is None or getattr(engine, 'disabled', False):
+            continue
+        if getattr(engine, 'engine_type', 'online') != 'online':
+            continue
+        origin = get_engine_origin(engine)
+        if origin is not None:
+            origins.setdefault(network, set()).add(origin)
+    return origins
+
+
+def start(origins: Dict['Network', Set[str]], settings_outgoing: Dict):
+    """Start the warm-up of the connection pools in the background, stop the
+    previous one."""
+    global WARMUP_TASK  # pylint: disable=global-statement
+    stop()
+    settings_warmup = settings_outgoing['warmup']
+    if not settings_warmup['enable'] or not origins:
+        return
+    loop = get_loop()
+
+    async def run():
+        warmup = WarmUp(
+            origins,
+            settings_warmup['connections'],
+            settings_warmup['interval'],
+            settings_warmup['concurrency'],
+            settings_outgoing['request_timeout'],
+        )
+        await warmup.run()
+
+    logger.debug('warm up %i origin(s)', sum(len(network_origins) for network_origins in origins.values()))
+    WARMUP_TASK = asyncio.run_coroutine_threadsafe(run(), loop)
+
+
+def stop():
+    """Stop the warm-up in the background."""
+    global WARMUP_TASK  # pylint: disable=global-statement
+    if WARMUP_TASK is not None:
+        WARMUP_TASK.cancel()
+        WARMUP_TASK = None
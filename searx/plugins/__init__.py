@@ -12,7 +12,7 @@ from pkgutil import iter_modules
 from logging import getLogger
 from typing import List, Tuple
 
-from searx import logger, settings
+from searx import logger, settings, tracing
 
 
 class Plugin:  # pylint: disable=too-few-public-methods
@@ -198,6 +198,10 @@ class PluginStore:
         self.plugins.append(plugin)
 
     def call(self, ordered_plugin_list, plugin_type, *args, **kwargs):
+        with tracing.span('plugins.' + plugin_type):
+            return self._call(ordered_plugin_list, plugin_type, *args, **kwargs)
+
+    def _call(self, ordered_plugin_list, plugin_type, *args, **kwargs):
         ret = True
         for plugin in ordered_plugin_list:
             if hasattr(plugin, plugin_type):
@@ -1,11 +1,12 @@
 import re
 from collections import defaultdict
+from itertools import chain
 from operator import itemgetter
 from threading import RLock
-from typing import List, NamedTuple, Set
+from typing import Dict, List, NamedTuple, Set
 from urllib.parse import urlparse, unquote
 
-from searx import logger
+from searx import logger, tracing
 from searx.engines import engines
 from searx.metrics import histogram_observe, counter_add, count_error
 
@@ -55,6 +56,26 @@ def compare_urls(url_a, url_b):
     return unquote(path_a) == unquote(path_b)
 
 
+def result_url_key(result):
+    """Returns the key to find the duplicates of a result with an URL.
+
+    Two results are duplicates when their URL are equals according to
+    :py:obj:`compare_urls` and when they use the same template.  Two images
+    (``images.html`` template) are duplicates when in addition the ``img_src``
+    are equals.
+    """
+    parsed_url = result['parsed_url']
+    # ignore www. in comparison
+    host = parsed_url.netloc
+    if host.startswith('www.'):
+        host = host[4:]
+    # remove / from the end of the url if required
+    path = parsed_url.path[:-1] if parsed_url.path.endswith('/') else parsed_url.path
+    template = result.get('template')
+    img_src = result.get('img_src', '') if template == 'images.html' else None
+    return (host, unquote(path), parsed_url.query, parsed_url.fragment, template, img_src)
+
+
 def merge_two_infoboxes(infobox1, infobox2):
     # get engines weights
     if hasattr(engines[infobox1['engine']], 'weight'):
@@ -151,11 +172,86 @@ class UnresponsiveEngine(NamedTuple):
     suspended: bool
 
 
+class _ResultGroup:
+    """A group of results of :py:obj:`group_results`."""
+
+    __slots__ = 'results', 'count', 'after'
+
+    def __init__(self, result: dict):
+        self.results = [result]
+        # number of results the group can accept
+        self.count = 8
+        # number of results after the group
+        self.after = 0
+
+
+def group_results(results: List[dict]) -> List[dict]:
+    """Group the (sorted) ``results`` by category and template.
+
+    A result joins the previous group of the same category if the group can
+    accept more results (at most 8 results are added to a group) and is not too
+    far from the current position (less than 20 results after the group),
+    otherwise a new group is started at the end.
+
+    The groups are stored in separated lists which are concatenated at the end:
+    the cost is linear in the number of results.
+    """
+    # the groups (a list of results) in the order of the output
+    blocks: List[List[dict]] = []
+    # last group of each category
+    groups: Dict[str, _ResultGroup] = {}
+    # groups which can accept more results, in the order of the output
+    open_groups: List[_ResultGroup] = []
+
+    for res in results:
+        # FIXME : handle more than one category per engine
+        category = (
+            res['category']
+            + ':'
+            + res.get('template', '')
+            + ':'
+            + ('img_src' if 'img_src' in res or 'thumbnail' in res else '')
+        )
+
+        current = groups.get(category)
+
+        if current is not None and current.count > 0 and current.after < 20:
+            # group with the previous results using the same category with
+            # this one: the result is added after the other results of the
+            # group, so there is one more result after the previous groups.
+            current.results.append(res)
+            current.count -= 1
+            for group in open_groups:
+                if group is current:
+                    break
+                group.after += 1
+            if current.count == 0:
+                open_groups.remove(current)
+        else:
+            # new group at the end
+            for group in open_groups:
+                group.after += 1
+            current = _ResultGroup(res)
+            blocks.append(current.results)
+            groups[category] = current
+            open_groups.append(current)
+
+        # the number of results after a group can only increase and it is
+        # larger for the first groups: the groups which are too far are at the
+        # beginning of open_groups.  There are less than 20 results after an
+        # open group, so there are at most 20 open groups.
+        while open_groups and open_groups[0].after >= 20:
+            del open_groups[0]
+
+    return list(chain.from_iterable(blocks))
+
+
 class ResultContainer:
     """docstring for ResultContainer"""
 
     __slots__ = (
         '_merged_results',
+        '_merged_results_by_url',
         'infoboxes',
         'suggestions',
         'answers',
@@ -168,12 +264,14 @@ class ResultContainer:
         'redirect_url',
         'engine_data',
         'on_result',
+        'on_extend',
         '_lock',
     )
 
     def __init__(self):
         super().__init__()
         self._merged_results = []
+        self._merged_results_by_url = {}
         self.infoboxes = []
         self.suggestions = set()
         self.answers = {}
@@ -186,14 +284,19 @@ class ResultContainer:
         self.timings: List[Timing] = []
         self.redirect_url = None
         self.on_result = lambda _: True
+        self.on_extend = None
         self._lock = RLock()
 
     def extend(self, engine_name, results):
         if self._closed:
             return
+        with tracing.span('results.extend', engine=engine_name):
+            self._extend(engine_name, results)
 
+    def _extend(self, engine_name, results):
         standard_result_count = 0
         error_msgs = set()
+        extended_results = []
         for result in list(results):
             result['engine'] = engine_name
             if 'suggestion' in result and self.on_result(result):
@@ -223,6 +326,15 @@ class ResultContainer:
             elif self.on_result(result):
                 self.__merge_result_no_url(result, standard_result_count + 1)
                 standard_result_count += 1
+            else:
+                continue
+            extended_results.append(result)
+
+        if self.on_extend is not None:
+            # the lock makes sure the merged results are not modified while
+            # on_extend reads them
+            with tracing.span('results.on_extend'), self._lock:
+                self.on_extend(engine_name, extended_results)
 
         if len(error_msgs) > 0:
             for msg in error_msgs:
@@ -292,8 +404,9 @@ class ResultContainer:
 
     def __merge_url_result(self, result, position):
         result['engines'] = set([result['engine']])
+        url_key = result_url_key(result)
         with self._lock:
-            duplicated = self.__find_duplicated_http_result(result)
+            duplicated = self._merged_results_by_url.get(url_key)
             if duplicated:
                 self.__merge_duplicated_http_result(duplicated, result, position)
                 return
@@ -301,24 +414,7 @@ class ResultContainer:
             # if there is no duplicate found, append result
             result['positions'] = [position]
             self._merged_results.append(result)
-
-    def __find_duplicated_http_result(self, result):
-        result_template = result.get('template')
-        for merged_result in self._merged_results:
-            if 'parsed_url' not in merged_result:
-                continue
-            if compare_urls(result['parsed_url'], merged_result['parsed_url']) and result_template == merged_result.get(
-                'template'
-            ):
-                if result_template != 'images.html':
-                    # not an image, same template, same url : it's a duplicate
-                    return merged_result
-                else:
-                    # it's an image
-                    # it's a duplicate if the parsed_url, template and img_src are different
-                    if result.get('img_src', '') == merged_result.get('img_src', ''):
-                        return merged_result
-        return None
+            self._merged_results_by_url[url_key] = result
 
     def __merge_duplicated_http_result(self, duplicated, result, position):
         # using content with more text
@@ -359,53 +455,13 @@ class ResultContainer:
         results = sorted(self._merged_results, key=itemgetter('score'), reverse=True)
 
         # pass 2 : group results by category and template
-        gresults = []
-        categoryPositions = {}
-
         for res in results:
             # FIXME : handle more than one category per engine
             engine = engines[res['engine']]
             res['category'] = engine.categories[0] if len(engine.categories) > 0 else ''
 
-            # FIXME : handle more than one category per engine
-            category = (
-                res['category']
-                + ':'
-                + res.get('template', '')
-                + ':'
-                + ('img_src' if 'img_src' in res or 'thumbnail' in res else '')
-            )
-
-            current = None if category not in categoryPositions else categoryPositions[category]
-
-            # group with previous results using the same category
-            # if the group can accept more result and is not too far
-            # from the current position
-            if current is not None and (current['count'] > 0) and (len(gresults) - current['index'] < 20):
-                # group with the previous results using
-                # the same category with this one
-                index = current['index']
-                gresults.insert(index, res)
-
-                # update every index after the current one
-                # (including the current one)
-                for k in categoryPositions:
-                    v = categoryPositions[k]['index']
-                    if v >= index:
-                        categoryPositions[k]['index'] = v + 1
-
-                # update this category
-                current['count'] -= 1
-
-            else:
-                # same category
-                gresults.append(res)
-
-                # update categoryIndex
-                categoryPositions[category] = {'index': len(gresults), 'count': 8}
-
         # update _merged_results
-        self._merged_results = gresults
+        self._merged_results = group_results(results)
 
     def get_ordered_results(self):
         if not self._closed:
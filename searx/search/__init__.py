@@ -2,25 +2,29 @@
 # lint: pylint
 # pylint: disable=missing-module-docstring, too-few-public-methods
 
-import threading
+from concurrent.futures import wait, ALL_COMPLETED, FIRST_COMPLETED
 from copy import copy
 from timeit import default_timer
-from uuid import uuid4
+from typing import List, Tuple
 
 import flask
 import babel
 
-from searx import settings
+from searx import settings, tracing
 from searx.answerers import ask
 from searx.external_bang import get_bang_url
 from searx.results import ResultContainer
 from searx import logger
 from searx.plugins import plugins
 from searx.search.models import EngineRef, SearchQuery
-from searx.engines import load_engines
+from searx.engines import load_engines, engines
 from searx.network import initialize as initialize_network, check_network_configuration
-from searx.metrics import initialize as initialize_metrics, counter_inc, histogram_observe_time
+from searx.metrics import initialize as initialize_metrics, counter_inc, histogram, histogram_observe_time
 from searx.search.processors import PROCESSORS, initialize as initialize_processors
+from searx.search.cache import initialize as initialize_cache
+from searx.search.executor import initialize as initialize_executor, get_executor
+from searx.search.prefetch import prefetch_next_page
+from searx.search.singleflight import SINGLE_FLIGHT, ResultRecorder, get_flight_key
 from searx.search.checker import initialize as initialize_checker
 from searx.utils import detect_language
 
@@ -35,6 +39,8 @@ def initialize(settings_engines=None, enable_checker=False, check_network=False,
     if check_network:
         check_network_configuration()
     initialize_metrics([engine['name'] for engine in settings_engines], enable_metrics)
+    initialize_cache(settings['search']['response_cache']['maxsize'])
+    initialize_executor(settings['search']['max_workers'])
     initialize_processors(settings_engines)
     if enable_checker:
         initialize_checker()
@@ -67,6 +73,29 @@ def replace_auto_language(search_query: SearchQuery):
         search_query.locale = None
 
 
+def get_adaptive_timeout(engine_name: str, timeout: float) -> float:
+    """Returns the timeout of the engine ``engine_name`` derived from its response
+    times (see ``adaptive_timeout`` in :ref:`settings outgoing`).
+
+    The timeout is the ``percentile`` of the response times multiplied by
+    ``factor``, at least ``min_timeout`` and at most ``timeout`` (the timeout of
+    the engine).  ``timeout`` is returned as long as there are less than
+    ``min_samples`` response times (in the sliding ``window`` if set).
+    """
+    adaptive_timeout = settings['outgoing']['adaptive_timeout']
+    time_total = histogram('engine', engine_name, 'time', 'total', raise_on_not_found=False)
+    if time_total is None:
+        return timeout
+    time_total = time_total.snapshot(adaptive_timeout['window'])
+    if time_total.count < adaptive_timeout['min_samples']:
+        return timeout
+    percentile = time_total.percentage(adaptive_timeout['percentile'])
+    if percentile is None:
+        return timeout
+    engine_timeout = max(adaptive_timeout['min_timeout'], float(percentile) * adaptive_timeout['factor'])
+    return min(timeout, engine_timeout)
+
+
 class Search:
     """Search information container"""
 
@@ -120,9 +149,10 @@ class Search:
         return False
 
     # do search-request
-    def _get_requests(self):
+    def _get_requests(self) -> Tuple[List[Tuple], float]:
         # init vars
         requests = []
+        adaptive_timeout = settings['outgoing']['adaptive_timeout']['enable']
 
         # max of all selected engine timeout
         default_timeout = 0
@@ -131,22 +161,32 @@ class Search:
         for engineref in self.search_query.engineref_list:
             processor = PROCESSORS[engineref.name]
 
-            # stop the request now if the engine is suspend
-            if processor.extend_container_if_suspended(self.result_container):
-                continue
-
             # set default request parameters
             request_params = processor.get_params(self.search_query, engineref.category)
             if request_params is None:
                 continue
 
+            # answer the request from the cache of the engine responses
+            if processor.extend_container_if_cached(self.result_container, self.search_query.query, request_params):
+                continue
+
+            # stop the request now if the engine is suspend (the last check: in
+            # the half-open state, the request is the probe of the engine)
+            if processor.extend_container_if_suspended(self.result_container):
+                continue
+
             counter_inc('engine', engineref.name, 'search', 'count', 'sent')
 
+            # timeout of the engine
+            engine_timeout = processor.engine.timeout
+            if adaptive_timeout:
+                engine_timeout = get_adaptive_timeout(engineref.name, engine_timeout)
+
             # append request to list
-            requests.append((engineref.name, self.search_query.query, request_params))
+            requests.append((engineref.name, self.search_query.query, request_params, engine_timeout))
 
             # update default_timeout
-            default_timeout = max(default_timeout, processor.engine.timeout)
+            default_timeout = max(default_timeout, engine_timeout)
 
         # adjust timeout
         max_request_timeout = settings['outgoing']['max_request_timeout']
@@ -172,50 +212,128 @@ class Search:
             )
         )
 
+        # timeout of each request: with adaptive timeouts, an engine doesn't
+        # wait for the slowest engine.
+        requests = [
+            (
+                engine_name,
+                query,
+                request_params,
+                min(engine_timeout, actual_timeout) if adaptive_timeout else actual_timeout,
+            )
+            for engine_name, query, request_params, engine_timeout in requests
+        ]
+
         return requests, actual_timeout
 
     def search_multiple_requests(self, requests):
-        # pylint: disable=protected-access
-        search_id = str(uuid4())
-
-        for engine_name, query, request_params in requests:
-            th = threading.Thread(  # pylint: disable=invalid-name
-                target=PROCESSORS[engine_name].search,
-                args=(query, request_params, self.result_container, self.start_time, self.actual_timeout),
-                name=search_id,
+        executor = get_executor()
+        # list of (task, deadline)
+        pending = []
+        for engine_name, query, request_params, timeout_limit in requests:
+            processor = PROCESSORS[engine_name]
+            # the request is the probe of a half-open circuit: a request which
+            # is not sent lets an other request probe the engine
+            circuit_breaker = processor.circuit_breaker
+            task = executor.submit(
+                engine_name,
+                processor.search,
+                query,
+                request_params,
+                self.result_container,
+                self.start_time,
+                timeout_limit,
+                release=None if circuit_breaker.is_closed else circuit_breaker.release,
             )
-            th._timeout = False
-            th._engine_name = engine_name
-            th.start()
-
-        for th in threading.enumerate():  # pylint: disable=invalid-name
-            if th.name == search_id:
-                remaining_time = max(0.0, self.actual_timeout - (default_timer() - self.start_time))
-                th.join(remaining_time)
-                if th.is_alive():
-                    th._timeout = True
-                    self.result_container.add_unresponsive_engine(th._engine_name, 'timeout')
-                    PROCESSORS[th._engine_name].logger.error('engine timeout')
+            pending.append((task, self.start_time + timeout_limit))
+
+        # with a quorum, the search returns once enough engines have answered
+        quorum = settings['search']['quorum']
+        return_when = FIRST_COMPLETED if quorum['engines'] or quorum['results'] else ALL_COMPLETED
+
+        # wait for the requests until the deadline of each engine
+        while pending:
+            deadline = min(task_deadline for _, task_deadline in pending)
+            wait([task.future for task, _ in pending], max(0.0, deadline - default_timer()), return_when)
+            if return_when == FIRST_COMPLETED and self._is_quorum_reached(quorum):
+                for task, _ in pending:
+                    if not task.future.done():
+                        task.drop()
+                break
+            now = default_timer()
+            not_done = []
+            for task, task_deadline in pending:
+                if task.future.done():
+                    continue
+                if task_deadline > now:
+                    not_done.append((task, task_deadline))
+                    continue
+                task.set_timeout()
+                self.result_container.add_unresponsive_engine(task.engine_name, 'timeout')
+                PROCESSORS[task.engine_name].logger.error('engine timeout')
+            pending = not_done
+
+    def _is_quorum_reached(self, quorum) -> bool:
+        if quorum['engines'] and len(self.result_container.timings) >= quorum['engines']:
+            return True
+        if quorum['results'] and self.result_container.results_length() >= quorum['results']:
+            return True
+        return False
 
     def search_standard(self):
         """
         Update self.result_container, self.actual_timeout
         """
+        if not settings['search']['single_flight']:
+            return self._search_standard()
+
+        key = get_flight_key(self.search_query)
+        flight, leader = SINGLE_FLIGHT.join(key)
+        if not leader:
+            # an identical search is in progress: wait for its results
+            if flight.wait(self._get_flight_timeout()) and flight.shareable:
+                counter_inc('search', 'single_flight', 'shared')
+                flight.replay(self.result_container)
+                self.actual_timeout = flight.actual_timeout
+                return True
+            return self._search_standard()
+
+        result_container = self.result_container
+        self.result_container = ResultRecorder(result_container, flight)
+        try:
+            return self._search_standard()
+        finally:
+            self.result_container = result_container
+            flight.actual_timeout = self.actual_timeout
+            SINGLE_FLIGHT.leave(key, flight)
+
+    def _get_flight_timeout(self) -> float:
+        # the search of the leader returns after the timeout of its slowest
+        # engine (or the timeout of the query)
+        timeouts = [engines[engineref.name].timeout for engineref in self.search_query.engineref_list]
+        timeouts.append(self.search_query.timeout_limit or 0)
+        return max(timeouts) + 1.0
+
+    def _search_standard(self):
         requests, self.actual_timeout = self._get_requests()
 
         # send all search-request
         if requests:
             self.search_multiple_requests(requests)
 
+        # send the requests of the next page in the background
+        prefetch_next_page(self.search_query, self.result_container)
+
         # return results, suggestions, answers and infoboxes
         return True
 
     # do search-request
     def search(self) -> ResultContainer:
         self.start_time = default_timer()
-        if not self.search_external_bang():
-            if not self.search_answerers():
-                self.search_standard()
+        with tracing.span('search'):
+            if not self.search_external_bang():
+                if not self.search_answerers():
+                    self.search_standard()
         return self.result_container
 
 
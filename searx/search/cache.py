@@ -0,0 +1,169 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Cache of the engine responses.
+
+An identical request to an engine (same query, page number, language, safe
+search, time range ..) is answered from this cache as long as the cached entry
+has not expired: the HTTP round-trip to the engine and the parsing of the
+response are skipped.
+
+The entries are stored in an in-process LRU (:py:obj:`ResponseCache`).  If a
+redis DB is configured (:ref:`settings redis`), the entries are stored in the
+redis DB as well, so all worker processes share the same cache.
+
+The cache is disabled by default, the time-to-live of the entries is set in
+:ref:`settings search`:
+
+.. code:: yaml
+
+   search:
+     response_cache:
+       ttl: 0          # in seconds, 0 disables the cache
+       maxsize: 1000   # maximum number of entries in the in-process LRU
+
+and can be overridden by the ``cache_ttl`` option of an engine (see
+:ref:`settings engine`).
+
+"""
+
+import pickle
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from timeit import default_timer
+from typing import Any, List, Optional, Tuple
+
+import redis
+
+from searx import logger, redisdb, redislib
+
+logger = logger.getChild('search.cache')
+
+REDIS_KEY_PREFIX = 'SearXNG_response_cache_'
+
+
+def get_cache_key(engine_name: str, query: str, params: dict) -> Tuple:
+    """Returns the key of the cache entry for the request ``params`` (see
+    :py:obj:`searx.search.processors.EngineProcessor.get_params`) sent to the
+    engine ``engine_name``.
+
+    The key has to be computed before the engine has updated the ``params``.
+    """
+    return (
+        engine_name,
+        query,
+        params.get('category'),
+        params.get('pageno'),
+        params.get('safesearch'),
+        params.get('time_range'),
+        params.get('searxng_locale'),
+        params.get('language'),
+        tuple(sorted(params.get('engine_data', {}).items())),
+    )
+
+
+def get_prefetch_key(cache_key: Tuple) -> Tuple:
+    """Returns the key of the prefetched response of the request ``cache_key``
+    (see :py:obj:`searx.search.prefetch`)."""
+    return ('prefetch',) + cache_key
+
+
+class ResponseCache:
+    """In-process LRU of the engine results, backed by the redis DB (if
+    available).
+
+    The stored results are deep copies: the :py:obj:`searx.results.ResultContainer`
+    modifies the results it merges.
+    """
+
+    __slots__ = 'maxsize', '_entries', '_lock'
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Tuple, Tuple[float, List[dict]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, key: Tuple) -> Optional[List[dict]]:
+        """Returns a copy of the cached results or ``None`` if there is no valid
+        entry for ``key``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expire_time, results = entry
+                if expire_time > default_timer():
+                    self._entries.move_to_end(key)
+                    return deepcopy(results)
+                del self._entries[key]
+
+        results, ttl = self._redis_get(key)
+        if results is None:
+            return None
+        self._set_local(key, results, ttl)
+        return deepcopy(results)
+
+    def set(self, key: Tuple, results: List[dict], ttl: float):
+        """Store a copy of ``results`` for ``ttl`` seconds."""
+        if ttl <= 0:
+            return
+        try:
+            results = deepcopy(results)
+        except (TypeError, pickle.PicklingError) as e:
+            logger.debug('results of %s are not cacheable: %s', key[0], e)
+            return
+        self._set_local(key, results, ttl)
+        self._redis_set(key, results, ttl)
+
+    def _set_local(self, key: Tuple, results: List[dict], ttl: float):
+        with self._lock:
+            self._entries[key] = (default_timer() + ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _redis_key(key: Tuple) -> str:
+        return REDIS_KEY_PREFIX + redislib.secret_hash(repr(key))
+
+    def _redis_get(self, key: Tuple) -> Tuple[Any, float]:
+        client = redisdb.client()
+        if client is None:
+            return None, 0
+        redis_key = self._redis_key(key)
+        try:
+            with client.pipeline() as pipe:
+                value, ttl = pipe.get(redis_key).pttl(redis_key).execute()
+            if value is None or ttl <= 0:
+                return None, 0
+            return pickle.loads(value), ttl / 1000
+        except (redis.exceptions.RedisError, pickle.UnpicklingError) as e:
+            logger.debug('redis: %s', e)
+            return None, 0
+
+    def _redis_set(self, key: Tuple, results: List[dict], ttl: float):
+        client = redisdb.client()
+        if client is None:
+            return
+        try:
+            client.set(self._redis_key(key), pickle.dumps(results), px=int(ttl * 1000))
+        except (redis.exceptions.RedisError, pickle.PicklingError, TypeError) as e:
+            logger.debug('redis: %s', e)
+
+
+RESPONSE_CACHE = ResponseCache()
+"""The cache of the engine responses, see :py:obj:`initialize`.
+
+:meta hide-value:
+"""
+
+
+def initialize(maxsize: int):
+    """Set the size of the in-process LRU and drop all cached entries."""
+    RESPONSE_CACHE.clear()
+    RESPONSE_CACHE.maxsize = maxsize
@@ -0,0 +1,181 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Bounded pool of worker threads sending the requests to the engines.
+
+All searches share the same pool (:py:obj:`get_executor`), the number of
+threads is limited by ``max_workers`` in :ref:`settings search`.  A request that
+is submitted while all workers are busy waits in the queue of the pool.
+
+Metrics:
+
+- ``search.pool.queue``: histogram of the number of queued requests, observed
+  when a request is submitted.
+- ``search.pool.saturated``: number of requests submitted while all workers were
+  busy.
+
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from timeit import default_timer
+from typing import Callable, Optional
+
+import searx.network
+from searx import logger, tracing
+from searx.metrics import counter_inc, histogram_observe
+
+logger = logger.getChild('search.executor')
+
+
+class EngineTask:
+    """A request to an engine submitted to the :py:obj:`SearchExecutor`."""
+
+    __slots__ = 'engine_name', 'future', 'thread', 'timeout', 'dropped', 'lock', 'release'
+
+    def __init__(self, engine_name: str, release: Optional[Callable] = None):
+        self.engine_name = engine_name
+        # called if the task is not run (the probe of a circuit breaker)
+        self.release = release
+        self.future: Optional[Future] = None
+        self.thread: Optional[threading.Thread] = None
+        self.timeout = False
+        self.dropped = False
+        self.lock = threading.Lock()
+
+    def set_timeout(self):
+        """The search has stopped waiting for this task.
+
+        A queued task is cancelled.  For a running task, the ``_timeout``
+        attribute of the worker thread is set: the processor drops the results
+        and records the timeout (see
+        :py:obj:`searx.search.processors.EngineProcessor.extend_container`).
+        """
+        with self.lock:
+            self.timeout = True
+            if self.thread is not None:
+                self.thread._timeout = True  # pylint: disable=protected-access
+        self._cancel()
+
+    def drop(self):
+        """The search has returned without this task (see ``quorum`` in
+        :ref:`settings search`).
+
+        A queued task is cancelled.  A running task is not interrupted: the
+        ``_drop`` attribute of the worker thread is set, the processor records
+        the metrics of the engine and drops the results.
+        """
+        with self.lock:
+            self.dropped = True
+            if self.thread is not None:
+                self.thread._drop = True  # pylint: disable=protected-access
+        self._cancel()
+
+    def _cancel(self):
+        if self.future.cancel():
+            self._release()
+
+    def _release(self):
+        if self.release is not None:
+            self.release()
+
+    def run(self, func: Callable, *args):
+        thread = threading.current_thread()
+        with self.lock:
+            if self.timeout or self.dropped:
+                # the task has been cancelled while it was starting
+                self._release()
+                return
+            self.thread = thread
+            thread._timeout = False  # pylint: disable=protected-access
+            thread._drop = False  # pylint: disable=protected-access
+        try:
+            func(*args)
+        finally:
+            with self.lock:
+                self.thread = None
+                thread._timeout = False  # pylint: disable=protected-access
+                thread._drop = False  # pylint: disable=protected-access
+            # the worker thread is reused by the requests of the other engines
+            searx.network.clear_context_for_thread()
+
+
+class SearchExecutor:
+    """Thread pool with at most ``max_workers`` threads."""
+
+    __slots__ = 'max_workers', '_executor', '_lock', '_queued', '_running'
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of submitted tasks waiting for a worker."""
+        return max(0, self._running + self._queued - self.max_workers)
+
+    @property
+    def running(self) -> int:
+        """Number of busy workers."""
+        return self._running
+
+    @property
+    def idle_workers(self) -> int:
+        """Number of workers available for a new task."""
+        return max(0, self.max_workers - self._running - self._queued)
+
+    def submit(self, engine_name: str, func: Callable, *args, release: Optional[Callable] = None) -> EngineTask:
+        """Call ``func(*args)`` in a worker thread.  ``release`` is called if the
+        task is cancelled before ``func`` is called."""
+        task = EngineTask(engine_name, release)
+        with self._lock:
+            saturated = self._running + self._queued >= self.max_workers
+            self._queued += 1
+        if saturated:
+            counter_inc('search', 'pool', 'saturated')
+        histogram_observe(self.queue_depth, 'search', 'pool', 'queue')
+        # the span of the search is the parent of the span of the engine
+        parent_span = tracing.get_current_span()
+        task.future = self._executor.submit(self._run, task, parent_span, default_timer(), func, *args)
+        task.future.add_done_callback(self._on_done)
+        return task
+
+    def _run(self, task: EngineTask, parent_span, submitted: float, func: Callable, *args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            with tracing.activate(parent_span):
+                tracing.add_span('search.queue', submitted, default_timer(), engine=task.engine_name)
+                with tracing.span('engine', engine=task.engine_name):
+                    task.run(func, *args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _on_done(self, future: Future):
+        if future.cancelled():
+            # the task was removed from the queue without being run
+            with self._lock:
+                self._queued -= 1
+
+    def shutdown(self):
+        """Do not accept new tasks; the queued and running tasks are finished."""
+        self._executor.shutdown(wait=False)
+
+
+EXECUTOR: Optional[SearchExecutor] = None
+
+
+def get_executor() -> SearchExecutor:
+    return EXECUTOR
+
+
+def initialize(max_workers: int):
+    global EXECUTOR  # pylint: disable=global-statement
+    if EXECUTOR is not None:
+        EXECUTOR.shutdown()
+    logger.debug('max_workers=%i', max_workers)
+    EXECUTOR = SearchExecutor(max_workers)
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Prefetch of the next page.
+
+Once a page of results is served, the request of the next page is sent in the
+background to the engines which support paging.  The responses are stored in the
+:py:obj:`searx.search.cache.RESPONSE_CACHE` for ``prefetch_ttl`` seconds (see
+:ref:`settings search`), the request of the next page is answered from the cache.
+
+The prefetch has a low priority: the requests are only sent while more than half
+of the workers of the :py:obj:`searx.search.executor` are idle.  The requests
+are only sent to the engines with a closed circuit breaker, an engine which
+answers to a prefetch request with an error (too many requests, CAPTCHA ..) is
+suspended as usual.
+
+Metrics:
+
+- ``search.prefetch.sent``: number of prefetch requests.
+- ``search.prefetch.successful`` and ``search.prefetch.error``: outcome of the
+  prefetch requests.
+- ``search.prefetch.hit``: number of requests answered by a prefetched response.
+
+The hit rate is ``hit / sent``.  The prefetch requests are not counted in the
+metrics of the engines (count of the searches, errors, time histograms): the
+statistics, the reliability and the adaptive timeouts only describe the
+searches of the users.
+"""
+
+import threading
+from copy import copy
+from timeit import default_timer
+
+from searx import logger, settings
+from searx.metrics import counter_inc
+from searx.search.cache import RESPONSE_CACHE, get_cache_key, get_prefetch_key
+from searx.search.executor import get_executor
+from searx.search.models import SearchQuery
+from searx.search.processors import PROCESSORS, OnlineProcessor
+
+logger = logger.getChild('search.prefetch')
+
+
+class PrefetchResults:
+    """Receives the results of a prefetch request in place of a
+    :py:obj:`searx.results.ResultContainer`."""
+
+    __slots__ = ('results',)
+
+    def __init__(self):
+        self.results = None
+
+    def extend(self, engine_name, results):  # pylint: disable=unused-argument
+        self.results = list(results)
+
+    def add_timing(self, *args):
+        pass
+
+    def add_unresponsive_engine(self, *args, **kwargs):
+        pass
+
+
+def _prefetch(processor: OnlineProcessor, query: str, params: dict, cache_key, ttl: float):
+    prefetch_results = PrefetchResults()
+    # the processor records the metrics of the prefetch (see
+    # searx.search.processors.EngineProcessor.extend_container)
+    thread = threading.current_thread()
+    thread._prefetch = True  # pylint: disable=protected-access
+    try:
+        processor.search(query, params, prefetch_results, default_timer(), processor.engine.timeout)
+    finally:
+        thread._prefetch = False  # pylint: disable=protected-access
+    if prefetch_results.results:
+        RESPONSE_CACHE.set(cache_key, prefetch_results.results, ttl)
+
+
+def prefetch_next_page(search_query: SearchQuery, result_container):
+    """Send the requests of the page after ``search_query`` to the engines
+    which have answered to ``search_query`` (see ``prefetch_ttl`` in
+    :ref:`settings search`).  The function doesn't wait for the responses."""
+    ttl = settings['search']['prefetch_ttl']
+    if not ttl:
+        return
+
+    executor = get_executor()
+    unresponsive_engines = {unresponsive.engine for unresponsive in result_container.unresponsive_engines}
+
+    next_query = copy(search_query)
+    next_query.pageno += 1
+    # the next page request contains the engine_data of this page (see the
+    # engine_data_form macro of the templates)
+    next_query.engine_data = {name: dict(data) for name, data in result_container.engine_data.items()}
+
+    for engineref in search_query.engineref_list:
+        # low priority: keep half of the workers for the searches
+        if executor.idle_workers <= executor.max_workers // 2:
+            break
+        processor = PROCESSORS.get(engineref.name)
+        if not isinstance(processor, OnlineProcessor) or not processor.engine.paging:
+            continue
+        if engineref.name in unresponsive_engines or not processor.circuit_breaker.is_closed:
+            continue
+        params = processor.get_params(next_query, engineref.category)
+        if params is None:
+            continue
+        cache_key = get_prefetch_key(get_cache_key(engineref.name, next_query.query, params))
+        if RESPONSE_CACHE.get(cache_key) is not None:
+            continue
+        counter_inc('search', 'prefetch', 'sent')
+        executor.submit(engineref.name, _prefetch, processor, next_query.query, params, cache_key, ttl)
@@ -26,7 +26,7 @@ from .offline import OfflineProcessor
 from .online_dictionary import OnlineDictionaryProcessor
 from .online_currency import OnlineCurrencyProcessor
 from .online_url_search import OnlineUrlSearchProcessor
-from .abstract import EngineProcessor
+from .abstract import EngineProcessor, CIRCUIT_BREAKERS
 
 logger = logger.getChild('search.processors')
 PROCESSORS: Dict[str, EngineProcessor] = {}
@@ -71,6 +71,8 @@ def initialize_processor(processor):
 
 def initialize(engine_list):
     """Initialize all engines and store a processor for each engine in :py:obj:`PROCESSORS`."""
+    # the networks are created again: so are their circuit breakers
+    CIRCUIT_BREAKERS.clear()
     for engine_data in engine_list:
         engine_name = engine_data['name']
         engine = engines.engines.get(engine_name)
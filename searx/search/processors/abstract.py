@@ -8,67 +8,128 @@
 import threading
 from abc import abstractmethod, ABC
 from timeit import default_timer
-from typing import Dict, Union
+from typing import Dict, Optional, Tuple
 
 from searx import settings, logger
 from searx.engines import engines
-from searx.network import get_time_for_thread, get_network
+from searx.network import get_time_for_thread
+from searx.network.warmup import get_engine_origin
 from searx.metrics import histogram_observe, counter_inc, count_exception, count_error
+from searx.search.cache import RESPONSE_CACHE, get_cache_key, get_prefetch_key
 from searx.exceptions import SearxEngineAccessDeniedException, SearxEngineResponseException
 from searx.utils import get_engine_from_settings
 
 logger = logger.getChild('searx.search.processor')
-SUSPENDED_STATUS: Dict[Union[int, str], 'SuspendedStatus'] = {}
+CIRCUIT_BREAKERS: Dict[Tuple[str, Optional[str]], 'CircuitBreaker'] = {}
+"""The circuit breakers by name of the network and upstream host, reset by
+:py:obj:`searx.search.processors.initialize`."""
 
+PROBE_TIMEOUT = 60
+"""Number of seconds after which a probe without answer is lost: an other
+request can probe the engine."""
 
-class SuspendedStatus:
-    """Class to handle suspend state."""
 
-    __slots__ = 'suspend_end_time', 'suspend_reason', 'continuous_errors', 'lock'
+class CircuitBreaker:
+    """Circuit breaker of an engine and its upstream host.
+
+    - ``closed``: the requests are sent to the engine.
+    - ``open``: after an error (timeout, CAPTCHA, too many requests ..) no
+      request is sent for ``ban_time_on_fail`` × the number of continuous errors
+      seconds (at most ``max_ban_time_on_fail``, or the ``suspended_times`` of
+      the error).
+    - ``half-open``: the open time is over, a single request (the probe) is sent,
+      the engine stays suspended for the other requests.  If the probe succeeds
+      the circuit is closed, otherwise it is opened again for a longer time.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    __slots__ = 'state', 'open_end_time', 'suspend_reason', 'continuous_errors', 'probe_start_time', 'lock'
 
     def __init__(self):
         self.lock = threading.Lock()
+        self.state = CircuitBreaker.CLOSED
         self.continuous_errors = 0
-        self.suspend_end_time = 0
+        self.open_end_time = 0
         self.suspend_reason = None
+        # start time of the probe in progress, 0 if there is none
+        self.probe_start_time = 0
 
     @property
-    def is_suspended(self):
-        return self.suspend_end_time >= default_timer()
+    def is_closed(self):
+        return self.state == CircuitBreaker.CLOSED
+
+    def allow_request(self) -> bool:
+        """Returns ``True`` if a request can be sent: the circuit is closed or
+        the request is the probe of the half-open circuit."""
+        if self.state == CircuitBreaker.CLOSED:
+            return True
+        with self.lock:
+            now = default_timer()
+            if self.state == CircuitBreaker.OPEN:
+                if now < self.open_end_time:
+                    return False
+                self.state = CircuitBreaker.HALF_OPEN
+                logger.debug('Half-open after %i error(s)', self.continuous_errors)
+            elif self.state == CircuitBreaker.HALF_OPEN and now - self.probe_start_time < PROBE_TIMEOUT:
+                # an other request is probing the engine
+                return False
+            elif self.state == CircuitBreaker.CLOSED:
+                return True
+            self.probe_start_time = now
+            return True
 
-    def suspend(self, suspended_time, suspend_reason):
+    def record_failure(self, suspended_time, suspend_reason):
+        """Open the circuit for ``suspended_time`` seconds, or for a time
+        computed from the number of continuous errors if it is ``None``."""
         with self.lock:
-            # update continuous_errors / suspend_end_time
             self.continuous_errors += 1
             if suspended_time is None:
                 suspended_time = min(
                     settings['search']['max_ban_time_on_fail'],
                     self.continuous_errors * settings['search']['ban_time_on_fail'],
                 )
-            self.suspend_end_time = default_timer() + suspended_time
+            self.state = CircuitBreaker.OPEN
+            self.open_end_time = default_timer() + suspended_time
             self.suspend_reason = suspend_reason
-            logger.debug('Suspend for %i seconds', suspended_time)
+            self.probe_start_time = 0
+            logger.debug('Open for %i seconds', suspended_time)
 
-    def resume(self):
+    def record_success(self):
+        """Close the circuit."""
+        if self.state == CircuitBreaker.CLOSED and self.continuous_errors == 0:
+            return
         with self.lock:
-            # reset the suspend variables
+            self.state = CircuitBreaker.CLOSED
             self.continuous_errors = 0
-            self.suspend_end_time = 0
+            self.open_end_time = 0
             self.suspend_reason = None
+            self.probe_start_time = 0
+
+    def release(self):
+        """The request has neither succeeded nor failed with an error which opens
+        the circuit: an other request can probe the engine."""
+        if self.state == CircuitBreaker.HALF_OPEN:
+            with self.lock:
+                self.probe_start_time = 0
 
 
 class EngineProcessor(ABC):
     """Base classes used for all types of reqest processores."""
 
-    __slots__ = 'engine', 'engine_name', 'lock', 'suspended_status', 'logger'
+    __slots__ = 'engine', 'engine_name', 'lock', 'circuit_breaker', 'logger'
 
     def __init__(self, engine, engine_name: str):
         self.engine = engine
         self.engine_name = engine_name
         self.logger = engines[engine_name].logger
-        key = get_network(self.engine_name)
-        key = id(key) if key else self.engine_name
-        self.suspended_status = SUSPENDED_STATUS.setdefault(key, SuspendedStatus())
+        # the engines of a network share the circuit breaker of an upstream host
+        network = getattr(engine, 'network', None)
+        network_name = network if isinstance(network, str) else self.engine_name
+        key = (network_name, get_engine_origin(engine))
+        self.circuit_breaker = CIRCUIT_BREAKERS.setdefault(key, CircuitBreaker())
 
     def initialize(self):
         try:
@@ -93,50 +154,106 @@ class EngineProcessor(ABC):
             error_message = module_name + exception_class.__qualname__
         else:
             error_message = exception_or_message
-        result_container.add_unresponsive_engine(self.engine_name, error_message)
+        thread = threading.current_thread()
+        if not getattr(thread, '_drop', False):
+            result_container.add_unresponsive_engine(self.engine_name, error_message)
         # metrics
-        counter_inc('engine', self.engine_name, 'search', 'count', 'error')
-        if isinstance(exception_or_message, BaseException):
-            count_exception(self.engine_name, exception_or_message)
+        if getattr(thread, '_prefetch', False):
+            # the prefetch requests are not counted in the metrics of the engine
+            counter_inc('search', 'prefetch', 'error')
         else:
-            count_error(self.engine_name, exception_or_message)
+            counter_inc('engine', self.engine_name, 'search', 'count', 'error')
+            if isinstance(exception_or_message, BaseException):
+                count_exception(self.engine_name, exception_or_message)
+            else:
+                count_error(self.engine_name, exception_or_message)
         # suspend the engine ?
         if suspend:
             suspended_time = None
             if isinstance(exception_or_message, SearxEngineAccessDeniedException):
                 suspended_time = exception_or_message.suspended_time
-            self.suspended_status.suspend(suspended_time, error_message)  # pylint: disable=no-member
+            self.circuit_breaker.record_failure(suspended_time, error_message)  # pylint: disable=no-member
+        else:
+            self.circuit_breaker.release()  # pylint: disable=no-member
 
     def _extend_container_basic(self, result_container, start_time, search_results):
         # update result_container
         result_container.extend(self.engine_name, search_results)
+        engine_time, page_load_time = self._record_successful_search(start_time)
+        result_container.add_timing(self.engine_name, engine_time, page_load_time)
+
+    def _record_successful_search(self, start_time):
         engine_time = default_timer() - start_time
         page_load_time = get_time_for_thread()
-        result_container.add_timing(self.engine_name, engine_time, page_load_time)
         # metrics
         counter_inc('engine', self.engine_name, 'search', 'count', 'successful')
         histogram_observe(engine_time, 'engine', self.engine_name, 'time', 'total')
         if page_load_time is not None:
             histogram_observe(page_load_time, 'engine', self.engine_name, 'time', 'http')
+        return engine_time, page_load_time
 
     def extend_container(self, result_container, start_time, search_results):
-        if getattr(threading.current_thread(), '_timeout', False):
+        thread = threading.current_thread()
+        if getattr(thread, '_timeout', False):
             # the main thread is not waiting anymore
             self.handle_exception(result_container, 'timeout', None)
+        elif getattr(thread, '_drop', False):
+            # the search has returned without this engine (quorum): the
+            # results are dropped, the metrics are recorded
+            counter_inc('engine', self.engine_name, 'search', 'count', 'dropped')
+            if search_results is not None:
+                self._record_successful_search(start_time)
+            self.circuit_breaker.record_success()
+        elif getattr(thread, '_prefetch', False):
+            # prefetch of the next page (searx.search.prefetch): no timing, the
+            # prefetch requests are not counted in the metrics of the engine
+            if search_results is not None:
+                counter_inc('search', 'prefetch', 'successful')
+                result_container.extend(self.engine_name, search_results)
+            self.circuit_breaker.record_success()
         else:
             # check if the engine accepted the request
             if search_results is not None:
                 self._extend_container_basic(result_container, start_time, search_results)
-            self.suspended_status.resume()
+            self.circuit_breaker.record_success()
 
     def extend_container_if_suspended(self, result_container):
-        if self.suspended_status.is_suspended:
+        """Returns ``True`` if the request is not allowed by the circuit
+        breaker, ``False`` if the request has to be sent: it is the probe of a
+        half-open circuit, its outcome has to be recorded."""
+        if not self.circuit_breaker.allow_request():
             result_container.add_unresponsive_engine(
-                self.engine_name, self.suspended_status.suspend_reason, suspended=True
+                self.engine_name, self.circuit_breaker.suspend_reason, suspended=True
             )
             return True
         return False
 
+    @property
+    def cache_ttl(self):
+        """Time-to-live in seconds of the cached responses of the engine, ``0``
+        if the responses are not cached (see :py:obj:`searx.search.cache`)."""
+        return 0
+
+    def extend_container_if_cached(self, result_container, query, params):
+        """Extend the ``result_container`` by the cached results of the request
+        ``params`` (or its prefetched results, see :py:obj:`searx.search.prefetch`).
+        Returns ``True`` if there was a cached response."""
+        prefetch = bool(settings['search']['prefetch_ttl'])
+        if not self.cache_ttl and not prefetch:
+            return False
+        cache_key = get_cache_key(self.engine_name, query, params)
+        search_results = None
+        if self.cache_ttl:
+            search_results = RESPONSE_CACHE.get(cache_key)
+        if search_results is None and prefetch:
+            search_results = RESPONSE_CACHE.get(get_prefetch_key(cache_key))
+            if search_results is not None:
+                counter_inc('search', 'prefetch', 'hit')
+        if search_results is None:
+            return False
+        result_container.extend(self.engine_name, search_results)
+        return True
+
     def get_params(self, search_query, engine_category):
         """Returns a set of (see :ref:`request params <engine request arguments>`) or
         ``None`` if request is not supported.
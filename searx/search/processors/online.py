@@ -12,6 +12,7 @@ import ssl
 import httpx
 
 import searx.network
+from searx import settings, tracing
 from searx.utils import gen_useragent
 from searx.exceptions import (
     SearxEngineAccessDeniedException,
@@ -19,6 +20,7 @@ from searx.exceptions import (
     SearxEngineTooManyRequestsException,
 )
 from searx.metrics.error_recorder import count_error
+from searx.search.cache import RESPONSE_CACHE, get_cache_key
 from .abstract import EngineProcessor
 
 
@@ -36,6 +38,38 @@ def default_request_params():
     }
 
 
+def get_request_args(params):
+    """Returns the arguments of :py:obj:`searx.network.request` defined by the
+    :ref:`request params <engine request online>`: ``headers`` (with the
+    ``User-Agent``), ``cookies``, ``auth``, ``verify``, ``max_redirects``,
+    ``allow_redirects`` and ``raise_for_httperror``.  They are the default
+    arguments of the HTTP requests of the :ref:`async engines <engine async>`
+    too (see :py:obj:`searx.network.run_coroutine`)."""
+    request_args = dict(headers=params['headers'], cookies=params['cookies'], auth=params['auth'])
+
+    # verify
+    # if not None, it overrides the verify value defined in the network.
+    # use False to accept any server certificate
+    # use a path to file to specify a server certificate
+    verify = params.get('verify')
+    if verify is not None:
+        request_args['verify'] = params['verify']
+
+    # max_redirects
+    max_redirects = params.get('max_redirects')
+    if max_redirects:
+        request_args['max_redirects'] = max_redirects
+
+    # allow_redirects
+    if 'allow_redirects' in params:
+        request_args['allow_redirects'] = params['allow_redirects']
+
+    # raise_for_status
+    request_args['raise_for_httperror'] = params.get('raise_for_httperror', True)
+
+    return request_args
+
+
 class OnlineProcessor(EngineProcessor):
     """Processor class for ``online`` engines."""
 
@@ -50,6 +84,15 @@ class OnlineProcessor(EngineProcessor):
         searx.network.set_context_network_name(self.engine_name)
         super().initialize()
 
+    @property
+    def cache_ttl(self):
+        """The ``cache_ttl`` of the engine, by default the ``ttl`` of
+        :ref:`settings search` ``response_cache``."""
+        cache_ttl = getattr(self.engine, 'cache_ttl', None)
+        if cache_ttl is None:
+            cache_ttl = settings['search']['response_cache']['ttl']
+        return cache_ttl
+
     def get_params(self, search_query, engine_category):
         """Returns a set of :ref:`request params <engine request online>` or ``None``
         if request is not supported.
@@ -80,30 +123,10 @@ class OnlineProcessor(EngineProcessor):
     def _send_http_request(self, params):
         # create dictionary which contain all
         # information about the request
-        request_args = dict(headers=params['headers'], cookies=params['cookies'], auth=params['auth'])
-
-        # verify
-        # if not None, it overrides the verify value defined in the network.
-        # use False to accept any server certificate
-        # use a path to file to specify a server certificate
-        verify = params.get('verify')
-        if verify is not None:
-            request_args['verify'] = params['verify']
-
-        # max_redirects
-        max_redirects = params.get('max_redirects')
-        if max_redirects:
-            request_args['max_redirects'] = max_redirects
-
-        # allow_redirects
-        if 'allow_redirects' in params:
-            request_args['allow_redirects'] = params['allow_redirects']
+        request_args = get_request_args(params)
 
         # soft_max_redirects
-        soft_max_redirects = params.get('soft_max_redirects', max_redirects or 0)
-
-        # raise_for_status
-        request_args['raise_for_httperror'] = params.get('raise_for_httperror', True)
+        soft_max_redirects = params.get('soft_max_redirects', params.get('max_redirects') or 0)
 
         # specific type of request (GET or POST)
         if params['method'] == 'GET':
@@ -132,10 +155,24 @@ class OnlineProcessor(EngineProcessor):
 
         return response
 
+    @property
+    def is_async(self):
+        """``True`` if the engine implements the async engine interface:
+        ``async def search(query, params)`` (see :ref:`engine async`)."""
+        return asyncio.iscoroutinefunction(getattr(self.engine, 'search', None))
+
     def _search_basic(self, query, params):
+        if self.is_async:
+            # the coroutine runs on the loop of searx.network, the HTTP
+            # requests of the coroutine are sent with the arguments of the
+            # request params.  This thread waits for the coroutine.
+            with tracing.span('engine.search'):
+                return searx.network.run_coroutine(self.engine.search(query, params), get_request_args(params))
+
         # update request parameters dependent on
         # search-engine (contained in engines folder)
-        self.engine.request(query, params)
+        with tracing.span('engine.request'):
+            self.engine.request(query, params)
 
         # ignoring empty urls
         if params['url'] is None:
@@ -149,7 +186,8 @@ class OnlineProcessor(EngineProcessor):
 
         # parse the response
         response.search_params = params
-        return self.engine.response(response)
+        with tracing.span('engine.response'):
+            return self.engine.response(response)
 
     def search(self, query, params, result_container, start_time, timeout_limit):
         # set timeout for all HTTP requests
@@ -159,9 +197,17 @@ class OnlineProcessor(EngineProcessor):
         # set the network
         searx.network.set_context_network_name(self.engine_name)
 
+        # the engine updates the params, compute the cache key before
+        cache_ttl = self.cache_ttl
+        cache_key = get_cache_key(self.engine_name, query, params) if cache_ttl else None
+
         try:
             # send requests and parse the results
             search_results = self._search_basic(query, params)
+            if cache_key and search_results:
+                # the result container modifies the results: cache them before
+                search_results = list(search_results)
+                RESPONSE_CACHE.set(cache_key, search_results, cache_ttl)
             self.extend_container(result_container, start_time, search_results)
         except ssl.SSLError as e:
             # requests timeout (connect or read)
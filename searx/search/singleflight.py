@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Single-flight of the identical searches.
+
+When the same query is sent by several users at the same moment, only the first
+search (the *leader*) sends the requests to the engines.  The other searches
+wait for the leader and replay its calls to the result container: the results
+are copied into their own :py:obj:`searx.results.ResultContainer`, so the
+plugins of each user are called.
+
+Single-flight is disabled by default, see ``single_flight`` in :ref:`settings
+search`.
+
+Metrics:
+
+- ``search.single_flight.shared``: number of searches answered by the requests
+  of an other search.
+
+"""
+
+import threading
+from copy import deepcopy
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from searx import logger
+from searx.search.models import SearchQuery
+
+logger = logger.getChild('search.singleflight')
+
+
+def get_flight_key(search_query: SearchQuery) -> Hashable:
+    """Returns the key of the identical searches of ``search_query`` (the
+    ``engine_data`` is not compared by :py:obj:`SearchQuery.__eq__`, its values
+    are the dicts of the engines)."""
+    engine_data = tuple(sorted((name, tuple(sorted(data.items()))) for name, data in search_query.engine_data.items()))
+    return (search_query, engine_data)
+
+
+class Flight:
+    """The calls of the leader to its result container (``extend``,
+    ``add_timing`` and ``add_unresponsive_engine``)."""
+
+    __slots__ = 'calls', 'shareable', 'actual_timeout', '_event', '_lock'
+
+    def __init__(self):
+        self.calls: List[Tuple[str, tuple]] = []
+        # False if a call can't be copied: the waiting searches have to send
+        # their own requests.
+        self.shareable = True
+        self.actual_timeout: Optional[float] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def record(self, method: str, *args):
+        """Record a copy of the arguments, the result container modifies the
+        results it merges."""
+        with self._lock:
+            if self._event.is_set():
+                # an engine has answered after the end of the search
+                return
+            try:
+                self.calls.append((method, deepcopy(args)))
+            except TypeError as e:
+                logger.debug('%s: %s', method, e)
+                self.shareable = False
+
+    def finish(self):
+        with self._lock:
+            self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+    def replay(self, result_container):
+        """Replay the calls of the leader to ``result_container``."""
+        for method, args in self.calls:
+            getattr(result_container, method)(*deepcopy(args))
+
+
+class ResultRecorder:
+    """Forward the calls to the ``result_container`` of the leader and record
+    them in the :py:obj:`Flight`."""
+
+    __slots__ = '_result_container', '_flight'
+
+    def __init__(self, result_container, flight: Flight):
+        self._result_container = result_container
+        self._flight = flight
+
+    def __getattr__(self, name):
+        return getattr(self._result_container, name)
+
+    def extend(self, engine_name, results):
+        results = list(results)
+        self._flight.record('extend', engine_name, results)
+        self._result_container.extend(engine_name, results)
+
+    def add_timing(self, engine_name: str, engine_time: float, page_load_time: float):
+        self._flight.record('add_timing', engine_name, engine_time, page_load_time)
+        self._result_container.add_timing(engine_name, engine_time, page_load_time)
+
+    def add_unresponsive_engine(self, engine_name: str, error_type: str, suspended: bool = False):
+        self._flight.record('add_unresponsive_engine', engine_name, error_type, suspended)
+        self._result_container.add_unresponsive_engine(engine_name, error_type, suspended)
+
+
+class SingleFlight:
+    """The searches in progress."""
+
+    __slots__ = '_flights', '_lock'
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """Returns the flight of the search ``key`` and ``True`` if the caller is
+        the leader: it has to call :py:obj:`SingleFlight.leave` at the end of the
+        search."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def leave(self, key: Hashable, flight: Flight):
+        """The leader has finished the search: the waiting searches are
+        released."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish()
+
+
+SINGLE_FLIGHT = SingleFlight()
+"""The searches in progress of the worker process.
+
+:meta hide-value:
+"""
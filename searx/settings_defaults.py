@@ -34,7 +34,7 @@ except metadata.PackageNotFoundError:
 searx_dir = abspath(dirname(__file__))
 
 logger = logging.getLogger('searx')
-OUTPUT_FORMATS = ['html', 'csv', 'json', 'rss']
+OUTPUT_FORMATS = ['html', 'csv', 'json', 'rss', 'ndjson']
 SXNG_LOCALE_TAGS = ['all', 'auto'] + list(l[0] for l in sxng_locales)
 SIMPLE_STYLE = ('auto', 'light', 'dark')
 CATEGORIES_AS_TABS = {
@@ -161,6 +161,13 @@ SCHEMA = {
         'contact_url': SettingsValue((None, False, str), None),
         'donation_url': SettingsValue((bool, str), "https://docs.searxng.org/donate.html"),
         'enable_metrics': SettingsValue(bool, True),
+        'metrics_token': SettingsValue((None, str), None, 'SEARXNG_METRICS_TOKEN'),
+        'metrics_backend': SettingsValue(('memory', 'mmap', 'redis'), 'memory'),
+        'metrics_mmap_path': SettingsValue((None, str), None),
+        'tracing_path': SettingsValue((None, str), None),
+        'tracing_format': SettingsValue(('jsonl', 'otlp'), 'jsonl'),
+        'tracing_sample_rate': SettingsValue(numbers.Real, 0.01),
+        'tracing_server_timing': SettingsValue(bool, False),
     },
     'brand': {
         'issue_url': SettingsValue(str, project_urls['Issue tracker']),
@@ -185,6 +192,17 @@ SCHEMA = {
             'recaptcha_SearxEngineCaptcha': SettingsValue(numbers.Real, 604800),
         },
         'formats': SettingsValue(list, OUTPUT_FORMATS),
+        'max_workers': SettingsValue(int, 200),
+        'quorum': {
+            'engines': SettingsValue(int, 0),
+            'results': SettingsValue(int, 0),
+        },
+        'single_flight': SettingsValue(bool, False),
+        'prefetch_ttl': SettingsValue(numbers.Real, 0),
+        'response_cache': {
+            'ttl': SettingsValue(numbers.Real, 0),
+            'maxsize': SettingsValue(int, 1000),
+        },
     },
     'server': {
         'port': SettingsValue((int, str), 8888, 'SEARXNG_PORT'),
@@ -193,6 +211,17 @@ SCHEMA = {
         'secret_key': SettingsValue(str, environ_name='SEARXNG_SECRET'),
         'base_url': SettingsValue((False, str), False, 'SEARXNG_BASE_URL'),
         'image_proxy': SettingsValue(bool, False),
+        'image_cache': {
+            'path': SettingsValue((None, str), None),
+            'maxsize': SettingsValue(int, 100 * 1024 * 1024),
+            'ttl': SettingsValue(int, 86400),
+        },
+        'image_thumbnail': {
+            'enable': SettingsValue(bool, False),
+            'sizes': SettingsValue(list, [200]),
+            'format': SettingsValue(('webp', 'jpeg'), 'webp'),
+            'quality': SettingsValue(int, 75),
+        },
         'http_protocol_version': SettingsValue(('1.0', '1.1'), '1.0'),
         'method': SettingsValue(('POST', 'GET'), 'POST'),
         'default_http_headers': SettingsValue(dict, {}),
@@ -225,11 +254,33 @@ SCHEMA = {
         'enable_http2': SettingsValue(bool, True),
         'verify': SettingsValue((bool, str), True),
         'max_request_timeout': SettingsValue((None, numbers.Real), None),
+        'adaptive_timeout': {
+            'enable': SettingsValue(bool, False),
+            'percentile': SettingsValue(numbers.Real, 95),
+            'factor': SettingsValue(numbers.Real, 1.5),
+            'min_samples': SettingsValue(int, 20),
+            'min_timeout': SettingsValue(numbers.Real, 1.0),
+            'window': SettingsValue((None, '1m', '15m', '1h'), None),
+        },
         # Magic number kept from previous code
         'pool_connections': SettingsValue(int, 100),
         # Picked from constructor
         'pool_maxsize': SettingsValue(int, 10),
         'keepalive_expiry': SettingsValue(numbers.Real, 5.0),
+        'dns_cache_ttl': SettingsValue(numbers.Real, 0),
+        'dns_cache_negative_ttl': SettingsValue(numbers.Real, 0),
+        'stream_chunk_size': SettingsValue(int, 65536),
+        'stream_buffer_size': SettingsValue(int, 4),
+        'max_clients': SettingsValue(int, 100),
+        'client_idle_timeout': SettingsValue(numbers.Real, 0),
+        'quarantine_time': SettingsValue(numbers.Real, 60),
+        'quarantine_failures': SettingsValue(int, 3),
+        'warmup': {
+            'enable': SettingsValue(bool, False),
+            'connections': SettingsValue(int, 1),
+            'interval': SettingsValue(numbers.Real, 0),
+            'concurrency': SettingsValue(int, 4),
+        },
         # default maximum redirect
         # from https://github.com/psf/requests/blob/8c211a96cdbe9fe320d63d9e1ae15c5c07e179f8/requests/models.py#L55
         'max_redirects': SettingsValue(int, 30),
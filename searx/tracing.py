@@ -0,0 +1,330 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# lint: pylint
+"""Tracing of the requests: the time spent in each phase of a search.
+
+A trace is started for each request (:py:obj:`start_trace` in
+``searx.webapp.pre_request``), the phases are spans (:py:obj:`span`):
+
+``render.template``
+  rendering of the Jinja template.
+``plugins.<hook>``
+  call of the plugins: ``pre_search``, ``on_result`` (once per result),
+  ``post_search``.
+``search.queue``
+  time in the queue of :py:obj:`searx.search.executor` before a worker thread
+  runs the request of an engine.
+``engine``
+  request of an engine, in its worker thread.  Its children: ``engine.request``
+  (``request()`` of the engine), ``network.loop_wait`` (the time before the
+  loop of :py:obj:`searx.network.client.get_loop` starts the HTTP request),
+  ``network.request``, ``engine.response`` (``response()`` of the engine) and
+  ``results.extend``.  The async engines have a single ``engine.search`` span.
+``results.extend``
+  merge of the results of an engine, ``results.on_extend`` is the part under
+  the lock of the :py:obj:`searx.results.ResultContainer`.
+
+The settings ``tracing_*`` of :ref:`settings general`:
+
+- ``tracing_path``: the sampled traces are appended to this file, by default
+  (``null``) no trace is written.
+- ``tracing_format``: ``jsonl`` writes one span per line (:py:obj:`JsonLinesExporter`),
+  ``otlp`` writes one trace per line in the JSON encoding of OTLP
+  (:py:obj:`OtlpFileExporter`, the format of the file exporter of the
+  OpenTelemetry collector).
+- ``tracing_sample_rate``: the ratio of the requests written to the file.
+- ``tracing_server_timing``: the duration of the phases is added to the
+  ``Server-Timing`` header of each response (debug).  The duration of a phase
+  is the sum of its spans: the engines run in parallel, the sum can be longer
+  than the request.
+
+The spans of an engine which answers after the response (timeout, quorum) are
+not exported.  Without an active trace, :py:obj:`span` returns a shared no-op
+span: the instrumentation costs a thread-local lookup.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from timeit import default_timer
+from typing import Dict, List, Optional
+
+from searx import get_setting, logger
+
+logger = logger.getChild('tracing')
+
+_local = threading.local()
+
+EXPORTER: Optional['Exporter'] = None
+SAMPLE_RATE = 0.0
+SERVER_TIMING = False
+
+
+class Trace:  # pylint: disable=too-few-public-methods
+    """The spans of a request."""
+
+    __slots__ = 'trace_id', 'sampled', 'spans', 'start_time', 'start_timer'
+
+    def __init__(self, sampled: bool):
+        self.trace_id = '{:032x}'.format(random.getrandbits(128))
+        self.sampled = sampled
+        self.spans: List['Span'] = []
+        # wall clock time of default_timer() == start_timer
+        self.start_time = time.time()
+        self.start_timer = default_timer()
+
+    def get_time(self, timer: float) -> float:
+        """Returns the wall clock time of the ``timer`` value."""
+        return self.start_time + timer - self.start_timer
+
+
+class Span:
+    """A phase of a :py:obj:`Trace`, it starts when it is created.  As a
+    context manager, the span is the parent of the spans created in the
+    ``with`` block (in the same thread) and ends at the end of the block."""
+
+    __slots__ = 'trace', 'name', 'span_id', 'parent_id', 'start', 'end', 'attributes', '_previous'
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict, start=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        self.parent_id = parent_id
+        self.start = default_timer() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self._previous = None
+        trace.spans.append(self)
+
+    @property
+    def duration(self) -> float:
+        return (default_timer() if self.end is None else self.end) - self.start
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self, end=None):
+        if self.end is None:
+            self.end = default_timer() if end is None else end
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'span', None)
+        _local.span = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish()
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        _local.span = self._previous
+        self._previous = None
+
+
+class NoopSpan:
+    """Span of the requests without trace."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def finish(self, end=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Exporter:
+    """Append the traces to the file ``path``, one JSON document per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get_lines(self, trace: Trace) -> List[Dict]:
+        raise NotImplementedError()
+
+    def export(self, trace: Trace):
+        data = ''.join(json.dumps(line, separators=(',', ':')) + '\n' for line in self.get_lines(trace))
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+        except OSError as e:
+            logger.error('can\'t write the trace to %s: %s', self.path, e)
+
+
+class JsonLinesExporter(Exporter):
+    """One span per line: ``trace_id``, ``span_id``, ``parent_id``, ``name``,
+    ``start`` (UNIX time in seconds), ``duration`` (seconds) and
+    ``attributes``."""
+
+    def get_lines(self, trace: Trace) -> List[Dict]:
+        return [
+            {
+                'trace_id': trace.trace_id,
+                'span_id': trace_span.span_id,
+                'parent_id': trace_span.parent_id,
+                'name': trace_span.name,
+                'start': round(trace.get_time(trace_span.start), 6),
+                'duration': round(trace_span.duration, 6),
+                'attributes': trace_span.attributes,
+            }
+            for trace_span in list(trace.spans)
+            if trace_span.end is not None
+        ]
+
+
+def to_otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{'key': key, 'value': to_otlp_value(value)} for key, value in attributes.items()]
+
+
+class OtlpFileExporter(Exporter):
+    """One trace per line, in the JSON encoding of the OTLP
+    ``ExportTraceServiceRequest``."""
+
+    def get_lines(self, trace: Trace) -> List[Dict]:
+        spans = []
+        for trace_span in list(trace.spans):
+            if trace_span.end is None:
+                continue
+            otlp_span = {
+                'traceId': trace.trace_id,
+                'spanId': trace_span.span_id,
+                'name': trace_span.name,
+                # SPAN_KIND_SERVER for the request, SPAN_KIND_INTERNAL for the phases
+                'kind': 2 if trace_span.parent_id is None else 1,
+                'startTimeUnixNano': str(int(trace.get_time(trace_span.start) * 1e9)),
+                'endTimeUnixNano': str(int(trace.get_time(trace_span.end) * 1e9)),
+                'attributes': to_otlp_attributes(trace_span.attributes),
+            }
+            if trace_span.parent_id:
+                otlp_span['parentSpanId'] = trace_span.parent_id
+            spans.append(otlp_span)
+        resource = {'attributes': to_otlp_attributes({'service.name': 'searxng'})}
+        return [
+            {'resourceSpans': [{'resource': resource, 'scopeSpans': [{'scope': {'name': 'searx'}, 'spans': spans}]}]}
+        ]
+
+
+EXPORTERS = {'jsonl': JsonLinesExporter, 'otlp': OtlpFileExporter}
+
+
+def start_trace(name: str, **attributes):
+    """Start the trace of a request in this thread, returns its root span (a
+    no-op span if the request is not traced)."""
+    sampled = EXPORTER is not None and random.random() < SAMPLE_RATE
+    if not sampled and not SERVER_TIMING:
+        _local.root = _local.span = None
+        return NOOP_SPAN
+    root = Span(Trace(sampled), name, None, attributes)
+    _local.root = _local.span = root
+    return root
+
+
+def end_trace(root: Optional[Span] = None) -> Optional[Trace]:
+    """End the trace of this thread (or the trace of the ``root`` span, for a
+    response streamed after the request) and export it if it is sampled."""
+    if root is None or root is getattr(_local, 'root', None):
+        root = getattr(_local, 'root', None)
+        _local.root = _local.span = None
+    if root is None:
+        return None
+    root.finish()
+    trace = root.trace
+    if trace.sampled and EXPORTER is not None:
+        EXPORTER.export(trace)
+    return trace
+
+
+def get_current_span() -> Optional[Span]:
+    return getattr(_local, 'span', None)
+
+
+def is_active() -> bool:
+    return getattr(_local, 'span', None) is not None
+
+
+def span(name: str, **attributes):
+    """Returns a new span, child of the current span of this thread."""
+    parent = getattr(_local, 'span', None)
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def add_span(name: str, start: float, end: float, **attributes):
+    """Add a span which has ended (``start`` and ``end`` are values of
+    :py:obj:`timeit.default_timer`), child of the current span of this
+    thread."""
+    parent = getattr(_local, 'span', None)
+    if parent is not None:
+        Span(parent.trace, name, parent.span_id, attributes, start=start).finish(end)
+
+
+class activate:  # pylint: disable=invalid-name
+    """Context manager: ``parent`` (a span of another thread, can be ``None``)
+    is the current span of this thread in the ``with`` block."""
+
+    __slots__ = 'parent', '_previous'
+
+    def __init__(self, parent: Optional[Span]):
+        self.parent = parent
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'span', None)
+        _local.span = self.parent
+        return self.parent
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.span = self._previous
+
+
+def get_server_timing(trace: Optional[Trace]) -> List[str]:
+    """Returns the ``Server-Timing`` entries of the phases of ``trace``: the
+    sum of the durations and the number of spans of each name."""
+    if trace is None or not SERVER_TIMING:
+        return []
+    phases: 'OrderedDict[str, List]' = OrderedDict()
+    for trace_span in list(trace.spans):
+        if trace_span.parent_id is None or trace_span.end is None:
+            continue
+        phase = phases.setdefault(trace_span.name, [0.0, 0])
+        phase[0] += trace_span.end - trace_span.start
+        phase[1] += 1
+    return [
+        '{};dur={};desc="{}"'.format(name, round(duration * 1000, 3), count)
+        for name, (duration, count) in phases.items()
+    ]
+
+
+def initialize():
+    global EXPORTER, SAMPLE_RATE, SERVER_TIMING  # pylint: disable=global-statement
+    path = get_setting('general.tracing_path')
+    EXPORTER = None
+    if path:
+        path = os.path.expanduser(path)
+        EXPORTER = EXPORTERS[get_setting('general.tracing_format')](path)
+    SAMPLE_RATE = get_setting('general.tracing_sample_rate')
+    SERVER_TIMING = get_setting('general.tracing_server_timing')
+    if EXPORTER is not None or SERVER_TIMING:
+        logger.info('tracing: path=%s sample_rate=%s server_timing=%s', path, SAMPLE_RATE, SERVER_TIMING)
@@ -7,18 +7,23 @@
 """
 # pylint: disable=use-dict-literal
 
+import concurrent.futures
 import hashlib
 import hmac
 import json
 import os
 import sys
 import base64
+import threading
+import time
 
+from copy import deepcopy
+from queue import SimpleQueue
 from timeit import default_timer
 from html import escape
 from io import StringIO
 import typing
-from typing import List, Dict, Iterable
+from typing import List, Dict, Iterable, Optional
 
 import urllib
 import urllib.parse
@@ -103,12 +108,17 @@ from searx.answerers import (
     ask,
 )
 from searx.metrics import (
+    ENDPOINTS,
+    WINDOWS,
     get_engines_stats,
     get_engine_errors,
+    get_openmetrics,
     get_reliabilities,
     histogram,
+    histogram_observe,
     counter,
 )
+from searx.metrics.openmetrics import CONTENT_TYPE as OPENMETRICS_CONTENT_TYPE
 from searx.flaskfix import patch_application
 
 from searx.locales import (
@@ -122,10 +132,12 @@ from searx.locales import (
 # renaming names from searx imports ...
 from searx.autocomplete import search_autocomplete, backends as autocomplete_backends
 from searx.redisdb import initialize as redis_initialize
+from searx import image_cache, image_thumbnail, tracing
 from searx.sxng_locales import sxng_locales
 from searx.search import SearchWithPlugins, initialize as search_initialize
-from searx.network import stream as http_stream, set_context_network_name
+from searx.network import stream as http_stream, set_context_network_name, get_network_stats
 from searx.search.checker import get_result as checker_get_result
+from searx.search.processors import PROCESSORS
 
 logger = logger.getChild('webapp')
 
@@ -206,6 +218,7 @@ class ExtendedRequest(flask.Request):
     start_time: float
     render_time: float
     timings: List[Timing]
+    streamed: bool
 
 
 request = typing.cast(ExtendedRequest, flask.request)
@@ -335,7 +348,10 @@ def morty_proxify(url: str):
     return '{0}?{1}'.format(settings['result_proxy']['url'], urlencode(url_params))
 
 
-def image_proxify(url: str):
+def image_proxify(url: str, size: Optional[int] = None):
+    """Returns the URL of the ``/image_proxy`` for ``url``, a thumbnail of
+    ``size`` pixels is requested if :py:obj:`searx.image_thumbnail` is
+    enabled."""
 
     if url.startswith('//'):
         url = 'https:' + url
@@ -358,8 +374,11 @@ def image_proxify(url: str):
         return morty_proxify(url)
 
     h = new_hmac(settings['server']['secret_key'], url.encode())
+    args = dict(url=url.encode(), h=h)
+    if size and image_thumbnail.is_enabled():
+        args['size'] = size
 
-    return '{0}?{1}'.format(url_for('image_proxy'), urlencode(dict(url=url.encode(), h=h)))
+    return '{0}?{1}'.format(url_for('image_proxy'), urlencode(args))
 
 
 def get_translations():
@@ -500,7 +519,8 @@ def render(template_name: str, **kwargs):
             kwargs['styles'].add(css)
 
     start_time = default_timer()
-    result = render_template('{}/{}'.format(kwargs['theme'], template_name), **kwargs)
+    with tracing.span('render.template', template=template_name):
+        result = render_template('{}/{}'.format(kwargs['theme'], template_name), **kwargs)
     request.render_time += default_timer() - start_time  # pylint: disable=assigning-non-slot
 
     return result
@@ -509,8 +529,10 @@ def render(template_name: str, **kwargs):
 @app.before_request
 def pre_request():
     request.start_time = default_timer()  # pylint: disable=assigning-non-slot
+    tracing.start_trace('request', endpoint=request.endpoint or '', method=request.method)
     request.render_time = 0  # pylint: disable=assigning-non-slot
     request.timings = []  # pylint: disable=assigning-non-slot
+    request.streamed = False  # pylint: disable=assigning-non-slot
     request.errors = []  # pylint: disable=assigning-non-slot
 
     preferences = Preferences(themes, list(categories.keys()), engines, plugins)  # pylint: disable=redefined-outer-name
@@ -577,7 +599,21 @@ def add_default_headers(response: flask.Response):
 
 @app.after_request
 def post_request(response: flask.Response):
+    if request.streamed:
+        # the response is sent while the search runs: the timings are recorded
+        # at the end of the stream (see search_ndjson)
+        return response
+    timings_all = record_timings(tracing.end_trace())
+    response.headers.add('Server-Timing', ', '.join(timings_all))
+    return response
+
+
+def record_timings(trace) -> List[str]:
+    """Record the time of the request, returns the ``Server-Timing`` entries."""
     total_time = default_timer() - request.start_time
+    if request.endpoint in ENDPOINTS:
+        histogram_observe(total_time, 'endpoint', request.endpoint, 'time', 'total')
+        histogram_observe(request.render_time, 'endpoint', request.endpoint, 'time', 'render')
     timings_all = [
         'total;dur=' + str(round(total_time * 1000, 3)),
         'render;dur=' + str(round(request.render_time * 1000, 3)),
@@ -593,8 +629,8 @@ def post_request(response: flask.Response):
             if t.load
         ]
         timings_all = timings_all + timings_total + timings_load
-    response.headers.add('Server-Timing', ', '.join(timings_all))
-    return response
+    timings_all += tracing.get_server_timing(trace)
+    return timings_all
 
 
 def index_error(output_format: str, error_message: str):
@@ -649,11 +685,163 @@ def health():
     return Response('OK', mimetype='text/plain')
 
 
+def format_results(results: List[Dict], output_format: str, query: str):  # pylint: disable=too-many-branches
+    """Prepare the ``results`` for the ``output_format`` (the results are
+    modified in place)."""
+    current_template = None
+    previous_result = None
+
+    for result in results:
+        if output_format == 'html':
+            if 'content' in result and result['content']:
+                result['content'] = highlight_content(escape(result['content'][:1024]), query)
+            if 'title' in result and result['title']:
+                result['title'] = highlight_content(escape(result['title'] or ''), query)
+        else:
+            if result.get('content'):
+                result['content'] = html_to_text(result['content']).strip()
+            # removing html content and whitespace duplications
+            result['title'] = ' '.join(html_to_text(result['title']).strip().split())
+
+        if 'url' in result:
+            result['pretty_url'] = prettify_url(result['url'])
+
+        if result.get('publishedDate'):  # do not try to get a date from an empty string or a None type
+            try:  # test if publishedDate >= 1900 (datetime module bug)
+                result['pubdate'] = result['publishedDate'].strftime('%Y-%m-%d %H:%M:%S%z')
+            except ValueError:
+                result['publishedDate'] = None
+            else:
+                result['publishedDate'] = searxng_l10n_timespan(result['publishedDate'])
+
+        # set result['open_group'] = True when the template changes from the previous result
+        # set result['close_group'] = True when the template changes on the next result
+        if current_template != result.get('template'):
+            result['open_group'] = True
+            if previous_result:
+                previous_result['close_group'] = True  # pylint: disable=unsupported-assignment-operation
+        current_template = result.get('template')
+        previous_result = result
+
+    if previous_result:
+        previous_result['close_group'] = True
+
+
+def get_json_results(search_query, result_container, results: List[Dict], number_of_results: int) -> Dict:
+    """Returns the JSON output of a search (``format=json``)."""
+    return {
+        'query': search_query.query,
+        'number_of_results': number_of_results,
+        'results': results,
+        'answers': list(result_container.answers),
+        'corrections': list(result_container.corrections),
+        'infoboxes': result_container.infoboxes,
+        'suggestions': list(result_container.suggestions),
+        'unresponsive_engines': __get_translated_errors(result_container.unresponsive_engines),
+    }
+
+
+def search_ndjson(search_obj: SearchWithPlugins) -> Response:
+    """Stream the results of the search ``search_obj`` as newline delimited JSON
+    (``format=ndjson``).
+
+    The search runs in a thread, a frame is written each time an engine has
+    extended the result container::
+
+        {"engine": "...", "results": [...], "answers": [...], "corrections": [...],
+         "infoboxes": [...], "suggestions": [...]}
+
+    The last frame is the output of ``format=json`` (the ordered and scored
+    results, the unresponsive engines ..).  The headers are sent before the
+    search: the response has no ``Server-Timing`` header, the time of the
+    request is recorded at the end of the stream.
+    """
+    search_query = search_obj.search_query
+    frames = SimpleQueue()
+    # the search thread and the end of the stream continue the trace of the request
+    root_span = tracing.get_current_span()
+
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, default=lambda item: list(item) if isinstance(item, set) else str(item)) + '\n'
+
+    def on_extend(engine_name, results):
+        # called from the engine threads: the results are formatted in the
+        # request context of the response generator.
+        frames.put((engine_name, deepcopy(results)))
+
+    @flask.copy_current_request_context
+    def run_search():
+        try:
+            with tracing.activate(root_span):
+                search_obj.search()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(e, exc_info=True)
+            frames.put(e)
+        finally:
+            frames.put(None)
+
+    def engine_frame(engine_name, results):
+        frame = {
+            'engine': engine_name,
+            'results': [],
+            'answers': [],
+            'corrections': [],
+            'infoboxes': [],
+            'suggestions': [],
+        }
+        for result in results:
+            if 'suggestion' in result:
+                frame['suggestions'].append(result['suggestion'])
+            elif 'answer' in result:
+                frame['answers'].append(result['answer'])
+            elif 'correction' in result:
+                frame['corrections'].append(result['correction'])
+            elif 'infobox' in result:
+                frame['infoboxes'].append(result)
+            elif 'number_of_results' not in result and 'engine_data' not in result:
+                frame['results'].append(result)
+        format_results(frame['results'], 'ndjson', search_query.query)
+        return frame
+
+    def generate():
+        try:
+            yield from generate_frames()
+        finally:
+            record_timings(tracing.end_trace(root_span))
+
+    def generate_frames():
+        item = frames.get()
+        while item is not None:
+            if isinstance(item, Exception):
+                yield json_dumps({'error': gettext('search error')})
+            else:
+                yield json_dumps(engine_frame(*item))
+            item = frames.get()
+
+        result_container = search_obj.result_container
+        if result_container.redirect_url:
+            yield json_dumps({'redirect_url': result_container.redirect_url})
+            return
+
+        request.timings = result_container.get_timings()  # pylint: disable=assigning-non-slot
+        results = result_container.get_ordered_results()
+        number_of_results = result_container.results_number()
+        if number_of_results < result_container.results_length():
+            number_of_results = 0
+        format_results(results, 'ndjson', search_query.query)
+        yield json_dumps(get_json_results(search_query, result_container, results, number_of_results))
+
+    search_obj.result_container.on_extend = on_extend
+    request.streamed = True  # pylint: disable=assigning-non-slot
+    threading.Thread(target=run_search, name='search_ndjson', daemon=True).start()
+    return Response(flask.stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.route('/search', methods=['GET', 'POST'])
 def search():
     """Search query in q and return results.
 
-    Supported outputs: html, json, csv, rss.
+    Supported outputs: html, json, csv, rss, ndjson (see :py:obj:`search_ndjson`).
     """
     # pylint: disable=too-many-locals, too-many-return-statements, too-many-branches
     # pylint: disable=too-many-statements
@@ -686,6 +874,9 @@ def search():
         # search = Search(search_query) #  without plugins
         search = SearchWithPlugins(search_query, request.user_plugins, request)  # pylint: disable=redefined-outer-name
 
+        if output_format == 'ndjson':
+            return search_ndjson(search)
+
         result_container = search.search()
 
     except SearxParameterException as e:
@@ -708,56 +899,11 @@ def search():
     # Server-Timing header
     request.timings = result_container.get_timings()  # pylint: disable=assigning-non-slot
 
-    current_template = None
-    previous_result = None
-
     # output
-    for result in results:
-        if output_format == 'html':
-            if 'content' in result and result['content']:
-                result['content'] = highlight_content(escape(result['content'][:1024]), search_query.query)
-            if 'title' in result and result['title']:
-                result['title'] = highlight_content(escape(result['title'] or ''), search_query.query)
-        else:
-            if result.get('content'):
-                result['content'] = html_to_text(result['content']).strip()
-            # removing html content and whitespace duplications
-            result['title'] = ' '.join(html_to_text(result['title']).strip().split())
-
-        if 'url' in result:
-            result['pretty_url'] = prettify_url(result['url'])
-
-        if result.get('publishedDate'):  # do not try to get a date from an empty string or a None type
-            try:  # test if publishedDate >= 1900 (datetime module bug)
-                result['pubdate'] = result['publishedDate'].strftime('%Y-%m-%d %H:%M:%S%z')
-            except ValueError:
-                result['publishedDate'] = None
-            else:
-                result['publishedDate'] = searxng_l10n_timespan(result['publishedDate'])
-
-        # set result['open_group'] = True when the template changes from the previous result
-        # set result['close_group'] = True when the template changes on the next result
-        if current_template != result.get('template'):
-            result['open_group'] = True
-            if previous_result:
-                previous_result['close_group'] = True  # pylint: disable=unsupported-assignment-operation
-        current_template = result.get('template')
-        previous_result = result
-
-    if previous_result:
-        previous_result['close_group'] = True
+    format_results(results, output_format, search_query.query)
 
     if output_format == 'json':
-        x = {
-            'query': search_query.query,
-            'number_of_results': number_of_results,
-            'results': results,
-            'answers': list(result_container.answers),
-            'corrections': list(result_container.corrections),
-            'infoboxes': result_container.infoboxes,
-            'suggestions': list(result_container.suggestions),
-            'unresponsive_engines': __get_translated_errors(result_container.unresponsive_engines),
-        }
+        x = get_json_results(search_query, result_container, results, number_of_results)
         response = json.dumps(x, default=lambda item: list(item) if isinstance(item, set) else item)
         return Response(response, mimetype='application/json')
 
@@ -986,7 +1132,7 @@ def preferences():
     stats = {}  # pylint: disable=redefined-outer-name
     max_rate95 = 0
     for _, e in filtered_engines.items():
-        h = histogram('engine', e.name, 'time', 'total')
+        h = histogram('engine', e.name, 'time', 'total').snapshot()
         median = round(h.percentage(50), 1) if h.count > 0 else None
         rate80 = round(h.percentage(80), 1) if h.count > 0 else None
         rate95 = round(h.percentage(95), 1) if h.count > 0 else None
@@ -1104,17 +1250,72 @@ def preferences():
     )
 
 
+def send_cached_image(cached_image: image_cache.CachedImage):
+    """Send an image of the :py:obj:`searx.image_cache`, answer the conditional
+    requests with ``304 Not Modified``."""
+    response = flask.send_file(
+        cached_image.path,
+        mimetype=cached_image.content_type,
+        etag=cached_image.etag,
+        max_age=max(int(cached_image.expire_time - time.time()), 0),
+    )
+    if cached_image.content_encoding:
+        response.headers['Content-Encoding'] = cached_image.content_encoding
+    return response
+
+
+def send_thumbnail(resp: httpx.Response, stream: Iterable[bytes], key: str, size: int, maximum_size: int):
+    """Read the image of the upstream response ``resp`` and send its thumbnail
+    (see :py:obj:`searx.image_thumbnail`)."""
+    data = bytearray()
+    try:
+        for chunk in stream:
+            data.extend(chunk)
+            if len(data) > maximum_size:
+                return 'Max size', 400
+    finally:
+        resp.close()
+
+    content_type = resp.headers['Content-Type']
+    thumbnail = image_thumbnail.make_thumbnail(
+        bytes(data),
+        size,
+        settings['server']['image_thumbnail']['format'],
+        settings['server']['image_thumbnail']['quality'],
+    )
+    if thumbnail:
+        data, content_type = thumbnail
+    if image_cache.IMAGE_CACHE:
+        ttl = image_cache.IMAGE_CACHE.get_ttl(resp.headers)
+        if ttl > 0:
+            # consume the generator: the thumbnail is stored now
+            list(image_cache.IMAGE_CACHE.store(key, [bytes(data)], {'Content-Type': content_type}, ttl, maximum_size))
+    return Response(bytes(data), mimetype=content_type)
+
+
 @app.route('/image_proxy', methods=['GET'])
 def image_proxy():
-    # pylint: disable=too-many-return-statements, too-many-branches
+    # pylint: disable=too-many-return-statements, too-many-branches, too-many-statements
 
     url = request.args.get('url')
     if not url:
         return '', 400
 
-    if not is_hmac_of(settings['server']['secret_key'], url.encode(), request.args.get('h', '')):
+    key = request.args.get('h', '')
+    if not is_hmac_of(settings['server']['secret_key'], url.encode(), key):
         return '', 400
 
+    # a thumbnail is requested
+    thumbnail_size = image_thumbnail.get_size(request.args.get('size'))
+    if thumbnail_size:
+        key = image_thumbnail.get_key(key, thumbnail_size)
+
+    # the image is in the cache: don't fetch it
+    if image_cache.IMAGE_CACHE:
+        cached_image = image_cache.IMAGE_CACHE.get(key)
+        if cached_image:
+            return send_cached_image(cached_image)
+
     maximum_size = 5 * 1024 * 1024
     forward_resp = False
     resp = None
@@ -1145,6 +1346,8 @@ def image_proxy():
             return '', 400
 
         forward_resp = True
+        if thumbnail_size and not resp.headers.get('Content-Encoding'):
+            return send_thumbnail(resp, stream, key, thumbnail_size, maximum_size)
     except httpx.HTTPError:
         logger.exception('HTTP error')
         return '', 400
@@ -1169,6 +1372,11 @@ def image_proxy():
 
     try:
         headers = dict_subset(resp.headers, {'Content-Type', 'Content-Encoding', 'Content-Length', 'Length'})
+        if image_cache.IMAGE_CACHE:
+            ttl = image_cache.IMAGE_CACHE.get_ttl(resp.headers)
+            if ttl > 0:
+                # the image is stored while it is sent to the browser
+                stream = image_cache.IMAGE_CACHE.store(key, stream, resp.headers, ttl, maximum_size)
         response = Response(stream, mimetype=resp.headers['Content-Type'], headers=headers, direct_passthrough=True)
         response.call_on_close(close_stream)
         return response
@@ -1206,6 +1414,9 @@ def stats():
     """Render engine statistics page."""
     sort_order = request.args.get('sort', default='name', type=str)
     selected_engine_name = request.args.get('engine', default=None, type=str)
+    window = request.args.get('window', default=None, type=str)
+    if window not in WINDOWS:
+        window = None
 
     filtered_engines = dict(filter(lambda kv: request.preferences.validate_token(kv[1]), engines.items()))
     if selected_engine_name:
@@ -1219,8 +1430,13 @@ def stats():
         checker_results['engines'] if checker_results['status'] == 'ok' and 'engines' in checker_results else {}
     )
 
-    engine_stats = get_engines_stats(filtered_engines)
-    engine_reliabilities = get_reliabilities(filtered_engines, checker_results)
+    engine_stats = get_engines_stats(filtered_engines, window)
+    engine_reliabilities = get_reliabilities(filtered_engines, checker_results, window)
+    circuit_breakers = {
+        engine_name: PROCESSORS[engine_name].circuit_breaker
+        for engine_name in filtered_engines
+        if engine_name in PROCESSORS
+    }
 
     if sort_order not in STATS_SORT_PARAMETERS:
         sort_order = 'name'
@@ -1244,8 +1460,11 @@ def stats():
         # fmt: off
         'stats.html',
         sort_order = sort_order,
+        window = window,
+        windows = WINDOWS,
         engine_stats = engine_stats,
         engine_reliabilities = engine_reliabilities,
+        circuit_breakers = circuit_breakers,
         selected_engine_name = selected_engine_name,
         searx_git_branch = GIT_BRANCH,
         # fmt: on
@@ -1255,7 +1474,8 @@ def stats():
 @app.route('/stats/errors', methods=['GET'])
 def stats_errors():
     filtered_engines = dict(filter(lambda kv: request.preferences.validate_token(kv[1]), engines.items()))
-    result = get_engine_errors(filtered_engines)
+    window = request.args.get('window', default=None, type=str)
+    result = get_engine_errors(filtered_engines, window if window in WINDOWS else None)
     return jsonify(result)
 
 
@@ -1265,12 +1485,48 @@ def stats_checker():
     return jsonify(result)
 
 
+def check_metrics_token():
+    """Returns the error response of a request to an endpoint protected by the
+    ``general.metrics_token`` setting, or ``None`` if the request sends the
+    header ``Authorization: Bearer <metrics_token>``."""
+    metrics_token = get_setting('general.metrics_token')
+    if not metrics_token:
+        return '', 404
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization.encode(), b'Bearer ' + metrics_token.encode()):
+        return '', 401, {'WWW-Authenticate': 'Bearer'}
+    return None
+
+
+@app.route('/stats/network', methods=['GET'])
+def stats_network():
+    error_response = check_metrics_token()
+    if error_response:
+        return error_response
+    try:
+        result = get_network_stats()
+    except concurrent.futures.TimeoutError:
+        return jsonify({'error': 'timeout'}), 503
+    return jsonify(result)
+
+
+@app.route('/metrics', methods=['GET'])
+def stats_open_metrics():
+    if not get_setting('general.enable_metrics'):
+        return '', 404
+    error_response = check_metrics_token()
+    if error_response:
+        return error_response
+    return Response(get_openmetrics(), content_type=OPENMETRICS_CONTENT_TYPE)
+
+
 @app.route('/robots.txt', methods=['GET'])
 def robots():
     return Response(
         """User-agent: *
 Allow: /info/en/about
 Disallow: /stats
+Disallow: /metrics
 Disallow: /image_proxy
 Disallow: /preferences
 Disallow: /*?*q=*
@@ -1389,6 +1645,9 @@ if not werkzeug_reloader or (werkzeug_reloader and os.environ.get("WERKZEUG_RUN_
     locales_initialize()
     _INFO_PAGES = infopage.InfoPageSet()
     redis_initialize()
+    image_cache.initialize()
+    image_thumbnail.initialize()
+    tracing.initialize()
     plugin_initialize(app)
     search_initialize(enable_checker=True, check_network=True, enable_metrics=settings['general']['enable_metrics'])
 
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# lint: pylint
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Microbenchmark of the grouping of the results by category and template
+(:py:obj:`searx.results.group_results`), the last step of
+:py:obj:`searx.results.ResultContainer.close`.
+
+Example:
+
+.. code::  bash
+
+    $ python3 searxng_extra/benchmark_results.py --results 1000 5000 10000
+
+The time of a call is (about) linear in the number of results.
+"""
+
+import argparse
+import functools
+import random
+import sys
+import timeit
+
+from searx.results import group_results
+
+CATEGORIES = ['general', 'images', 'videos', 'news', 'it', 'science']
+TEMPLATES = ['default.html', 'images.html', 'videos.html', 'code.html', 'map.html']
+
+
+def get_results(count: int, seed: int = 0):
+    """Returns ``count`` sorted results of random categories and templates."""
+    rand = random.Random(seed)
+    results = []
+    for i in range(count):
+        result = {
+            'url': 'https://example.com/%i' % i,
+            'title': 'result %i' % i,
+            'category': rand.choice(CATEGORIES),
+            'template': rand.choice(TEMPLATES),
+        }
+        if rand.random() < 0.2:
+            result['img_src'] = 'https://example.com/%i.png' % i
+        results.append(result)
+    return results
+
+
+def parse_argument(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    parser.add_argument('--results', type=int, nargs='+', default=[1000, 5000, 10000], help='number of results')
+    parser.add_argument('--repeat', type=int, default=20, help='number of calls for each number of results')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_argument(args)
+    for count in options.results:
+        results = get_results(count)
+        duration = min(timeit.repeat(functools.partial(group_results, results), number=1, repeat=options.repeat))
+        sys.stdout.write('%7i results: %8.3f ms\n' % (count, duration * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import asyncio
+import socket
+
+from mock import patch
+import httpcore
+
+from searx.network.dns import DNSCache, DNSCacheBackend
+from tests import SearxTestCase
+
+
+def fake_getaddrinfo(calls, *addresses, error=None):
+    async def getaddrinfo(host, port, **kwargs):
+        calls.append(host)
+        await asyncio.sleep(0.01)
+        if error:
+            raise error
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port)) for address in addresses]
+
+    return getaddrinfo
+
+
+class TestDNSCache(SearxTestCase):
+    async def test_cache(self):
+        calls = []
+        getaddrinfo = fake_getaddrinfo(calls, '192.0.2.1', '192.0.2.1', '192.0.2.2')
+        with patch.object(asyncio.get_running_loop(), 'getaddrinfo', new=getaddrinfo):
+            dns_cache = DNSCache(60)
+            # concurrent resolutions: one request to the resolver
+            results = await asyncio.gather(*[dns_cache.resolve('example.com', 443) for _ in range(3)])
+            self.assertEqual(results, [['192.0.2.1', '192.0.2.2']] * 3)
+            self.assertEqual(await dns_cache.resolve('example.com', 443), ['192.0.2.1', '192.0.2.2'])
+            self.assertEqual(calls, ['example.com'])
+
+    async def test_negative_cache(self):
+        calls = []
+        getaddrinfo = fake_getaddrinfo(calls, error=socket.gaierror('Name or service not known'))
+        with patch.object(asyncio.get_running_loop(), 'getaddrinfo', new=getaddrinfo):
+            dns_cache = DNSCache(60, negative_ttl=60)
+            for _ in range(2):
+                with self.assertRaises(httpcore.ConnectError):
+                    await dns_cache.resolve('example.invalid', 443)
+            self.assertEqual(calls, ['example.invalid'])
+
+            # without negative cache
+            dns_cache = DNSCache(60)
+            for _ in range(2):
+                with self.assertRaises(httpcore.ConnectError):
+                    await dns_cache.resolve('example.invalid', 443)
+            self.assertEqual(len(calls), 3)
+
+    async def test_refresh(self):
+        calls = []
+        getaddrinfo = fake_getaddrinfo(calls, '192.0.2.1')
+        with patch.object(asyncio.get_running_loop(), 'getaddrinfo', new=getaddrinfo):
+            dns_cache = DNSCache(0.5)
+            await dns_cache.resolve('example.com', 443)
+            await asyncio.sleep(0.45)
+            # the cached address is returned, the refresh runs in the background
+            self.assertEqual(await dns_cache.resolve('example.com', 443), ['192.0.2.1'])
+            self.assertEqual(len(calls), 1)
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(calls), 2)
+            # the refreshed address is cached
+            self.assertEqual(await dns_cache.resolve('example.com', 443), ['192.0.2.1'])
+            self.assertEqual(len(calls), 2)
+
+    async def test_failed_refresh(self):
+        calls = []
+        dns_cache = DNSCache(0.5, negative_ttl=60)
+        with patch.object(asyncio.get_running_loop(), 'getaddrinfo', new=fake_getaddrinfo(calls, '192.0.2.1')):
+            await dns_cache.resolve('example.com', 443)
+        await asyncio.sleep(0.45)
+        error = socket.gaierror('Temporary failure in name resolution')
+        with patch.object(asyncio.get_running_loop(), 'getaddrinfo', new=fake_getaddrinfo(calls, error=error)):
+            await dns_cache.resolve('example.com', 443)
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(calls), 2)
+            # the refresh has failed: the cached address is kept after its TTL
+            await asyncio.sleep(0.02)
+            self.assertEqual(await dns_cache.resolve('example.com', 443), ['192.0.2.1'])
+            self.assertEqual(len(calls), 2)
+
+
+class TestDNSCacheBackend(SearxTestCase):
+    async def test_connect_tcp(self):
+        connected = []
+
+        async def connect_tcp(host, port, timeout=None, local_address=None):
+            connected.append(host)
+            if host == '192.0.2.1':
+                raise httpcore.ConnectError('unreachable')
+            return host
+
+        calls = []
+        getaddrinfo = fake_getaddrinfo(calls, '192.0.2.1', '192.0.2.2')
+        with patch.object(asyncio.get_running_loop(), 'getaddrinfo', new=getaddrinfo):
+            backend = DNSCacheBackend(DNSCache(60))
+            with patch.object(backend._backend, 'connect_tcp', new=connect_tcp):  # pylint: disable=protected-access
+                # the next address is used when the connection fails
+                self.assertEqual(await backend.connect_tcp('example.com', 443, timeout=1), '192.0.2.2')
+                # an IP address is not resolved
+                self.assertEqual(await backend.connect_tcp('192.0.2.3', 443, timeout=1), '192.0.2.3')
+        self.assertEqual(connected, ['192.0.2.1', '192.0.2.2', '192.0.2.3'])
+        self.assertEqual(calls, ['example.com'])
@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from itertools import cycle, count
+
+from mock import patch
+
+from searx.network.health import HealthSelector
+from searx.network.network import Network
+from tests import SearxTestCase
+
+
+class TestHealthSelector(SearxTestCase):
+    def take(self, selector, n):
+        return [next(selector) for _ in range(n)]
+
+    def test_round_robin(self):
+        selector = HealthSelector(cycle(['a', 'b', 'c']))
+        self.assertEqual(self.take(selector, 4), ['a', 'b', 'c', 'a'])
+        # the healthy members keep the order
+        for member in 'abc':
+            selector.record_success(member, 0.1)
+        self.assertEqual(self.take(selector, 3), ['b', 'c', 'a'])
+
+    def test_quarantine(self):
+        selector = HealthSelector(cycle(['a', 'b', 'c']), quarantine_time=60, quarantine_failures=2)
+        selector.record_failure('b', blocked=True)
+        self.assertEqual(self.take(selector, 4), ['a', 'c', 'a', 'c'])
+        self.assertTrue(selector.get_stats()['b']['quarantined'])
+        self.assertEqual(selector.get_stats()['b']['blocked'], 1)
+
+        # the quarantine is over, the weight of b is lower than 1: it is skipped once
+        with patch('searx.network.health.default_timer', return_value=1e12):
+            self.assertEqual(self.take(selector, 4), ['a', 'c', 'a', 'b'])
+
+        # consecutive failures
+        selector.record_failure('c')
+        self.assertFalse(selector.get_stats()['c']['quarantined'])
+        selector.record_failure('c')
+        self.assertTrue(selector.get_stats()['c']['quarantined'])
+
+    def test_all_quarantined(self):
+        selector = HealthSelector(cycle(['a', 'b']))
+        selector.record_failure('a', blocked=True)
+        selector.record_failure('b', blocked=True)
+        self.assertIn(next(selector), ['a', 'b'])
+
+    def test_weight(self):
+        selector = HealthSelector(cycle(['a', 'b']))
+        selector.record_success('a', 0.1)
+        # b is four times slower than the average
+        selector.record_success('b', 2.0)
+        self.assertLess(selector.get_stats()['b']['weight'], 0.5)
+        members = self.take(selector, 100)
+        self.assertGreater(members.count('a'), 2 * members.count('b'))
+        self.assertGreater(members.count('b'), 0)
+
+    def test_lazy_candidates(self):
+        # the candidates are not materialized
+        selector = HealthSelector(count())
+        self.assertEqual(self.take(selector, 3), [0, 1, 2])
+        selector.record_failure(3, blocked=True)
+        self.assertEqual(self.take(selector, 2), [4, 5])
+
+
+class TestNetworkHealth(SearxTestCase):
+    def test_record_request(self):
+        network = Network(
+            local_addresses=['192.168.0.1', '192.168.0.2'],
+            proxies={'https': 'http://localhost:1337', 'all://': 'http://localhost:1338'},
+        )
+        key = (True, 30, '192.168.0.1', next(network._proxies_cycle))
+        network.record_request(key, 'https://example.com/', blocked=True)
+        network.record_request(key, 'http://example.com/', latency=0.1)
+        health = network.get_health()
+        self.assertTrue(health['source_ips']['192.168.0.1']['quarantined'])
+        self.assertEqual(health['proxies']['https://']['http://localhost:1337']['blocked'], 1)
+        self.assertEqual(health['proxies']['all://']['http://localhost:1338']['errors'], 0)
+        self.assertNotIn('192.168.0.1', [next(network._local_addresses_cycle) for _ in range(3)])
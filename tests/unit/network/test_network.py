@@ -1,10 +1,17 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
+import asyncio
+import ssl
+import time
+from timeit import default_timer
+
 from mock import patch
 
 import httpx
 
-from searx.network.network import Network, NETWORKS, initialize
+import searx.network
+from searx.network import client
+from searx.network.network import Network, NETWORKS, ProxyPattern, initialize
 from tests import SearxTestCase
 
 
@@ -111,6 +118,37 @@ class TestNetwork(SearxTestCase):
         await network.get_client()
         await network.aclose()
 
+    async def test_evict_clients(self):
+        network = Network(local_addresses=['192.168.0.1', '192.168.0.2', '192.168.0.3'], max_clients=2)
+        client1 = await network.get_client()
+        client2 = await network.get_client()
+        client3 = await network.get_client()
+        self.assertEqual(list(network._clients.values()), [client2, client3])
+        self.assertEqual(network.get_stats()['evicted_clients'], 1)
+        # the evicted client is closed in the background
+        await asyncio.sleep(0)
+        self.assertTrue(client1.is_closed)
+        self.assertFalse(client2.is_closed)
+        # a new client for 192.168.0.1, the least recently used client is evicted
+        client4 = await network.get_client()
+        self.assertNotIn(client4, (client1, client2, client3))
+        self.assertEqual(list(network._clients.values()), [client3, client4])
+        await network.aclose()
+        self.assertTrue(client2.is_closed)
+
+    async def test_evict_idle_clients(self):
+        network = Network(local_addresses=['192.168.0.1', '192.168.0.2'], client_idle_timeout=0.05)
+        client1 = await network.get_client()
+        await asyncio.sleep(0.1)
+        client2 = await network.get_client()
+        self.assertEqual(list(network._clients.values()), [client2])
+        stats = network.get_stats()
+        self.assertEqual(stats['created_clients'], 2)
+        self.assertEqual(stats['clients'], 1)
+        await asyncio.sleep(0)
+        self.assertTrue(client1.is_closed)
+        await network.aclose()
+
     async def test_request(self):
         a_text = 'Lorem Ipsum'
         response = httpx.Response(status_code=200, text=a_text)
@@ -121,6 +159,28 @@ class TestNetwork(SearxTestCase):
             await network.aclose()
 
 
+class TestProxyPattern(SearxTestCase):
+    def test_matches(self):
+        url = httpx.URL('https://www.example.com/search')
+        self.assertTrue(ProxyPattern('all://').matches(url))
+        self.assertTrue(ProxyPattern('https://').matches(url))
+        self.assertFalse(ProxyPattern('http://').matches(url))
+        self.assertTrue(ProxyPattern('all://*.example.com').matches(url))
+        self.assertFalse(ProxyPattern('all://*.example.com').matches(httpx.URL('https://example.com')))
+        self.assertTrue(ProxyPattern('all://*example.com').matches(httpx.URL('https://example.com')))
+        self.assertFalse(ProxyPattern('all://*example.com').matches(httpx.URL('https://notexample.com')))
+        self.assertFalse(ProxyPattern('https://example.com').matches(url))
+        self.assertFalse(ProxyPattern('https://www.example.com:8080').matches(url))
+        self.assertTrue(ProxyPattern('https://www.example.com:8080').matches(httpx.URL('https://www.example.com:8080')))
+
+    def test_priority(self):
+        patterns = ['all://', 'https://', 'all://*.example.com', 'https://www.example.com:8080']
+        patterns = [
+            proxy_pattern.pattern for proxy_pattern in sorted(map(ProxyPattern, patterns), key=lambda p: p.priority)
+        ]
+        self.assertEqual(patterns, ['https://www.example.com:8080', 'all://*.example.com', 'https://', 'all://'])
+
+
 class TestNetworkRequestRetries(SearxTestCase):
 
     TEXT = 'Lorem Ipsum'
@@ -240,3 +300,241 @@ class TestNetworkStreamRetries(SearxTestCase):
             response = await network.stream('GET', 'https://example.com/', raise_for_httperror=False)
             self.assertEqual(response.status_code, 403)
             await network.aclose()
+
+
+class TestRunCoroutine(SearxTestCase):
+    def tearDown(self):
+        searx.network.clear_context_for_thread()
+
+    def test_requests(self):
+        async def get_response(*args, **kwargs):
+            await asyncio.sleep(0.1)
+            return httpx.Response(status_code=200, text=args[1])
+
+        async def search():
+            # the requests are sent in parallel
+            responses = await asyncio.gather(
+                searx.network.aget('https://example.com/a'), searx.network.apost('https://example.com/b')
+            )
+            return [response.text for response in responses]
+
+        network = Network(enable_http=True)
+        with patch.object(httpx.AsyncClient, 'request', new=get_response), patch.object(
+            searx.network, 'get_context_network', return_value=network
+        ):
+            searx.network.set_timeout_for_thread(3, start_time=default_timer())
+            searx.network.reset_time_for_thread()
+            self.assertEqual(searx.network.run_coroutine(search()), ['get', 'post'])
+            # the time of the requests sent in parallel is counted once
+            self.assertGreaterEqual(searx.network.get_time_for_thread(), 0.1)
+            self.assertLess(searx.network.get_time_for_thread(), 0.19)
+
+    def test_request_args(self):
+        requests_kwargs = []
+
+        async def get_response(*args, **kwargs):
+            requests_kwargs.append(kwargs)
+            return httpx.Response(status_code=200, text=args[1])
+
+        async def search():
+            await searx.network.aget('https://example.com/a', headers={'Accept': 'text/html'})
+            await searx.network.aget('https://example.com/b', cookies={'b': '2'})
+
+        request_args = {'headers': {'User-Agent': 'Firefox'}, 'cookies': {'a': '1'}, 'raise_for_httperror': False}
+        network = Network(enable_http=True)
+        with patch.object(httpx.AsyncClient, 'request', new=get_response), patch.object(
+            searx.network, 'get_context_network', return_value=network
+        ):
+            searx.network.run_coroutine(search(), request_args)
+        # the headers are merged, the other arguments of the request are kept
+        self.assertEqual(requests_kwargs[0]['headers'], {'User-Agent': 'Firefox', 'Accept': 'text/html'})
+        self.assertEqual(requests_kwargs[0]['cookies'], {'a': '1'})
+        self.assertEqual(requests_kwargs[1]['headers'], {'User-Agent': 'Firefox'})
+        self.assertEqual(requests_kwargs[1]['cookies'], {'b': '2'})
+        self.assertNotIn('raise_for_httperror', requests_kwargs[0])
+
+    def test_timeout(self):
+        cancelled = False
+
+        async def search():
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        searx.network.set_timeout_for_thread(0.1, start_time=default_timer())
+        with self.assertRaises(httpx.TimeoutException):
+            searx.network.run_coroutine(search())
+        # the coroutine is cancelled on the loop
+        start_time = default_timer()
+        while not cancelled and default_timer() - start_time < 1:
+            time.sleep(0.01)
+        self.assertTrue(cancelled)
+
+
+class TestMultiRequests(SearxTestCase):
+    def setUp(self):
+        self.cancelled = []
+        self.network = Network(enable_http=True)
+
+    def tearDown(self):
+        searx.network.clear_context_for_thread()
+
+    def patch(self):
+        async def request(self_client, method, url, **kwargs):  # pylint: disable=unused-argument
+            delay = float(url.rsplit('/', 1)[1])
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(delay)
+                raise
+            return httpx.Response(status_code=200, text=url)
+
+        return patch.object(httpx.AsyncClient, 'request', new=request), patch.object(
+            searx.network, 'get_context_network', return_value=self.network
+        )
+
+    def wait_cancelled(self, count):
+        start_time = default_timer()
+        while len(self.cancelled) < count and default_timer() - start_time < 1:
+            time.sleep(0.01)
+
+    def test_as_completed(self):
+        request_list = [searx.network.Request.get('https://example.com/%s' % delay) for delay in (0.3, 0.05, 0.15)]
+        patch_request, patch_network = self.patch()
+        with patch_request, patch_network:
+            indexes = [index for index, _ in searx.network.multi_requests_as_completed(request_list)]
+            self.assertEqual(indexes, [1, 2, 0])
+            # multi_requests keeps the order of the requests
+            responses = searx.network.multi_requests(request_list)
+            self.assertEqual([response.text for response in responses], [r.url for r in request_list])
+
+    def test_http_time(self):
+        request_list = [searx.network.Request.get('https://example.com/%s' % delay) for delay in (0.1, 0.05)]
+        patch_request, patch_network = self.patch()
+        with patch_request, patch_network:
+            searx.network.reset_time_for_thread()
+            for _ in searx.network.multi_requests_as_completed(request_list):
+                # the time of the caller is not the HTTP time
+                time.sleep(0.2)
+            self.assertGreaterEqual(searx.network.get_time_for_thread(), 0.05)
+            self.assertLess(searx.network.get_time_for_thread(), 0.2)
+
+    def test_deadline(self):
+        request_list = [searx.network.Request.get('https://example.com/%s' % delay) for delay in (5, 0.05)]
+        patch_request, patch_network = self.patch()
+        with patch_request, patch_network:
+            searx.network.set_timeout_for_thread(0.1, start_time=default_timer())
+            start_time = default_timer()
+            responses = list(searx.network.multi_requests_as_completed(request_list))
+            self.assertLess(default_timer() - start_time, 1)
+            self.assertEqual([index for index, _ in responses], [1, 0])
+            self.assertIsInstance(responses[1][1], httpx.TimeoutException)
+            # the pending request is cancelled on the loop
+            self.wait_cancelled(1)
+            self.assertEqual(self.cancelled, [5])
+
+    def test_break(self):
+        request_list = [searx.network.Request.get('https://example.com/%s' % delay) for delay in (5, 0.05, 5)]
+        patch_request, patch_network = self.patch()
+        with patch_request, patch_network:
+            for index, _ in searx.network.multi_requests_as_completed(request_list):
+                self.assertEqual(index, 1)
+                break
+            # the caller has stopped the iteration: the pending requests are cancelled
+            self.wait_cancelled(2)
+            self.assertEqual(self.cancelled, [5, 5])
+
+
+class FakeStreamResponse:
+    def __init__(self, chunk_count):
+        self.chunk_count = chunk_count
+        self.sent = 0
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.closed = True
+
+    async def aiter_raw(self, chunk_size=None):  # pylint: disable=unused-argument
+        for i in range(self.chunk_count):
+            self.sent += 1
+            yield b'%i' % i
+
+
+class TestStream(SearxTestCase):
+    def setUp(self):
+        self.response = FakeStreamResponse(10)
+
+        async def stream(*args, **kwargs):  # pylint: disable=unused-argument
+            return self.response
+
+        self.network = Network()
+        self.patch_network = patch.object(searx.network, 'get_context_network', return_value=self.network)
+        self.patch_stream = patch.object(Network, 'stream', new=stream)
+        self.patch_settings = patch.dict(searx.network.settings['outgoing'], {'stream_buffer_size': 2})
+
+    def wait(self, condition):
+        start_time = default_timer()
+        while not condition() and default_timer() - start_time < 1:
+            time.sleep(0.01)
+
+    def test_backpressure(self):
+        with self.patch_network, self.patch_stream, self.patch_settings:
+            response, stream = searx.network.stream('GET', 'https://example.com/')
+            self.assertIs(response, self.response)
+            self.assertEqual(next(stream), b'0')
+            time.sleep(0.1)
+            # the upstream response is not read before the reader asks for the chunks
+            self.assertLessEqual(self.response.sent, 4)
+            self.assertEqual(list(stream), [b'%i' % i for i in range(1, 10)])
+            self.wait(lambda: self.response.closed)
+            self.assertTrue(self.response.closed)
+
+    def test_close(self):
+        with self.patch_network, self.patch_stream, self.patch_settings:
+            _, stream = searx.network.stream('GET', 'https://example.com/')
+            self.assertEqual(next(stream), b'0')
+            stream.close()
+            # the coroutine waiting for a free place in the queue is cancelled
+            self.wait(lambda: self.response.closed)
+            self.assertTrue(self.response.closed)
+            self.assertLess(self.response.sent, 10)
+
+
+class TestSSLContexts(SearxTestCase):
+    def setUp(self):
+        self.setattr4test(client, 'SSLCONTEXTS', {})
+
+    def test_get_sslcontexts(self):
+        ssl_contexts = [client.get_sslcontexts() for _ in range(3 * client.SSLCONTEXT_POOL_SIZE)]
+        self.assertEqual(len(set(map(id, ssl_contexts))), client.SSLCONTEXT_POOL_SIZE)
+        # the ciphers of a context are shuffled once
+        ssl_context = ssl_contexts[0]
+        ciphers = ssl_context.get_ciphers()
+        client.get_sslcontexts()
+        self.assertEqual(ssl_context.get_ciphers(), ciphers)
+        # the TLS sessions are resumed
+        self.assertIs(ssl_context.sslobject_class, client.TLSSessionSSLObject)
+        self.assertEqual(len(ssl_context.tls_sessions), 0)
+        # other parameters: other pool
+        self.assertNotIn(id(client.get_sslcontexts(http2=True)), set(map(id, ssl_contexts)))
+        # other source IP or proxy: other pool, the TLS sessions are not shared
+        self.assertNotIn(id(client.get_sslcontexts(local_address='192.168.0.1')), set(map(id, ssl_contexts)))
+        self.assertNotIn(id(client.get_sslcontexts(proxy_url='http://localhost:8080')), set(map(id, ssl_contexts)))
+
+    def test_tls_session_read(self):
+        ssl_context = client.get_sslcontexts()
+        ssl_object = ssl_context.wrap_bio(ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname='example.com')
+        self.assertIsInstance(ssl_object, client.TLSSessionSSLObject)
+        with patch.object(ssl.SSLObject, 'read', return_value=b'data'), patch.object(
+            client.TLSSessionSSLObject, '_save_session'
+        ) as save_session:
+            for _ in range(3):
+                self.assertEqual(ssl_object.read(), b'data')
+        # the ticket is looked for once, after the handshake
+        self.assertEqual(save_session.call_count, 1)
@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from types import SimpleNamespace
+
+from mock import patch
+
+import httpx
+
+from searx.network.network import Network
+from searx.network.warmup import WarmUp, get_engine_origin, get_origins
+from tests import SearxTestCase
+
+
+class FakeConnection:
+    def __init__(self, host):
+        self.host = host
+
+    def can_handle_request(self, origin):
+        return origin.host == self.host
+
+    def is_closed(self):
+        return False
+
+    def has_expired(self):
+        return False
+
+
+class FakeClient:
+    def __init__(self, connections=()):
+        self.urls = []
+        self.user_agents = set()
+        self.connections = list(connections)
+
+    async def head(self, url, headers=None, timeout=None):  # pylint: disable=unused-argument
+        self.urls.append(url)
+        self.user_agents.add(headers['User-Agent'])
+        if 'error' in url:
+            raise httpx.ConnectError('error')
+
+
+class TestWarmUp(SearxTestCase):
+    def test_get_engine_origin(self):
+        engine = SimpleNamespace(search_url='https://example.com/search?{query}')
+        self.assertEqual(get_engine_origin(engine), 'https://example.com')
+        engine = SimpleNamespace(search_url=None, base_url='http://example.org:8080/api')
+        self.assertEqual(get_engine_origin(engine), 'http://example.org:8080')
+        # the host depends on the request
+        engine = SimpleNamespace(search_url='https://{language}.example.com/search')
+        self.assertIsNone(get_engine_origin(engine))
+        self.assertIsNone(get_engine_origin(SimpleNamespace(url='/search')))
+        self.assertIsNone(get_engine_origin(SimpleNamespace()))
+
+    def test_get_origins(self):
+        network = Network()
+        other_network = Network()
+        engines = {
+            'a': SimpleNamespace(search_url='https://a.example.com/', engine_type='online'),
+            'b': SimpleNamespace(base_url='https://a.example.com', engine_type='online'),
+            'c': SimpleNamespace(base_url='https://c.example.com', engine_type='online', disabled=True),
+            'd': SimpleNamespace(base_url='https://d.example.com', engine_type='offline'),
+            'e': SimpleNamespace(base_url='https://e.example.com', engine_type='online'),
+        }
+        networks = {'a': network, 'b': network, 'c': network, 'd': network, 'e': other_network}
+        origins = get_origins(networks, engines, engines.keys())
+        self.assertEqual(origins, {network: {'https://a.example.com'}, other_network: {'https://e.example.com'}})
+
+    async def test_warm_up(self):
+        client = FakeClient()
+        # an open connection to example.com: only one more connection is opened
+        other_client = FakeClient([FakeConnection(b'example.com')])
+        network = Network(max_keepalive_connections=2)
+
+        async def get_clients():
+            return [client, other_client]
+
+        warmup = WarmUp({network: {'https://example.com', 'https://error.example.com'}}, 3, 0, 2, 1.0)
+        with patch.object(Network, 'get_clients', new=lambda self: get_clients()), patch(
+            'searx.network.warmup.get_client_connections', new=lambda client: client.connections
+        ), patch.object(Network, 'get_client_and_key') as get_client_and_key:
+            await warmup.run()
+        # the rotation of the source addresses and proxies is not changed
+        get_client_and_key.assert_not_called()
+        # the errors are ignored, no more requests than the keep-alive connections
+        self.assertEqual(sorted(client.urls), ['https://error.example.com'] * 2 + ['https://example.com'] * 2)
+        self.assertEqual(sorted(other_client.urls), ['https://error.example.com'] * 2 + ['https://example.com'])
+        self.assertNotIn('python-httpx', ''.join(client.user_agents))
+
+    async def test_get_clients(self):
+        network = Network(local_addresses=['192.168.0.1', '192.168.0.2'])
+        clients = await network.get_clients()
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(await network.get_clients(), clients)
+        # the rotation starts with the first source address
+        _, key = await network.get_client_and_key()
+        self.assertEqual(key[2], '192.168.0.1')
+        await network.aclose()
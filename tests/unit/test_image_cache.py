@@ -0,0 +1,116 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import hashlib
+import os
+import tempfile
+
+from mock import patch
+
+import searx.search.processors
+from searx import image_cache
+from searx.image_cache import ImageCache
+from searx.webutils import new_hmac
+from tests import SearxTestCase
+
+KEY_A = 'a' * 64
+KEY_B = 'b' * 64
+KEY_C = 'c' * 64
+HEADERS = {'Content-Type': 'image/png'}
+
+
+class TestImageCache(SearxTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cache = ImageCache(self.directory.name, 100, 3600)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def store(self, key, chunks, maximum_size=1000):
+        return list(self.cache.store(key, chunks, HEADERS, 60, maximum_size))
+
+    def test_get_ttl(self):
+        self.assertEqual(self.cache.get_ttl({}), 3600)
+        self.assertEqual(self.cache.get_ttl({'Cache-Control': 'public, max-age=60'}), 60)
+        self.assertEqual(self.cache.get_ttl({'Cache-Control': 'max-age=86400'}), 3600)
+        self.assertEqual(self.cache.get_ttl({'Cache-Control': 'no-store'}), 0)
+        self.assertEqual(self.cache.get_ttl({'Cache-Control': 'private, max-age=60'}), 0)
+
+    def test_store(self):
+        self.assertIsNone(self.cache.get(KEY_A))
+        self.assertEqual(self.store(KEY_A, [b'abc', b'def']), [b'abc', b'def'])
+        cached_image = self.cache.get(KEY_A)
+        self.assertEqual(cached_image.content_type, 'image/png')
+        self.assertEqual(cached_image.etag, hashlib.sha1(b'abcdef').hexdigest())
+        with open(cached_image.path, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+
+        # expired
+        with patch('searx.image_cache.time.time', return_value=cached_image.expire_time + 1):
+            self.assertIsNone(self.cache.get(KEY_A))
+
+        # not a key
+        self.assertEqual(self.store('../a', [b'abc']), [b'abc'])
+        self.assertIsNone(self.cache.get('../a'))
+
+    def test_store_incomplete(self):
+        # too large
+        self.assertEqual(self.store(KEY_A, [b'abc', b'def'], maximum_size=4), [b'abc', b'def'])
+        self.assertIsNone(self.cache.get(KEY_A))
+
+        # the stream is closed before the end
+        stream = self.cache.store(KEY_B, iter([b'abc', b'def']), HEADERS, 60, 1000)
+        next(stream)
+        stream.close()
+        self.assertIsNone(self.cache.get(KEY_B))
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'bb')), [])
+
+    def test_evict(self):
+        self.store(KEY_A, [b'a' * 40])
+        self.store(KEY_B, [b'b' * 40])
+        # A is used after B: B is the least recently used image
+        os.utime(os.path.join(self.directory.name, 'bb', KEY_B), (0, 0))
+        self.assertIsNotNone(self.cache.get(KEY_A))
+        self.store(KEY_C, [b'c' * 40])
+        self.assertIsNotNone(self.cache.get(KEY_A))
+        self.assertIsNone(self.cache.get(KEY_B))
+        self.assertIsNotNone(self.cache.get(KEY_C))
+
+
+class TestImageProxyCache(SearxTestCase):
+    def setUp(self):
+        # skip init function (no external HTTP request)
+        def dummy(*args, **kwargs):
+            pass
+
+        self.setattr4test(searx.search.processors, 'initialize_processor', dummy)
+
+        from searx import webapp  # pylint: disable=import-outside-toplevel
+
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.setattr4test(image_cache, 'IMAGE_CACHE', ImageCache(self.directory.name, 1000, 3600))
+        self.app = webapp.app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_image_proxy(self):
+        from searx import settings  # pylint: disable=import-outside-toplevel
+
+        url = 'https://example.com/image.png'
+        key = new_hmac(settings['server']['secret_key'], url.encode())
+        list(image_cache.IMAGE_CACHE.store(key, [b'image'], {'Content-Type': 'image/png'}, 60, 1000))
+
+        # the cached image is sent without fetching it
+        with patch('searx.webapp.http_stream', side_effect=AssertionError) as http_stream:
+            response = self.app.get('/image_proxy', query_string={'url': url, 'h': key})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, b'image')
+            self.assertEqual(response.mimetype, 'image/png')
+            etag = response.headers['ETag']
+
+            response = self.app.get(
+                '/image_proxy', query_string={'url': url, 'h': key}, headers={'If-None-Match': etag}
+            )
+            self.assertEqual(response.status_code, 304)
+            http_stream.assert_not_called()
@@ -0,0 +1,103 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import io
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+import searx.search.processors
+from searx import image_cache, image_thumbnail
+from searx.image_cache import ImageCache
+from searx.image_thumbnail import Image, make_thumbnail
+from searx.webutils import new_hmac
+from tests import SearxTestCase
+
+
+def get_image(width, height, image_format='PNG'):
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestImageThumbnail(SearxTestCase):
+    def setUp(self):
+        self.setattr4test(image_thumbnail, '_ENABLED', True)
+
+    def test_get_size(self):
+        self.assertEqual(image_thumbnail.get_size('200'), 200)
+        self.assertIsNone(image_thumbnail.get_size('201'))
+        self.assertIsNone(image_thumbnail.get_size('-200'))
+        self.assertIsNone(image_thumbnail.get_size('2\u00b2'))
+        self.assertIsNone(image_thumbnail.get_size('large'))
+        self.assertIsNone(image_thumbnail.get_size(None))
+        self.setattr4test(image_thumbnail, '_ENABLED', False)
+        self.assertIsNone(image_thumbnail.get_size('200'))
+
+    def test_get_key(self):
+        key = image_thumbnail.get_key('a' * 64, 200)
+        self.assertNotEqual(key, 'a' * 64)
+        self.assertEqual(key, image_thumbnail.get_key('a' * 64, 200))
+        self.assertTrue(image_cache.KEY_RE.match(key))
+
+    def test_make_thumbnail(self):
+        data, content_type = make_thumbnail(get_image(800, 400), 200)
+        self.assertEqual(content_type, 'image/webp')
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (200, 100))
+
+        data, content_type = make_thumbnail(get_image(800, 400, 'JPEG'), 200, 'jpeg', 50)
+        self.assertEqual(content_type, 'image/jpeg')
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.size, (200, 100))
+
+    def test_make_thumbnail_original(self):
+        # not an image
+        self.assertIsNone(make_thumbnail(b'not an image', 200))
+        # the thumbnail is not smaller
+        self.assertIsNone(make_thumbnail(get_image(2, 2, 'GIF'), 200))
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestImageProxyThumbnail(SearxTestCase):
+    def setUp(self):
+        # skip init function (no external HTTP request)
+        def dummy(*args, **kwargs):
+            pass
+
+        self.setattr4test(searx.search.processors, 'initialize_processor', dummy)
+
+        from searx import webapp  # pylint: disable=import-outside-toplevel
+
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.setattr4test(image_cache, 'IMAGE_CACHE', ImageCache(self.directory.name, 10000000, 3600))
+        self.setattr4test(image_thumbnail, '_ENABLED', True)
+        self.app = webapp.app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_image_proxy(self):
+        from searx import settings  # pylint: disable=import-outside-toplevel
+
+        url = 'https://example.com/image.png'
+        key = new_hmac(settings['server']['secret_key'], url.encode())
+        data = get_image(800, 400)
+        resp = Mock(status_code=200, headers={'Content-Type': 'image/png'})
+        query_string = {'url': url, 'h': key, 'size': 200}
+
+        with patch('searx.webapp.http_stream', return_value=(resp, iter([data[:100], data[100:]]))) as http_stream:
+            response = self.app.get('/image_proxy', query_string=query_string)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'image/webp')
+            self.assertLess(len(response.data), len(data))
+            resp.close.assert_called_once()
+
+            # the thumbnail is cached, not the original image
+            response = self.app.get('/image_proxy', query_string=query_string)
+            self.assertEqual(response.mimetype, 'image/webp')
+            self.assertEqual(http_stream.call_count, 1)
+            self.assertIsNone(image_cache.IMAGE_CACHE.get(key))
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from searx.results import ResultContainer
+import random
+
+from searx.results import ResultContainer, group_results
 from tests import SearxTestCase
 
 
@@ -17,6 +19,85 @@ def fake_result(url='https://aa.bb/cc?dd=ee#ff', title='aaa', content='bbb', eng
     return result
 
 
+def group_results_quadratic(results):
+    """The grouping of ResultContainer.close before it was linear: the output of
+    group_results must be the same."""
+    gresults = []
+    categoryPositions = {}
+
+    for res in results:
+        category = (
+            res['category']
+            + ':'
+            + res.get('template', '')
+            + ':'
+            + ('img_src' if 'img_src' in res or 'thumbnail' in res else '')
+        )
+
+        current = None if category not in categoryPositions else categoryPositions[category]
+
+        if current is not None and (current['count'] > 0) and (len(gresults) - current['index'] < 20):
+            index = current['index']
+            gresults.insert(index, res)
+            for k in categoryPositions:  # pylint: disable=consider-using-dict-items
+                v = categoryPositions[k]['index']
+                if v >= index:
+                    categoryPositions[k]['index'] = v + 1
+            current['count'] -= 1
+        else:
+            gresults.append(res)
+            categoryPositions[category] = {'index': len(gresults), 'count': 8}
+
+    return gresults
+
+
+def random_results(rand, count):
+    categories = ['general', 'images', 'videos', 'news', 'it']
+    templates = ['default.html', 'images.html', 'videos.html', 'code.html']
+    results = []
+    for i in range(count):
+        result = fake_result(url='https://example.com/%i' % i, category=rand.choice(categories))
+        if rand.random() < 0.7:
+            result['template'] = rand.choice(templates)
+        if rand.random() < 0.2:
+            result['img_src'] = 'https://example.com/%i.png' % i
+        elif rand.random() < 0.1:
+            result['thumbnail'] = 'https://example.com/%i.png' % i
+        results.append(result)
+    return results
+
+
+class GroupResultsTestCase(SearxTestCase):  # pylint: disable=missing-class-docstring
+    def test_empty(self):
+        self.assertEqual(group_results([]), [])
+
+    def test_same_order(self):
+        rand = random.Random(0)
+        for _ in range(300):
+            # a small number of categories makes long groups, a large number of
+            # results makes groups too far from the current position
+            results = random_results(rand, rand.randint(1, 300))
+            self.assertEqual(
+                [r['url'] for r in group_results(results)],
+                [r['url'] for r in group_results_quadratic(results)],
+            )
+
+    def test_single_category(self):
+        results = [fake_result(url='https://example.com/%i' % i, category='general') for i in range(30)]
+        self.assertEqual(group_results(results), group_results_quadratic(results))
+
+    def test_group(self):
+        results = [
+            fake_result(url='https://example.com/1', category='general'),
+            fake_result(url='https://example.com/2', category='images', template='images.html'),
+            fake_result(url='https://example.com/3', category='general'),
+        ]
+        self.assertEqual(
+            [r['url'] for r in group_results(results)],
+            ['https://example.com/1', 'https://example.com/3', 'https://example.com/2'],
+        )
+
+
 #  TODO
 class ResultContainerTestCase(SearxTestCase):
     def test_empty(self):
@@ -39,3 +120,33 @@ class ResultContainerTestCase(SearxTestCase):
         c.extend('wikipedia', [fake_result()])
         c.extend('wikidata', [fake_result(), fake_result(url='https://example.com/')])
         self.assertEqual(c.results_length(), 2)
+
+    def test_result_merge_by_url(self):
+        c = ResultContainer()
+        c.extend('wikipedia', [fake_result(url='http://www.example.com/path/')])
+        c.extend('wikidata', [fake_result(url='https://example.com/path')])
+        c.extend('duckduckgo', [fake_result(url='https://example.com/pa%74h')])
+        self.assertEqual(c.results_length(), 1)
+        result = c._merged_results[0]  # pylint: disable=protected-access
+        self.assertEqual(result['url'], 'https://example.com/path')
+        self.assertEqual(result['positions'], [1, 1, 1])
+
+    def test_result_merge_images(self):
+        c = ResultContainer()
+        c.extend('wikipedia', [fake_result(template='images.html', img_src='https://example.com/a.png')])
+        c.extend('wikidata', [fake_result(template='images.html', img_src='https://example.com/b.png')])
+        c.extend('duckduckgo', [fake_result(template='images.html', img_src='https://example.com/a.png')])
+        self.assertEqual(c.results_length(), 2)
+
+    def test_on_extend(self):
+        extended = []
+        c = ResultContainer()
+        c.on_extend = lambda engine_name, results: extended.append((engine_name, results))
+        c.extend('wikipedia', [fake_result(), {'suggestion': 'aaa'}, {'number_of_results': 10}])
+        c.on_result = lambda result: False  # the plugins remove all the results
+        c.extend('wikidata', [fake_result()])
+        self.assertEqual(len(extended), 2)
+        self.assertEqual(extended[0][0], 'wikipedia')
+        self.assertEqual(len(extended[0][1]), 3)
+        self.assertEqual(extended[0][1][0]['url'], 'https://aa.bb/cc?dd=ee#ff')
+        self.assertEqual(extended[1], ('wikidata', []))
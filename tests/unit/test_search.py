@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import threading
+import time
 from copy import copy
 
+from mock import patch
+
+import searx.metrics
 import searx.search
+import searx.search.cache
 from searx.search import SearchQuery, EngineRef
+from searx.search.executor import SearchExecutor
+from searx.search.processors import PROCESSORS
+from searx.search.processors.abstract import CircuitBreaker
 from searx import settings
 from tests import SearxTestCase
 
@@ -11,6 +20,7 @@ from tests import SearxTestCase
 SAFESEARCH = 0
 PAGENO = 1
 PUBLIC_ENGINE_NAME = 'general dummy'
+SLOW_ENGINE_NAME = 'slow dummy'
 TEST_ENGINES = [
     {
         'name': PUBLIC_ENGINE_NAME,
@@ -20,6 +30,15 @@ TEST_ENGINES = [
         'timeout': 3.0,
         'tokens': [],
     },
+    {
+        'name': SLOW_ENGINE_NAME,
+        'engine': 'dummy',
+        'categories': 'general',
+        'shortcut': 'sd',
+        'timeout': 3.0,
+        'paging': True,
+        'tokens': [],
+    },
 ]
 
 
@@ -92,6 +111,201 @@ class SearchTestCase(SearxTestCase):
         search.search()
         self.assertEqual(search.actual_timeout, 10.0)
 
+    def test_adaptive_timeout(self):
+        settings['outgoing']['max_request_timeout'] = None
+        settings['outgoing']['adaptive_timeout']['enable'] = True
+        try:
+            search_query = SearchQuery(
+                'test', [EngineRef(PUBLIC_ENGINE_NAME, 'general')], 'en-US', SAFESEARCH, PAGENO, None, None
+            )
+            # not enough samples: timeout of the engine
+            search = searx.search.Search(search_query)
+            search.search()
+            self.assertEqual(search.actual_timeout, 3.0)
+
+            time_total = searx.metrics.histogram('engine', PUBLIC_ENGINE_NAME, 'time', 'total')
+            for _ in range(20):
+                time_total.observe(1.0)
+            search = searx.search.Search(search_query)
+            search.search()
+            # the percentile is the value of a log bucket: 2% relative error
+            self.assertAlmostEqual(search.actual_timeout, 1.5, delta=0.03)
+        finally:
+            settings['outgoing']['adaptive_timeout']['enable'] = False
+            searx.metrics.initialize([engine['name'] for engine in TEST_ENGINES])
+
+    def test_get_adaptive_timeout(self):
+        time_total = searx.metrics.histogram('engine', PUBLIC_ENGINE_NAME, 'time', 'total')
+        try:
+            for _ in range(30):
+                time_total.observe(0.1)
+            # at least min_timeout
+            self.assertEqual(searx.search.get_adaptive_timeout(PUBLIC_ENGINE_NAME, 3.0), 1.0)
+            for _ in range(600):
+                time_total.observe(2.5)
+            # at most the timeout of the engine
+            self.assertEqual(searx.search.get_adaptive_timeout(PUBLIC_ENGINE_NAME, 3.0), 3.0)
+        finally:
+            searx.metrics.initialize([engine['name'] for engine in TEST_ENGINES])
+
+    def test_quorum(self):
+        settings['outgoing']['max_request_timeout'] = None
+        settings['search']['quorum']['engines'] = 1
+        event = threading.Event()
+        drops = []
+
+        def slow_search(*args):
+            event.wait(5)
+            drops.append(getattr(threading.current_thread(), '_drop'))
+
+        try:
+            search_query = SearchQuery(
+                'test',
+                [EngineRef(PUBLIC_ENGINE_NAME, 'general'), EngineRef(SLOW_ENGINE_NAME, 'general')],
+                'en-US',
+                SAFESEARCH,
+                PAGENO,
+                None,
+                None,
+            )
+            results = [{'url': 'https://example.com/', 'title': 'example', 'content': ''}]
+            with patch.object(PROCESSORS[PUBLIC_ENGINE_NAME], '_search_basic', return_value=results), patch.object(
+                PROCESSORS[SLOW_ENGINE_NAME], 'search', new=slow_search
+            ):
+                search = searx.search.Search(search_query)
+                search.search()
+            # the search has not waited for the slow engine
+            self.assertEqual(drops, [])
+            self.assertEqual([timing.engine for timing in search.result_container.timings], [PUBLIC_ENGINE_NAME])
+            self.assertEqual(search.result_container.unresponsive_engines, set())
+            event.set()
+            for _ in range(50):
+                if drops:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(drops, [True])
+        finally:
+            event.set()
+            settings['search']['quorum']['engines'] = 0
+
+    def test_single_flight(self):
+        settings['search']['single_flight'] = True
+        calls = []
+
+        def slow_search_basic(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            return [{'url': 'https://example.com/', 'title': 'example', 'content': ''}]
+
+        def search():
+            search_query = SearchQuery(
+                'test', [EngineRef(PUBLIC_ENGINE_NAME, 'general')], 'en-US', SAFESEARCH, PAGENO, None, None
+            )
+            searches.append(searx.search.Search(search_query).search())
+
+        searches = []
+        try:
+            with patch.object(PROCESSORS[PUBLIC_ENGINE_NAME], '_search_basic', new=slow_search_basic):
+                threads = [threading.Thread(target=search) for _ in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            settings['search']['single_flight'] = False
+
+        # one request to the engine, the results are copied to each search
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(searches), 3)
+        for result_container in searches:
+            self.assertEqual(result_container.results_length(), 1)
+        self.assertIsNot(
+            searches[0]._merged_results[0], searches[1]._merged_results[0]  # pylint: disable=protected-access
+        )
+
+    def test_single_flight_engine_data(self):
+        settings['search']['single_flight'] = True
+        calls = []
+
+        def search_basic(*args):
+            calls.append(args)
+            return [{'url': 'https://example.com/', 'title': 'example', 'content': ''}]
+
+        def search(engine_data):
+            search_query = SearchQuery(
+                'test',
+                [EngineRef(PUBLIC_ENGINE_NAME, 'general')],
+                'en-US',
+                SAFESEARCH,
+                PAGENO,
+                None,
+                None,
+                engine_data=engine_data,
+            )
+            return searx.search.Search(search_query).search()
+
+        try:
+            with patch.object(PROCESSORS[PUBLIC_ENGINE_NAME], '_search_basic', new=search_basic):
+                result_container = search({PUBLIC_ENGINE_NAME: {'next_page_token': 'a', 'cursor': 'b'}})
+                search({PUBLIC_ENGINE_NAME: {'next_page_token': 'c'}})
+        finally:
+            settings['search']['single_flight'] = False
+
+        # the engine_data differ: each search sends its own request
+        self.assertEqual(result_container.results_length(), 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_prefetch(self):
+        settings['search']['prefetch_ttl'] = 30
+        searx.search.cache.RESPONSE_CACHE.clear()
+        pagenos = []
+
+        def search_basic(query, params):
+            pagenos.append(params['pageno'])
+            return [{'url': 'https://example.com/%i' % params['pageno'], 'title': 'example', 'content': ''}]
+
+        def search(pageno):
+            search_query = SearchQuery(
+                'test', [EngineRef(SLOW_ENGINE_NAME, 'general')], 'en-US', SAFESEARCH, pageno, None, None
+            )
+            return searx.search.Search(search_query).search()
+
+        hit = searx.metrics.counter('search', 'prefetch', 'hit')
+        successful = searx.metrics.counter('search', 'prefetch', 'successful')
+        engine_sent = searx.metrics.counter('engine', SLOW_ENGINE_NAME, 'search', 'count', 'sent')
+        engine_successful = searx.metrics.counter('engine', SLOW_ENGINE_NAME, 'search', 'count', 'successful')
+        try:
+            with patch.object(PROCESSORS[SLOW_ENGINE_NAME], '_search_basic', new=search_basic):
+                search(1)
+                # the request of page 2 is sent in the background
+                for _ in range(50):
+                    if searx.metrics.counter('search', 'prefetch', 'successful') == successful + 1:
+                        break
+                    time.sleep(0.01)
+                self.assertEqual(pagenos, [1, 2])
+                self.assertEqual(searx.metrics.counter('search', 'prefetch', 'successful'), successful + 1)
+                # the prefetch request is not counted in the metrics of the engine
+                self.assertEqual(
+                    searx.metrics.counter('engine', SLOW_ENGINE_NAME, 'search', 'count', 'sent'), engine_sent + 1
+                )
+                self.assertEqual(
+                    searx.metrics.counter('engine', SLOW_ENGINE_NAME, 'search', 'count', 'successful'),
+                    engine_successful + 1,
+                )
+                # page 2 is answered from the cache, page 3 is prefetched
+                results = search(2)._merged_results  # pylint: disable=protected-access
+                self.assertEqual(results[0]['url'], 'https://example.com/2')
+                self.assertEqual(searx.metrics.counter('search', 'prefetch', 'hit'), hit + 1)
+                # the prefetch of page 3 is over before the engine is restored
+                for _ in range(50):
+                    if searx.metrics.counter('search', 'prefetch', 'successful') == successful + 2:
+                        break
+                    time.sleep(0.01)
+                self.assertEqual(pagenos, [1, 2, 3])
+        finally:
+            settings['search']['prefetch_ttl'] = 0
+            searx.search.cache.RESPONSE_CACHE.clear()
+
     def test_external_bang(self):
         search_query = SearchQuery(
             'yes yes',
@@ -122,3 +336,121 @@ class SearchTestCase(SearxTestCase):
         results = search.search()
         # This should not redirect
         self.assertTrue(results.redirect_url is None)
+
+
+class SearchExecutorTestCase(SearxTestCase):
+    @classmethod
+    def setUpClass(cls):
+        searx.search.initialize(TEST_ENGINES)
+
+    def test_timeout(self):
+        executor = SearchExecutor(1)
+        event = threading.Event()
+        timeouts = []
+
+        def slow_search():
+            event.wait(5)
+            timeouts.append(getattr(threading.current_thread(), '_timeout'))
+
+        running = executor.submit('a', slow_search)
+        queued = executor.submit('b', slow_search)
+        self.assertEqual(executor.queue_depth, 1)
+
+        # the running task is flagged, the queued task is cancelled
+        running.set_timeout()
+        queued.set_timeout()
+        self.assertTrue(queued.future.cancelled())
+        event.set()
+        running.future.result(5)
+        self.assertEqual(timeouts, [True])
+        self.assertEqual(executor.queue_depth, 0)
+        self.assertEqual(executor.running, 0)
+        executor.shutdown()
+
+    def test_release(self):
+        executor = SearchExecutor(1)
+        started = threading.Event()
+        event = threading.Event()
+        releases = []
+
+        def slow_search():
+            started.set()
+            event.wait(5)
+
+        running = executor.submit('a', slow_search, release=lambda: releases.append('a'))
+        queued = executor.submit('b', slow_search, release=lambda: releases.append('b'))
+        started.wait(5)
+
+        # the queued task is not run: its probe is released
+        queued.drop()
+        running.drop()
+        event.set()
+        running.future.result(5)
+        self.assertEqual(releases, ['b'])
+        executor.shutdown()
+
+
+class CircuitBreakerTestCase(SearxTestCase):
+    @classmethod
+    def setUpClass(cls):
+        searx.search.initialize(TEST_ENGINES)
+
+    def test_circuit_breaker(self):
+        circuit_breaker = CircuitBreaker()
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.record_failure(0.05, 'timeout')
+        self.assertEqual(circuit_breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(circuit_breaker.allow_request())
+
+        # half-open: a single probe
+        time.sleep(0.06)
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertEqual(circuit_breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(circuit_breaker.allow_request())
+
+        # the probe fails: open again
+        circuit_breaker.record_failure(0.05, 'timeout')
+        self.assertFalse(circuit_breaker.allow_request())
+        self.assertEqual(circuit_breaker.continuous_errors, 2)
+
+        # the probe is released without outcome: an other request probes
+        time.sleep(0.06)
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.release()
+        self.assertTrue(circuit_breaker.allow_request())
+
+        # the probe succeeds: closed
+        circuit_breaker.record_success()
+        self.assertTrue(circuit_breaker.is_closed)
+        self.assertEqual(circuit_breaker.continuous_errors, 0)
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertTrue(circuit_breaker.allow_request())
+
+    def test_network(self):
+        engine = searx.engines.engines[SLOW_ENGINE_NAME]
+        circuit_breaker = PROCESSORS[PUBLIC_ENGINE_NAME].circuit_breaker
+        # the engines of a network share the circuit breaker
+        with patch.object(engine, 'network', PUBLIC_ENGINE_NAME, create=True):
+            processor = searx.search.processors.get_processor(engine, SLOW_ENGINE_NAME)
+        self.assertIs(processor.circuit_breaker, circuit_breaker)
+        # the circuit breakers are reset by the initialization
+        circuit_breaker.record_failure(60, 'timeout')
+        searx.search.initialize(TEST_ENGINES)
+        self.assertIsNot(PROCESSORS[PUBLIC_ENGINE_NAME].circuit_breaker, circuit_breaker)
+        self.assertTrue(PROCESSORS[PUBLIC_ENGINE_NAME].circuit_breaker.is_closed)
+
+    def test_probe(self):
+        circuit_breaker = PROCESSORS[PUBLIC_ENGINE_NAME].circuit_breaker
+        self.assertIsNot(circuit_breaker, PROCESSORS[SLOW_ENGINE_NAME].circuit_breaker)
+        circuit_breaker.record_failure(0, 'timeout')
+        search_query = SearchQuery('test', [EngineRef(PUBLIC_ENGINE_NAME, 'general')], 'en-US', SAFESEARCH, PAGENO)
+        result_container = searx.search.Search(search_query).search()
+        # the search has probed the engine
+        self.assertEqual(result_container.unresponsive_engines, set())
+        self.assertTrue(circuit_breaker.is_closed)
+
+        circuit_breaker.record_failure(60, 'timeout')
+        result_container = searx.search.Search(search_query).search()
+        self.assertEqual(len(result_container.unresponsive_engines), 1)
+        self.assertTrue(list(result_container.unresponsive_engines)[0].suspended)
+        circuit_breaker.record_success()
@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from mock import patch
+
+from searx.search.cache import ResponseCache, get_cache_key
+from tests import SearxTestCase
+
+
+class TestResponseCache(SearxTestCase):
+    def test_get_set(self):
+        cache = ResponseCache()
+        key = ('engine', 'query')
+        self.assertIsNone(cache.get(key))
+        cache.set(key, [{'url': 'https://example.com'}], 60)
+        results = cache.get(key)
+        self.assertEqual(results, [{'url': 'https://example.com'}])
+
+        # the cached results are copies
+        results[0]['engine'] = 'engine'
+        self.assertEqual(cache.get(key), [{'url': 'https://example.com'}])
+
+    def test_ttl(self):
+        cache = ResponseCache()
+        cache.set(('a',), [], 0)
+        self.assertIsNone(cache.get(('a',)))
+        with patch('searx.search.cache.default_timer', return_value=0):
+            cache.set(('b',), [{'title': 'b'}], 10)
+        with patch('searx.search.cache.default_timer', return_value=11):
+            self.assertIsNone(cache.get(('b',)))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        cache = ResponseCache(maxsize=2)
+        cache.set(('a',), [], 60)
+        cache.set(('b',), [], 60)
+        cache.get(('a',))
+        cache.set(('c',), [], 60)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(('a',)))
+        self.assertIsNone(cache.get(('b',)))
+
+    def test_cache_key(self):
+        params = {'category': 'general', 'pageno': 1, 'safesearch': 0, 'time_range': None, 'engine_data': {}}
+        key = get_cache_key('engine', 'query', params)
+        params['headers'] = {'User-Agent': 'random'}
+        self.assertEqual(key, get_cache_key('engine', 'query', params))
+        params['pageno'] = 2
+        self.assertNotEqual(key, get_cache_key('engine', 'query', params))
@@ -0,0 +1,103 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+import os
+import tempfile
+import threading
+
+from mock import patch
+
+from searx import tracing
+from tests import SearxTestCase
+
+
+class TestTracing(SearxTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'traces')
+
+    def tearDown(self):
+        tracing.end_trace()
+        self.directory.cleanup()
+
+    def test_no_trace(self):
+        self.assertIs(tracing.start_trace('request'), tracing.NOOP_SPAN)
+        with tracing.span('search') as span:
+            self.assertIs(span, tracing.NOOP_SPAN)
+        self.assertIsNone(tracing.end_trace())
+
+    @patch('searx.tracing.SERVER_TIMING', True)
+    def test_spans(self):
+        root = tracing.start_trace('request', endpoint='search')
+        with tracing.span('search') as search_span:
+            parent = tracing.get_current_span()
+
+            def run():
+                with tracing.activate(parent):
+                    with tracing.span('engine', engine='a'):
+                        tracing.add_span('network.loop_wait', 1.0, 1.5)
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+            self.assertIs(tracing.get_current_span(), search_span)
+        with self.assertRaises(ValueError):
+            with tracing.span('render'):
+                raise ValueError()
+        self.assertIs(tracing.get_current_span(), root)
+
+        trace = tracing.end_trace()
+        self.assertFalse(trace.sampled)
+        spans = {span.name: span for span in trace.spans}
+        self.assertIsNone(spans['request'].parent_id)
+        self.assertEqual(spans['search'].parent_id, root.span_id)
+        self.assertIs(spans['search'], search_span)
+        self.assertEqual(spans['engine'].parent_id, spans['search'].span_id)
+        self.assertEqual(spans['network.loop_wait'].parent_id, spans['engine'].span_id)
+        self.assertEqual(spans['render'].attributes, {'error': 'ValueError'})
+        server_timing = tracing.get_server_timing(trace)
+        self.assertEqual(
+            [entry.split(';')[0] for entry in server_timing], ['search', 'engine', 'network.loop_wait', 'render']
+        )
+        self.assertIn('network.loop_wait;dur=500.0;desc="1"', server_timing)
+
+    def test_jsonl(self):
+        with patch('searx.tracing.EXPORTER', tracing.JsonLinesExporter(self.path)), patch(
+            'searx.tracing.SAMPLE_RATE', 1.0
+        ):
+            tracing.start_trace('request')
+            with tracing.span('search', engine='a'):
+                pass
+            trace = tracing.end_trace()
+        self.assertTrue(trace.sampled)
+        with open(self.path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line['name'] for line in lines], ['request', 'search'])
+        self.assertEqual(lines[1]['parent_id'], lines[0]['span_id'])
+        self.assertEqual(lines[1]['trace_id'], trace.trace_id)
+        self.assertEqual(lines[1]['attributes'], {'engine': 'a'})
+
+    def test_otlp(self):
+        with patch('searx.tracing.EXPORTER', tracing.OtlpFileExporter(self.path)), patch(
+            'searx.tracing.SAMPLE_RATE', 1.0
+        ):
+            tracing.start_trace('request', status=200)
+            with tracing.span('search'):
+                pass
+            tracing.end_trace()
+        with open(self.path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 1)
+        spans = lines[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual([span['name'] for span in spans], ['request', 'search'])
+        self.assertEqual(spans[0]['attributes'], [{'key': 'status', 'value': {'intValue': '200'}}])
+        self.assertEqual(spans[1]['parentSpanId'], spans[0]['spanId'])
+        self.assertLessEqual(int(spans[0]['startTimeUnixNano']), int(spans[1]['startTimeUnixNano']))
+
+    def test_not_sampled(self):
+        with patch('searx.tracing.EXPORTER', tracing.JsonLinesExporter(self.path)), patch(
+            'searx.tracing.SAMPLE_RATE', 0.0
+        ):
+            self.assertIs(tracing.start_trace('request'), tracing.NOOP_SPAN)
+            self.assertIsNone(tracing.end_trace())
+        self.assertFalse(os.path.exists(self.path))
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
 import json
 from urllib.parse import ParseResult
-from mock import Mock
+from mock import Mock, patch
 from searx.results import Timing
 
 import searx.search.processors
@@ -112,6 +113,15 @@ class ViewsTestCase(SearxTestCase):
         self.assertEqual(result.status_code, 200)
         self.assertIn(b'<div class="title"><h1>SearXNG</h1></div>', result.data)
 
+    @patch('searx.tracing.SERVER_TIMING', True)
+    def test_server_timing(self):
+        result = self.app.post('/search', data={'q': 'test'})
+        self.assertEqual(result.status_code, 200)
+        server_timing = result.headers['Server-Timing']
+        self.assertIn('total_0_startpage;dur=', server_timing)
+        self.assertIn('render.template;dur=', server_timing)
+        self.assertIn(';desc="1"', server_timing)
+
     def test_search_empty_json(self):
         result = self.app.post('/search', data={'q': '', 'format': 'json'})
         self.assertEqual(result.status_code, 400)
@@ -149,6 +159,24 @@ class ViewsTestCase(SearxTestCase):
         self.assertEqual(result_dict['results'][0]['content'], 'first test content')
         self.assertEqual(result_dict['results'][0]['url'], 'http://first.test.xyz')
 
+    def test_search_ndjson(self):
+        import searx.metrics  # pylint: disable=import-outside-toplevel
+
+        count = searx.metrics.histogram('endpoint', 'search', 'time', 'total').count
+        result = self.app.post('/search', data={'q': 'test', 'format': 'ndjson'})
+        self.assertEqual(result.mimetype, 'application/x-ndjson')
+        # the time is recorded at the end of the stream, not in the headers
+        self.assertNotIn('Server-Timing', result.headers)
+
+        # the search is mocked: no engine frame, only the final frame
+        frames = [json.loads(line) for line in result.data.decode().splitlines()]
+        self.assertEqual(len(frames), 1)
+        self.assertEqual('test', frames[0]['query'])
+        self.assertEqual(len(frames[0]['results']), 2)
+        self.assertEqual(frames[0]['results'][0]['url'], 'http://first.test.xyz')
+        # the stream has been read
+        self.assertEqual(searx.metrics.histogram('endpoint', 'search', 'time', 'total').count, count + 1)
+
     def test_index_csv(self):
         result = self.app.post('/', data={'q': 'test', 'format': 'csv'})
         self.assertEqual(result.status_code, 308)
@@ -236,6 +264,57 @@ class ViewsTestCase(SearxTestCase):
         self.assertEqual(result.status_code, 200)
         self.assertIn(b'<h1>Engine stats</h1>', result.data)
 
+        result = self.app.get('/stats?window=15m')
+        self.assertEqual(result.status_code, 200)
+        self.assertIn(b'<strong>15m</strong>', result.data)
+        self.assertIn(b'window=1h', result.data)
+
+    def test_open_metrics(self):
+        from searx import settings  # pylint: disable=import-outside-toplevel
+
+        result = self.app.get('/metrics')
+        self.assertEqual(result.status_code, 404)
+
+        with patch.dict(settings['general'], {'metrics_token': 'token'}):
+            result = self.app.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(result.status_code, 401)
+
+            self.app.post('/search', data={'q': 'test'})
+            result = self.app.get('/metrics', headers={'Authorization': 'Bearer token'})
+            self.assertEqual(result.status_code, 200)
+            self.assertTrue(result.headers['Content-Type'].startswith('application/openmetrics-text'))
+            self.assertIn(b'searxng_endpoint_time_total_seconds_count{endpoint="search"}', result.data)
+            self.assertIn(b'searxng_engine_search_count_sent_total{engine="', result.data)
+            self.assertIn(b'searxng_network_', result.data)
+            self.assertTrue(result.data.endswith(b'# EOF\n'))
+
+            # the network loop doesn't answer: the networks are missing
+            with patch('searx.metrics.get_network_stats', side_effect=concurrent.futures.TimeoutError):
+                result = self.app.get('/metrics', headers={'Authorization': 'Bearer token'})
+            self.assertEqual(result.status_code, 200)
+            self.assertIn(b'searxng_engine_search_count_sent_total{engine="', result.data)
+            self.assertNotIn(b'searxng_network_', result.data)
+            self.assertTrue(result.data.endswith(b'# EOF\n'))
+
+    def test_stats_network(self):
+        from searx import settings  # pylint: disable=import-outside-toplevel
+
+        result = self.app.get('/stats/network')
+        self.assertEqual(result.status_code, 404)
+
+        with patch.dict(settings['general'], {'metrics_token': 'token'}):
+            result = self.app.get('/stats/network')
+            self.assertEqual(result.status_code, 401)
+
+            result = self.app.get('/stats/network', headers={'Authorization': 'Bearer token'})
+            self.assertEqual(result.status_code, 200)
+            self.assertIn('__DEFAULT__', json.loads(result.data))
+
+            # the network loop doesn't answer
+            with patch('searx.webapp.get_network_stats', side_effect=concurrent.futures.TimeoutError):
+                result = self.app.get('/stats/network', headers={'Authorization': 'Bearer token'})
+            self.assertEqual(result.status_code, 503)
+
     def test_robots_txt(self):
         result = self.app.get('/robots.txt')
         self.assertEqual(result.status_code, 200)